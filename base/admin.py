@@ -2,8 +2,10 @@ from django.contrib import admin
 
 # Register your models here.
 
-from .models import Room, Topic, Message
+from .models import Room, Topic, Message, DeletionJob
 
 admin.site.register(Room)
 admin.site.register(Topic)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(DeletionJob)
+
@@ -0,0 +1,36 @@
+"""
+Native async read endpoints with the same response contract as the DRF views.
+
+DRF views are sync only, so the hot history and profile reads are plain
+async Django views instead. ``async_api_view`` gives them what ``@api_view``
+would: the view returns data and it is rendered by the API's JSON renderer,
+404s and wrong methods get DRF's JSON error bodies, and errors are never
+HTML pages. They are public GET endpoints (DRF's IsAuthenticatedOrReadOnly
+lets every GET through), so there is nothing to authenticate.
+"""
+
+from functools import wraps
+
+from django.http import Http404, HttpResponse
+
+from .renderers import FastJSONRenderer
+
+ALLOWED_METHODS = ("GET", "HEAD")
+
+
+def json_response(data, status=200, **kwargs):
+    return HttpResponse(FastJSONRenderer().render(data), status=status,
+                        content_type="application/json", **kwargs)
+
+
+def async_api_view(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ALLOWED_METHODS:
+            return json_response({"detail": f'Method "{request.method}" not allowed.'},
+                                 status=405, headers={"Allow": ", ".join(ALLOWED_METHODS)})
+        try:
+            return json_response(await view(request, *args, **kwargs))
+        except Http404:
+            return json_response({"detail": "Not found."}, status=404)
+    return wrapper
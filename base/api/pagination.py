@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+
+
+class NewestFirstCursorPagination(CursorPagination):
+    """
+    Opaque ?cursor= paging on the primary key, newest first. Each page is
+    one indexed range query, with no COUNT or OFFSET, however deep it goes.
+    """
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 100
+    ordering = "-id"
+
+    def page_for_template(self, request, queryset, api_url):
+        """
+        First page for a server-rendered view, plus the link the page's
+        "load more" should fetch. The link points at the JSON endpoint api_url.
+        """
+        page = self.paginate_queryset(queryset, Request(request))
+        self.base_url = request.build_absolute_uri(api_url)
+        return page, self.get_next_link()
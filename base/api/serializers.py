@@ -1,5 +1,5 @@
 # Classes takes in data/models we want to seralise and turn into JSON formatted data
-from rest_framework.serializers import ModelSerializer, ImageField, ValidationError, CharField, SerializerMethodField
+from rest_framework.serializers import ModelSerializer, ImageField, ValidationError, CharField, IntegerField, SerializerMethodField
 from django.contrib.auth import get_user_model
 from base.models import Room, Message, Topic, Profile
 
@@ -42,8 +42,7 @@ class UserSerializer(ModelSerializer):
         else:
             user.set_unusable_password()
 
-        user.save()
-        Profile.objects.get_or_create(user=user)
+        user.save()  # the post_save signal creates the profile
         return user
 
     def update(self, instance, validated_data):
@@ -67,6 +66,22 @@ class MessageSerializer(ModelSerializer):
         fields = ['id', 'username', 'room_name', 'body', 'updated', 'created']
         read_only_fields = ['id', 'username', 'room_name', 'updated', 'created']
 
+# compact, read-only shapes for the profile page's "load more" lists
+class RoomCardSerializer(ModelSerializer):
+    host_username = CharField(source='host.username', read_only=True, default=None)
+    topic_name = CharField(source='topic.name', read_only=True, default=None)
+    participant_count = IntegerField(read_only=True)  # annotated by the view
+
+    class Meta:
+        model = Room
+        fields = ['id', 'name', 'host', 'host_username', 'topic_name', 'participant_count', 'created']
+        read_only_fields = fields
+
+class UserMessageSerializer(MessageSerializer):
+    class Meta(MessageSerializer.Meta):
+        fields = ['id', 'room', 'room_name', 'body', 'created']
+        read_only_fields = fields
+
 class TopicSerializer(ModelSerializer):
     class Meta:
         model = Topic
@@ -1,16 +1,29 @@
 from django.urls import path
 
-from .views import room_views, topic_views, user_views, message_views, profile_views
+from .views import room_views, topic_views, user_views, message_views, profile_views, import_views, unread_views, deletion_views
 
 urlpatterns = [
     path('rooms/', room_views.rooms, name='rooms'),
+    path('rooms/presence', room_views.rooms_presence, name='rooms-presence'),
     path('rooms/<int:pk>/', room_views.room_detail, name='room-detail'),
     path("rooms/<int:pk>/messages", room_views.room_messages, name="room-messages"),
+    path("rooms/<int:pk>/read", unread_views.mark_room_read, name="room-read"),
+    path("rooms/<int:pk>/changes", room_views.room_changes, name="room-changes"),
+    path("rooms/<int:pk>/activity", room_views.room_activity, name="room-activity"),
     path('users/', user_views.users, name='api-users'),
     path('users/<int:pk>/', user_views.user_detail, name='api-user'), 
+    path('users/<int:pk>/rooms', user_views.user_rooms, name='api-user-rooms'),
+    path('users/<int:pk>/messages', user_views.user_messages, name='api-user-messages'),
     path('messages/<int:pk>/', message_views.message_detail, name='api-message'),
     path('topics/<int:pk>/', topic_views.topic_detail, name="topic-detail"),
     path('topics/', topic_views.topic_create, name="topic-create"),
+    path('topics/suggest', topic_views.topic_suggest, name="topic-suggest"),
+    path('topics/trending', topic_views.topic_trending, name="topic-trending"),
     path("profiles/me/", profile_views.me_profile, name="me-profile"),
+    path("me/unread", unread_views.my_unread, name="me-unread"),
     path("profiles/<int:user_id>/", profile_views.public_profile, name="public-profile"),
+    path("import/users", import_views.import_users, name="import-users"),
+    path("import/topics", import_views.import_topics, name="import-topics"),
+    path("import/rooms", import_views.import_rooms, name="import-rooms"),
+    path("deletions/<int:pk>", deletion_views.deletion_detail, name="deletion-detail"),
 ]
\ No newline at end of file
@@ -0,0 +1,16 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from django.shortcuts import get_object_or_404
+from base.models import DeletionJob
+from base.deletion import progress
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def deletion_detail(request, pk):
+    """Progress of a background room/user deletion."""
+    job = get_object_or_404(DeletionJob, pk=pk)
+    if not (request.user.is_superuser or job.requested_by_id == request.user.id):
+        return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(progress(job))
@@ -0,0 +1,45 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from base import bulk_import
+
+
+def _import(request, importer, *args):
+    """Shared plumbing: staff only, JSON array or NDJSON body, per-row results."""
+    if not request.user.is_superuser:
+        return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        # the stream, not request.body, which stops at DATA_UPLOAD_MAX_MEMORY_SIZE
+        rows = bulk_import.read_rows(request.stream, request.content_type or "")
+    except bulk_import.BadPayload as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = importer(rows, *args)
+    failed = sum(1 for r in results if r["status"] == "error")
+    return Response({
+        "total": len(results),
+        "failed": failed,
+        "results": results,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_users(request):
+    """Bulk create users (staff only)"""
+    return _import(request, bulk_import.import_users)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_topics(request):
+    """Bulk create topics, existing names are reported not duplicated (staff only)"""
+    return _import(request, bulk_import.import_topics)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_rooms(request):
+    """Bulk create rooms; host defaults to the importing user (staff only)"""
+    return _import(request, bulk_import.import_rooms, request.user)
@@ -1,24 +1,30 @@
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404
 from base.models import Profile, User
+from ..async_views import async_api_view
 from ..serializers import ProfileSerializer
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticatedOrReadOnly])
-def public_profile(request, user_id):
-    user = get_object_or_404(User, pk=user_id)
-    serializer = ProfileSerializer(user.profile, context={"request": request})
-    return Response(serializer.data)
+@async_api_view
+async def public_profile(request, user_id):
+    # async ORM lookup; serializing the profile itself never touches the DB
+    try:
+        profile = await Profile.objects.aget(user_id=user_id)
+    except Profile.DoesNotExist:
+        # a user without a profile row yet: show the defaults, a GET never writes
+        user = await aget_object_or_404(User, pk=user_id)
+        profile = Profile(user=user)
+    serializer = ProfileSerializer(profile, context={"request": request})
+    return serializer.data
 
 @api_view(["GET", "PUT", "PATCH"])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def me_profile(request):
-    profile = get_object_or_404(Profile, user=request.user)
+    profile = Profile.objects.for_user(request.user)
 
     if request.method == "GET":
         return Response(ProfileSerializer(profile, context={"request": request}).data)
@@ -3,8 +3,23 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from ..async_views import async_api_view
 from ..serializers import RoomSerializer
-from base.models import Room, Message
+from base.models import Room
+from base.archive import room_history
+from base.presence import online_counts
+from base.deletion import queue_room_deletion, progress
+from base.changes import changes_since, latest_cursor
+from base.models import ActivityRollup
+from base.rollups import series
+from base.topic_index import topic_index
+
+# buckets one activity call may return
+ACTIVITY_MAX_SPAN = {ActivityRollup.HOUR: 24 * 14, ActivityRollup.DAY: 365}
+
+# ids accepted by one rooms/presence call
+PRESENCE_MAX_IDS = 200
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
@@ -35,23 +50,28 @@ def room_detail(request, pk):
         partial = (request.method == 'PATCH')
         serializer = RoomSerializer(room, data=request.data, partial=partial)
         if serializer.is_valid():
+            old_topic_id = room.topic_id
             serializer.save()
+            topic_index.move(old_topic_id, room.topic_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # DELETE
-    room.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
+    # DELETE: hidden at once, dependents removed in the background
+    job = queue_room_deletion(room, requested_by=request.user)
+    return Response(progress(job), status=status.HTTP_202_ACCEPTED,
+                    headers={"Location": reverse("deletion-detail", args=[job.id])})
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticatedOrReadOnly])
-def room_messages(request, pk):
+@async_api_view
+async def room_messages(request, pk):
     """
     Paginated messages for a room.
     Query params:
       - offset (int, default 0)
       - limit  (int, default 10)
     Returns newest-first.
+
+    Native async view: runs on the event loop with the async ORM instead of
+    taking a thread from the pool shared with RoomConsumer's DB helpers.
     """
     try:
         offset = int(request.GET.get("offset", 0))
@@ -60,30 +80,65 @@ def room_messages(request, pk):
     except ValueError:
         offset, limit = 0, 10
 
-    qs = (Message.objects
-          .filter(room_id=pk)
-          .select_related("user__profile")
-          .order_by("-created"))
-
-    total = qs.count()
-    items = list(qs[offset:offset+limit])
-
-    data = []
-    for m in items:
-        img = getattr(getattr(m.user, "profile", None), "profile_img", None)
-        data.append({
-            "id": m.id,
-            "user": m.user_id,
-            "username": m.user.username,
-            "body": m.body,
-            "created": m.created.isoformat(),
-            "profile_img": (img.url if img else None),
-        })
+    data, total = await room_history(pk, offset, limit)
 
-    return Response({
+    return {
         "messages": data,
         "total": total,
         "offset": offset,
         "limit": limit,
-        "has_more": (offset + len(items) < total),
-    })
\ No newline at end of file
+        "has_more": (offset + len(data) < total),
+    }
+
+
+@api_view(['GET'])
+def rooms_presence(request):
+    """Online counts for many rooms: /api/rooms/presence?ids=1,2,3"""
+    try:
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        return Response({"detail": "ids must be comma-separated integers."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > PRESENCE_MAX_IDS:
+        return Response({"detail": f"At most {PRESENCE_MAX_IDS} ids."}, status=status.HTTP_400_BAD_REQUEST)
+    counts = online_counts(ids)
+    return Response({"rooms": [{"room": i, "online": counts[i]} for i in counts]})
+
+
+@api_view(['GET'])
+def room_changes(request, pk):
+    """
+    Delta sync: /api/rooms/<pk>/changes?since=<cursor>&limit=
+    Returns created/updated messages, tombstones for deleted ones and room
+    metadata edits after the cursor. Without since, returns only the current
+    cursor to start from after a full history load.
+    """
+    room = get_object_or_404(Room.objects.select_related("topic"), pk=pk)
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 200)), 500))  # guardrails
+        since = request.GET.get("since")
+        since = None if since in (None, "") else max(0, int(since))
+    except ValueError:
+        return Response({"detail": "since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if since is None:
+        return Response({"changes": [], "cursor": latest_cursor(room.id), "has_more": False})
+    changes, cursor, has_more = changes_since(room, since, limit)
+    return Response({"changes": changes, "cursor": cursor, "has_more": has_more})
+
+
+@api_view(['GET'])
+def room_activity(request, pk):
+    """Messages per hour/day for a sparkline: /api/rooms/<pk>/activity?granularity=day&span=30"""
+    room = get_object_or_404(Room.objects.only("id"), pk=pk)
+    granularity = request.GET.get("granularity", ActivityRollup.DAY)
+    if granularity not in ACTIVITY_MAX_SPAN:
+        return Response({"detail": "granularity must be hour or day."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        span = max(1, min(int(request.GET.get("span", 30)), ACTIVITY_MAX_SPAN[granularity]))
+    except ValueError:
+        return Response({"detail": "span must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "room": room.id,
+        "granularity": granularity,
+        "series": series(ActivityRollup.ROOM, room.id, granularity, span),
+    })
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from base.models import Topic
+from base.topic_index import topic_index
+from base.rollups import trending_topics
 from ..serializers import TopicSerializer
 
 @api_view(['GET'])
@@ -25,4 +27,25 @@ def topic_create(request):
     if serializer.is_valid():
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+def topic_suggest(request):
+    """Autocomplete topics by name prefix, most used first"""
+    prefix = request.GET.get("prefix", "")
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 10)), 50))
+    except ValueError:
+        limit = 10
+    return Response({"prefix": prefix, "results": topic_index.suggest(prefix, limit)})
+
+
+@api_view(['GET'])
+def topic_trending(request):
+    """Topics whose activity rose most: /api/topics/trending?hours=24&limit=10"""
+    try:
+        hours = max(1, min(int(request.GET.get("hours", 24)), 24 * 7))
+        limit = max(1, min(int(request.GET.get("limit", 10)), 50))
+    except ValueError:
+        return Response({"detail": "hours and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"hours": hours, "topics": trending_topics(hours, limit)})
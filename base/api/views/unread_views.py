@@ -0,0 +1,31 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from base.models import Room
+from base.redis_client import sync_redis
+from base.unread import mark_read, unread_counts
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_room_read(request, pk):
+    """Mark everything posted in the room so far as read."""
+    room = get_object_or_404(Room.objects.only("id"), pk=pk)
+    seq = mark_read(sync_redis(), request.user.id, room.id)
+    return Response({"room": room.id, "seq": seq})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def my_unread(request):
+    """Unread counts for every room the user hosts or has posted in."""
+    room_ids = (
+        Room.objects.filter(Q(participants=request.user) | Q(host=request.user))
+        .values_list("id", flat=True).distinct()
+    )
+    counts = unread_counts(sync_redis(), request.user.id, room_ids)
+    return Response({
+        "rooms": [{"room": room_id, "unread": n} for room_id, n in counts.items()],
+        "total": sum(counts.values()),
+    })
@@ -4,7 +4,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from ..serializers import UserSerializer
+from django.db.models import Count
+from django.urls import reverse
+from base.deletion import queue_user_deletion, progress
+from base.models import Room, Message
+from ..pagination import NewestFirstCursorPagination
+from ..serializers import UserSerializer, RoomCardSerializer, UserMessageSerializer
 
 User = get_user_model()
 
@@ -26,7 +31,7 @@ def users(request):
 @api_view(['GET', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def user_detail(request, pk):
-    user = get_object_or_404(User, pk=pk)
+    user = get_object_or_404(User, pk=pk, is_active=True)
 
     # Only the user themselves (or staff) can modify/delete
     if request.method in ['PATCH', 'DELETE'] and not (request.user.is_superuser or request.user == user):
@@ -42,6 +47,30 @@ def user_detail(request, pk):
             return Response(ser.data)
         return Response(ser.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # DELETE
-    user.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    # DELETE: deactivated at once, dependents removed in the background
+    job = queue_user_deletion(user, requested_by=request.user)
+    return Response(progress(job), status=status.HTTP_202_ACCEPTED,
+                    headers={"Location": reverse("deletion-detail", args=[job.id])})
+
+def _paginated(request, qs, serializer_class):
+    paginator = NewestFirstCursorPagination()
+    page = paginator.paginate_queryset(qs, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+@api_view(['GET'])
+def user_rooms(request, pk):
+    """Rooms hosted by the user, newest first: ?cursor=&limit="""
+    user = get_object_or_404(User.objects.only("id"), pk=pk)
+    qs = (
+        Room.objects.filter(host=user)
+        .select_related("host", "topic")
+        .annotate(participant_count=Count("participants"))
+    )
+    return _paginated(request, qs, RoomCardSerializer)
+
+@api_view(['GET'])
+def user_messages(request, pk):
+    """Messages posted by the user, newest first: ?cursor=&limit="""
+    user = get_object_or_404(User.objects.only("id"), pk=pk)
+    qs = Message.objects.in_live_rooms().filter(user=user).select_related("room")
+    return _paginated(request, qs, UserMessageSerializer)
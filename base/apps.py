@@ -7,3 +7,6 @@ class BaseConfig(AppConfig):
 
     def ready(self):
         import base.signals 
+        from django.db.backends.signals import connection_created
+        from .metrics import install_db_wrapper
+        connection_created.connect(install_db_wrapper)
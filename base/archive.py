@@ -0,0 +1,157 @@
+"""
+Cold archival of old messages and read-through history.
+
+``manage.py archive_messages`` moves messages older than
+``MESSAGE_ARCHIVE_AFTER_DAYS`` out of ``base_message`` into compressed
+``MessageArchive`` chunks. ``room_history`` serves the paginated history
+endpoints from the live table first and then from the archive, so clients
+page through a room's full history without knowing where each message is
+stored. ``find_archived`` / ``delete_archived`` let an author delete a
+message that has already been archived, and ``drop_author`` removes a
+deleted user's rows from every chunk they wrote in.
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Sum
+from django.shortcuts import aget_object_or_404
+
+from .changes import record, record_message_deletions
+from .models import Message, MessageArchive, Profile, Room, RoomChange
+
+
+def pack(messages):
+    """Messages (newest first) -> compressed chunk payload."""
+    rows = [{
+        "id": m.id,
+        "user": m.user_id,
+        "username": m.user.username,
+        "body": m.body,
+        "created": m.created.isoformat(),
+        "updated": m.updated.isoformat(),
+    } for m in messages]
+    return _compress(rows)
+
+
+def _compress(rows):
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 6)
+
+
+def unpack(payload):
+    return json.loads(zlib.decompress(bytes(payload)))
+
+
+def find_archived(message_id):
+    """(chunk, row) holding an archived message, or (None, None)."""
+    for chunk in MessageArchive.objects.filter(min_id__lte=message_id, max_id__gte=message_id):
+        for row in unpack(chunk.payload):
+            if row["id"] == message_id:
+                return chunk, row
+    return None, None
+
+
+def delete_archived(chunk, message_id):
+    """Rewrite the chunk without one message, or drop it if that was the last one."""
+    with transaction.atomic():
+        chunk = MessageArchive.objects.select_for_update().get(pk=chunk.pk)
+        rows = [row for row in unpack(chunk.payload) if row["id"] != message_id]
+        if len(rows) < chunk.count:
+            record(chunk.room_id, RoomChange.MESSAGE_DELETED, message_id)
+        _rewrite(chunk, rows)
+
+
+def drop_author(chunks, user_id):
+    """Rewrite locked chunks without one user's messages, logging their deletion."""
+    for chunk in chunks:
+        rows = unpack(chunk.payload)
+        kept = [row for row in rows if row["user"] != user_id]
+        record_message_deletions((row["id"], chunk.room_id) for row in rows if row["user"] == user_id)
+        _rewrite(chunk, kept)
+
+
+def _rewrite(chunk, rows):
+    """Save a locked chunk with the rows (newest first) it keeps."""
+    if not rows:
+        chunk.delete()
+        return
+    ids = [row["id"] for row in rows]
+    chunk.payload = _compress(rows)
+    chunk.count = len(rows)
+    chunk.start = datetime.fromisoformat(rows[-1]["created"])
+    chunk.end = datetime.fromisoformat(rows[0]["created"])
+    chunk.min_id, chunk.max_id = min(ids), max(ids)
+    chunk.save(update_fields=["payload", "count", "start", "end", "min_id", "max_id"])
+    chunk.authors.set({row["user"] for row in rows})
+
+
+def _message_payload(m):
+    img = getattr(getattr(m.user, "profile", None), "profile_img", None)
+    return {
+        "id": m.id,
+        "user": m.user_id,
+        "username": m.user.username,
+        "body": m.body,
+        "created": m.created.isoformat(),
+        "profile_img": (img.url if img else None),
+    }
+
+
+async def _archived_slice(room_id, offset, limit):
+    # walk chunk sizes (cheap) and only decompress the chunks the page touches
+    wanted, seen, first_at = [], 0, None
+    async for chunk_id, count in (MessageArchive.objects
+                                  .filter(room_id=room_id)
+                                  .order_by("-end")
+                                  .values_list("id", "count")):
+        if seen + count > offset:
+            if first_at is None:
+                first_at = seen
+            wanted.append(chunk_id)
+        seen += count
+        if seen >= offset + limit:
+            break
+    if not wanted:
+        return []
+
+    payloads = {cid: payload async for cid, payload in (MessageArchive.objects
+                                                        .filter(id__in=wanted)
+                                                        .values_list("id", "payload"))}
+    rows = []
+    for cid in wanted:
+        rows.extend(unpack(payloads[cid]))
+    rows = rows[offset - first_at:offset - first_at + limit]
+
+    # avatars are resolved live, they may have changed since archiving
+    profiles = {p.user_id: p async for p in Profile.objects.filter(user_id__in={r["user"] for r in rows})}
+    for r in rows:
+        r.pop("updated", None)
+        img = getattr(profiles.get(r["user"]), "profile_img", None)
+        r["profile_img"] = img.url if img else None
+    return rows
+
+
+async def room_history(room_id, offset, limit):
+    """
+    One newest-first page of a room's history across live and archived
+    messages. Returns (messages, total). Http404 for rooms that are gone
+    or queued for deletion.
+    """
+    await aget_object_or_404(Room.objects.only("id"), id=room_id)
+    qs = (Message.objects
+          .filter(room_id=room_id)
+          .select_related("user__profile")
+          .order_by("-created"))
+
+    live_total = await qs.acount()
+    archived = await MessageArchive.objects.filter(room_id=room_id).aaggregate(n=Sum("count"))
+    archived_total = archived["n"] or 0
+
+    items = []
+    if offset < live_total:
+        items = [_message_payload(m) async for m in qs[offset:offset+limit]]
+    if len(items) < limit and archived_total:
+        items += await _archived_slice(room_id, max(0, offset - live_total), limit - len(items))
+    return items, live_total + archived_total
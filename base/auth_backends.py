@@ -0,0 +1,69 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def forget_user(user_id):
+    forget_users([user_id])
+
+
+def forget_users(user_ids):
+    try:
+        cache.delete_many([user_cache_key(pk) for pk in user_ids])
+    except RedisError:
+        logger.warning("could not drop cached auth users %s", list(user_ids))
+
+
+def deactivate_users(queryset):
+    """
+    Deactivate users in one UPDATE. QuerySet.update() sends no signals, so
+    this drops their cached copies itself; use it rather than a bare
+    update(is_active=False), which would leave them logged in for up to
+    USER_CACHE_TTL.
+    """
+    ids = list(queryset.values_list("pk", flat=True))
+    get_user_model().objects.filter(pk__in=ids).update(is_active=False)
+    # after commit, so a concurrent get_user can't re-cache the old row
+    transaction.on_commit(lambda: forget_users(ids))
+    return len(ids)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() is served from the shared cache.
+
+    get_user runs on every authenticated HTTP request and on every WebSocket
+    connect (channels' AuthMiddlewareStack), so with cached_db sessions a
+    warm connect touches no database at all. Entries are dropped on user
+    save/delete and on logout (see base/signals.py), and by
+    deactivate_users() for bulk updates. If the cache is down, users are
+    read from the database.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        try:
+            user = cache.get(key)
+        except RedisError:
+            logger.warning("auth user cache unavailable, reading user %s from the database", user_id)
+            return super().get_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            try:
+                cache.set(key, user, settings.USER_CACHE_TTL)
+            except RedisError:
+                pass
+        return user if self.user_can_authenticate(user) else None
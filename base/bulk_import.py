@@ -0,0 +1,268 @@
+"""
+Bulk import of users, topics and rooms for onboarding.
+
+Rows are validated one by one, but the database is only touched once per
+chunk of ``BULK_IMPORT_CHUNK_SIZE`` rows: one query finds existing names, one
+``bulk_create`` does the inserts, and one more inserts user profiles. Password
+hashing is the expensive part. hashlib's PBKDF2 releases the GIL, so a thread
+pool hashes on every core.
+
+Uploads are read straight from the request stream, NDJSON line by line, so
+they are not held to Django's DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB, about
+10-20k short rows). The real ceiling is whichever comes first of
+``BULK_IMPORT_MAX_ROWS`` and ``BULK_IMPORT_MAX_BYTES``. Imports run inside
+the request, so for users with passwords the worker timeout also counts:
+each password costs one PBKDF2 hash, roughly 0.3-0.5 s of CPU spread over
+``BULK_IMPORT_HASH_WORKERS`` threads.
+
+Every importer returns one result dict per input row, in input order:
+  {"row": 3, "status": "created", "id": 42}
+  {"row": 4, "status": "exists", "id": 7}
+  {"row": 5, "status": "error", "errors": {"username": ["..."]}}
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .models import Profile, Room, Topic
+from .topic_index import topic_index
+
+User = get_user_model()
+
+_hash_pool = None
+
+
+def _pool():
+    global _hash_pool
+    if _hash_pool is None:
+        workers = settings.BULK_IMPORT_HASH_WORKERS or os.cpu_count() or 1
+        _hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-hash")
+    return _hash_pool
+
+
+class BadPayload(ValueError):
+    pass
+
+
+def read_rows(stream, content_type):
+    """A JSON array, or NDJSON (one object per line), from a file-like upload -> list of dicts."""
+    if stream is None:
+        raise BadPayload("Expected a JSON array or NDJSON.")
+    limit = settings.BULK_IMPORT_MAX_BYTES
+    too_big = BadPayload(f"At most {limit} bytes per request.")
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            rows, size = [], 0
+            for line in stream:
+                size += len(line)
+                if size > limit:
+                    raise too_big
+                if line.strip():
+                    rows.append(json.loads(line))
+                    _check_count(rows)
+        else:
+            body = stream.read(limit + 1)
+            if len(body) > limit:
+                raise too_big
+            rows = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise BadPayload(f"Invalid JSON: {exc}")
+    if not isinstance(rows, list):
+        raise BadPayload("Expected a JSON array or NDJSON.")
+    _check_count(rows)
+    return rows
+
+
+def _check_count(rows):
+    if len(rows) > settings.BULK_IMPORT_MAX_ROWS:
+        raise BadPayload(f"At most {settings.BULK_IMPORT_MAX_ROWS} rows per request.")
+
+
+def _chunks(items):
+    size = settings.BULK_IMPORT_CHUNK_SIZE
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _error(row, **errors):
+    return {"row": row, "status": "error", "errors": {k: [v] for k, v in errors.items()}}
+
+
+# ---------- users ----------
+
+_username_validator = UnicodeUsernameValidator()
+
+
+def _clean_user(row):
+    if not isinstance(row, dict):
+        return None, {"non_field_errors": "Expected an object."}
+    username = (row.get("username") or "").lower().strip()
+    email = (row.get("email") or "").strip()
+    password = row.get("password") or ""
+    if not username:
+        return None, {"username": "This field is required."}
+    if len(username) > 150:
+        return None, {"username": "Ensure this field has no more than 150 characters."}
+    try:
+        _username_validator(username)
+    except ValidationError as exc:
+        return None, {"username": exc.messages[0]}
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError as exc:
+            return None, {"email": exc.messages[0]}
+    if password and not password.strip():
+        return None, {"password": "Password cannot be blank."}
+    return {"username": username, "email": email, "password": password}, None
+
+
+def import_users(rows):
+    results = [None] * len(rows)
+    cleaned = []
+    seen = set()
+    for i, row in enumerate(rows):
+        data, errors = _clean_user(row)
+        if errors:
+            results[i] = _error(i, **errors)
+        elif data["username"] in seen:
+            results[i] = _error(i, username="Duplicate username in this import.")
+        else:
+            seen.add(data["username"])
+            cleaned.append((i, data))
+
+    for chunk in _chunks(cleaned):
+        existing = set(User.objects.filter(
+            username__in=[d["username"] for _, d in chunk]
+        ).values_list("username", flat=True))
+        todo = []
+        for i, data in chunk:
+            if data["username"] in existing:
+                results[i] = _error(i, username="A user with that username already exists.")
+            else:
+                todo.append((i, data))
+
+        # hash in parallel; rows without a password get an unusable one (cheap)
+        hashes = _pool().map(lambda d: make_password(d["password"] or None), [d for _, d in todo])
+        users = [
+            User(username=d["username"], email=d["email"], password=h)
+            for (_, d), h in zip(todo, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                Profile.objects.ensure_for(users)  # bulk_create skips the post_save signal
+        except IntegrityError:
+            # a concurrent signup took one of the names; report the chunk for retry
+            for i, _ in todo:
+                results[i] = _error(i, username="Conflict while inserting, retry this row.")
+            continue
+        for (i, _), user in zip(todo, users):
+            results[i] = {"row": i, "status": "created", "id": user.id}
+    return results
+
+
+# ---------- topics ----------
+
+def _topic_ids(names):
+    """name -> id for the given names, creating the missing ones in bulk."""
+    ids = dict(Topic.objects.filter(name__in=names).values_list("name", "id"))
+    missing = [Topic(name=n) for n in names if n not in ids]
+    if missing:
+        Topic.objects.bulk_create(missing)
+        ids.update((t.name, t.id) for t in missing)
+    return ids
+
+
+def import_topics(rows):
+    results = [None] * len(rows)
+    wanted = []
+    for i, row in enumerate(rows):
+        name = (row.get("name") or "").strip() if isinstance(row, dict) else ""
+        if not name:
+            results[i] = _error(i, name="This field is required.")
+        elif len(name) > 200:
+            results[i] = _error(i, name="Ensure this field has no more than 200 characters.")
+        else:
+            wanted.append((i, name))
+
+    for chunk in _chunks(wanted):
+        names = list({n for _, n in chunk})
+        with transaction.atomic():
+            before = set(Topic.objects.filter(name__in=names).values_list("name", flat=True))
+            ids = _topic_ids(names)
+        for i, name in chunk:
+            status = "exists" if name in before else "created"
+            before.add(name)  # later duplicates in the same import refer to the same topic
+            results[i] = {"row": i, "status": status, "id": ids[name]}
+
+    topic_index.invalidate()  # bulk_create skips the signals that keep it incremental
+    return results
+
+
+# ---------- rooms ----------
+
+def _clean_room(row):
+    if not isinstance(row, dict):
+        return None, {"non_field_errors": "Expected an object."}
+    name = (row.get("name") or "").strip()
+    description = (row.get("description") or "").strip()
+    topic = (row.get("topic") or "").strip()
+    if len(name) < 3:
+        return None, {"name": "Name must be at least 3 characters."}
+    if len(name) > 200:
+        return None, {"name": "Ensure this field has no more than 200 characters."}
+    if description and name.lower() == description.lower():
+        return None, {"non_field_errors": "Description must differ from name."}
+    if len(topic) > 200:
+        return None, {"topic": "Ensure this field has no more than 200 characters."}
+    host = (row.get("host") or "").lower().strip() or None
+    return {"name": name, "description": description or None, "topic": topic or None, "host": host}, None
+
+
+def import_rooms(rows, default_host):
+    results = [None] * len(rows)
+    cleaned = []
+    for i, row in enumerate(rows):
+        data, errors = _clean_room(row)
+        if errors:
+            results[i] = _error(i, **errors)
+        else:
+            cleaned.append((i, data))
+
+    for chunk in _chunks(cleaned):
+        usernames = {d["host"] for _, d in chunk if d["host"]}
+        hosts = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+        todo = []
+        for i, data in chunk:
+            if data["host"] and data["host"] not in hosts:
+                results[i] = _error(i, host="Unknown username.")
+            else:
+                todo.append((i, data))
+
+        with transaction.atomic():
+            topics = _topic_ids(list({d["topic"] for _, d in todo if d["topic"]}))
+            rooms = [
+                Room(
+                    name=d["name"],
+                    description=d["description"],
+                    topic_id=topics.get(d["topic"]),
+                    host_id=hosts[d["host"]] if d["host"] else default_host.id,
+                )
+                for _, d in todo
+            ]
+            Room.objects.bulk_create(rooms)
+        for (i, _), room in zip(todo, rooms):
+            results[i] = {"row": i, "status": "created", "id": room.id}
+
+    topic_index.invalidate()
+    return results
@@ -0,0 +1,104 @@
+"""
+Per-room change log for delta sync.
+
+Every message create, update and delete, and every edit of a room's
+metadata, appends a RoomChange row. Single objects are logged by signals in
+base/signals.py; bulk paths call ``record_message_deletions``. Reading
+``GET /api/rooms/<pk>/changes?since=<cursor>`` walks the ``(room, id)`` index
+from the cursor, so catching up costs O(changes since), not O(history).
+
+Archival (archive_messages) moves messages without logging anything, because
+they stay part of the history. A room deleted in the background takes its
+log with it.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Message, RoomChange
+
+
+def record(room_id, kind, object_id):
+    RoomChange.objects.create(room_id=room_id, kind=kind, object_id=object_id)
+
+
+def record_message_deletions(id_room_pairs):
+    RoomChange.objects.bulk_create([
+        RoomChange(room_id=room_id, kind=RoomChange.MESSAGE_DELETED, object_id=message_id)
+        for message_id, room_id in id_room_pairs
+    ])
+
+
+def settled_before():
+    """Log rows created before this can be read past safely (see changes_since)."""
+    return timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+
+
+def latest_cursor(room_id):
+    return (RoomChange.objects.filter(room_id=room_id, created__lt=settled_before())
+            .order_by("-id").values_list("id", flat=True).first()) or 0
+
+
+def _message(m):
+    img = getattr(getattr(m.user, "profile", None), "profile_img", None)
+    return {
+        "id": m.id,
+        "user": m.user_id,
+        "username": m.user.username,
+        "body": m.body,
+        "created": m.created.isoformat(),
+        "updated": m.updated.isoformat(),
+        "profile_img": (img.url if img else None),
+    }
+
+
+def _room(room):
+    return {
+        "id": room.id,
+        "name": room.name,
+        "description": room.description,
+        "topic": room.topic.name if room.topic_id else None,
+        "updated": room.updated.isoformat(),
+    }
+
+
+def changes_since(room, since, limit):
+    """
+    -> (changes, cursor, has_more). Several changes to one object within the
+    page collapse into its latest state. Rows younger than
+    CHANGE_FEED_SETTLE_SECONDS are held back, so an id whose transaction has
+    not committed yet is never skipped over by a cursor.
+    """
+    rows = list(RoomChange.objects
+                .filter(room_id=room.id, id__gt=since, created__lt=settled_before())
+                .order_by("id")
+                .values_list("id", "kind", "object_id")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1][0] if rows else since
+
+    latest = {}  # (entity, id) -> (cursor, kind)
+    for change_id, kind, object_id in rows:
+        key = (kind.split(".")[0], object_id)
+        prev = latest.get(key)
+        if prev and prev[1] == RoomChange.MESSAGE_CREATED and kind == RoomChange.MESSAGE_UPDATED:
+            kind = RoomChange.MESSAGE_CREATED  # new to the client either way
+        latest[key] = (change_id, kind)
+
+    live_ids = [oid for (entity, oid), (_, kind) in latest.items()
+                if entity == "message" and kind != RoomChange.MESSAGE_DELETED]
+    messages = {m.id: m for m in Message.objects.filter(room_id=room.id, id__in=live_ids)
+                                                .select_related("user__profile")}
+
+    changes = []
+    for (entity, oid), (change_id, kind) in sorted(latest.items(), key=lambda kv: kv[1][0]):
+        if entity == "room":
+            changes.append({"cursor": change_id, "type": kind, "room": _room(room)})
+        elif kind == RoomChange.MESSAGE_DELETED:
+            changes.append({"cursor": change_id, "type": kind, "id": oid})
+        elif oid in messages:
+            changes.append({"cursor": change_id, "type": kind, "message": _message(messages[oid])})
+        # otherwise it was deleted (its tombstone comes later in the log) or archived
+    return changes, cursor, has_more
@@ -0,0 +1,103 @@
+"""
+Content-negotiated compression for dynamic responses.
+
+WhiteNoise only compresses static files. This middleware compresses HTML and
+JSON responses of at least ``COMPRESS_MIN_SIZE`` bytes.
+
+HTML pages carry the CSRF token next to reflected input (``?q=``), which is
+what BREACH needs to recover the token from compressed sizes. Like Django's
+GZipMiddleware, gzip output gets a random-length filename field ("Heal the
+BREACH"), so sizes no longer leak the secret. Brotli has no such field, so
+it is only used for JSON when the client accepts it and the ``brotli``
+package is installed. Everything else is gzip.
+"""
+
+import gzip
+import re
+import secrets
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/html", "application/json", "text/plain", "application/javascript")
+BROTLI_TYPES = ("application/json",)
+# same bound as django.middleware.gzip.GZipMiddleware
+MAX_RANDOM_BYTES = 100
+_token_re = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        m = _token_re.match(part)
+        if m and (m[2] is None or float(m[2] or 0) > 0):
+            accepted.add(m[1].lower())
+    return accepted
+
+
+def compress(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=settings.COMPRESS_BROTLI_QUALITY)
+    data = gzip.compress(content, compresslevel=settings.COMPRESS_GZIP_LEVEL, mtime=0)
+    # pad the header with a random-length FNAME, as django.utils.text.compress_string does
+    header = bytearray(data[:10])
+    header[3] = gzip.FNAME
+    return bytes(header) + b"a" * secrets.randbelow(MAX_RANDOM_BYTES) + b"\x00" + data[10:]
+
+
+class CompressionMiddleware:
+    # natively async: MiddlewareMixin would run process_response on the
+    # shared sync thread under ASGI
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < settings.COMPRESS_MIN_SIZE:
+            return response
+
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and "br" in accepted and response["Content-Type"].startswith(BROTLI_TYPES):
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # the representation changed, so a strong ETag no longer matches
+        if response.has_header("ETag"):
+            response["ETag"] = re.sub(r"^\"", 'W/"', response["ETag"])
+        return response
@@ -2,151 +2,215 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from redis.asyncio import Redis
+from studybud.db_router import use_primary
 from .models import Room
-import json, time
+from .redis_client import async_redis
+from .tracing import tracer
+from .profiling import aprofile, sampled, PROFILE_PARAM
+from . import metrics
+from .presence import HEARTBEAT_TTL, COUNT_TTL, room_presence_keys, heartbeat_key
+from .fanout import local_fanout, use_tiered, worker_group
+from .sharding import shard_url
+from .unread import message_posted
+from . import dedupe
+import asyncio, json, time
 
-HEARTBEAT_TTL = 70
+def room_group(room_id):
+    return f"room_{room_id}"
 
-def room_presence_keys(room_id, user_id=None):
-    base = f"presence:room:{room_id}"
-    return {
-        "members": f"{base}:members",                          # SET of user_ids (strings)
-        "counts":  f"{base}:user:{user_id}:count" if user_id else None,  # INT counter per user
-    }
+class RoomChannelMixin:
+    """
+    Per-room chat and presence plumbing shared by the single-room and the
+    multiplexed consumer. Everything takes the room id explicitly so one
+    socket can serve many rooms; needs self.user, self.r and self.channel_layer.
+    """
 
-class RoomConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        # require auth
-        if isinstance(self.scope["user"], AnonymousUser):
-            await self.close()
-            return
-
-        self.user = self.scope["user"]
-        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
-        self.group_name = f"room_{self.room_id}"
-
-        # Redis client (reused)
-        self.r = Redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
-
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+    async def _join_room(self, room_id):
+        # heartbeat first, so the presence sweeper never sees a fresh member
+        # without one and reaps it
+        await self._touch_heartbeat(room_id)
 
         # add to presence (with ref count so multi-tabs work)
-        await self._presence_increment()
+        members = await self._presence_increment(room_id)
 
-        # to broadcast for disconnections
-        await self._touch_heartbeat()
+        # big rooms get one delivery per worker instead of one per socket
+        if use_tiered(members):
+            self._tiered_rooms.add(int(room_id))
+            await local_fanout.join(self.channel_layer, int(room_id), self)
+        else:
+            await self.channel_layer.group_add(room_group(room_id), self.channel_name)
 
         # send current presence snapshot to everyone
-        await self._broadcast_presence()
+        await self._broadcast_presence(room_id)
 
-    async def disconnect(self, code):
-        try:
-            await self._presence_decrement()
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
-            await self._broadcast_presence()
-        finally:
-            if hasattr(self, "r"):
-                await self.r.close()
+    async def _leave_room(self, room_id):
+        await self._presence_decrement(room_id)
+        if int(room_id) in self._tiered_rooms:
+            self._tiered_rooms.discard(int(room_id))
+            await local_fanout.leave(self.channel_layer, int(room_id), self)
+        else:
+            await self.channel_layer.group_discard(room_group(room_id), self.channel_name)
+        await self._broadcast_presence(room_id)
+
+    async def _room_send(self, room_id, event):
+        # direct members, and worker relays once the room is tiered; each socket is in exactly one
+        await self.channel_layer.group_send(room_group(room_id), event)
+        if await local_fanout.tiered(self._shard(room_id), int(room_id)):
+            await self.channel_layer.group_send(worker_group(room_id), event)
 
     @database_sync_to_async
     def _add_participant(self, room_id, user_id):
-        room = Room.objects.get(id=room_id)
-        room.participants.add(user_id)  
+        with use_primary():
+            room = Room.objects.get(id=room_id)
+            room.participants.add(user_id)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data or "{}")
-        msg_type = data.get("type")
-
-        # Heartbeat from client
-        if msg_type == "ping":
-            await self._touch_heartbeat()
-            await self._broadcast_presence()
+    async def _post_chat(self, room_id, body, parse_wall, parse_took, nbytes, client_msg_id=None):
+        if client_msg_id is not None and not dedupe.valid_client_msg_id(client_msg_id):
+            await self._error(room_id, f"client_msg_id must be 1-{dedupe.MAX_ID_LENGTH} printable characters")
             return
 
-        # Graceful disconnect
-        if msg_type == "bye":
-            await self._presence_decrement()
-            await self._broadcast_presence()
-            return
+        await tracer.refresh(self.r)
+        trace = tracer.start()
+        trace.record("receive.parse", parse_wall, parse_took, room=room_id, bytes=nbytes)
 
-        # Regular chat message
-        body = (data.get("body") or "").strip()
-        if not body:
-            return
+        if client_msg_id is not None:
+            # a resent frame costs this one lookup: no insert, no fan-out
+            with trace.span("dedupe"):
+                seen = await dedupe.claim(self.r, self.user.id, client_msg_id)
+            if seen is not None:
+                metrics.chat_deduplicated.inc(outcome="pending" if seen == dedupe.PENDING else "replayed")
+                await self._ack(room_id, client_msg_id, seen, duplicate=True)
+                return
 
-        msg = await self._save_message(self.user.id, self.room_id, body)
-        await self._add_participant(self.room_id, self.user.id)
+        try:
+            with trace.span("save_message"):
+                msg = await self._save_message(self.user.id, room_id, body)
+        except Exception:
+            if client_msg_id is not None:
+                await dedupe.release(self.r, self.user.id, client_msg_id)
+            raise
+        if client_msg_id is not None:
+            await dedupe.settle(self.r, self.user.id, client_msg_id, msg["id"])
+            msg["client_msg_id"] = client_msg_id  # lets the sender's tabs match their optimistic copy
+        with trace.span("add_participant"):
+            await self._add_participant(room_id, self.user.id)
+        with trace.span("unread"):
+            await message_posted(self.r, room_id, self.user.id)
 
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "chat.message", "message": msg},
-        )
+        event = {"type": "chat.message", "room": int(room_id), "message": msg}
+        carrier = trace.context()
+        if carrier:
+            event["trace"] = carrier
+        with trace.span("group_send", room=room_id):
+            await self._room_send(room_id, event)
+        metrics.ws_group_sends.inc(event="chat.message")
+        if client_msg_id is not None:
+            await self._ack(room_id, client_msg_id, msg["id"])
 
-    async def chat_message(self, event):
+    async def _ack(self, room_id, client_msg_id, message_id, duplicate=False):
+        # message_id is None while the first copy is still being saved; retry later
         await self.send(text_data=json.dumps({
-            "type": "chat",
-            "message": event["message"],
+            "type": "ack",
+            "room": int(room_id),
+            "client_msg_id": client_msg_id,
+            "id": None if message_id == dedupe.PENDING else message_id,
+            "duplicate": duplicate,
         }))
 
+    async def _error(self, room_id, detail):
+        await self.send(text_data=json.dumps({"type": "error", "room": room_id, "detail": detail}))
+
+    async def chat_message(self, event):
+        trace = tracer.resume(event.get("trace"))
+        if trace.sampled:
+            # time from the sender's group_send to this recipient picking it up
+            sent = event["trace"]["sent"]
+            trace.record("fanout.delivery", sent, max(0.0, time.time() - sent), channel=self.channel_name)
+        with trace.span("chat_message.send", channel=self.channel_name):
+            await self.send(text_data=json.dumps({
+                "type": "chat",
+                "room": event.get("room"),
+                "message": event["message"],
+            }))
+
     async def presence_update(self, event):
         # fan-out presence snapshot
         await self.send(text_data=json.dumps({
             "type": "presence",
+            "room": event.get("room"),
             "users": event["users"],        # list of {id, username, profile_img}
             "count": len(event["users"]),
         }))
 
     # ---------- presence helpers ----------
 
-    async def _presence_increment(self):
-        keys = room_presence_keys(self.room_id, self.user.id)
+    async def _presence_increment(self, room_id):
+        """Returns how many users are now present in the room."""
+        keys = room_presence_keys(room_id, self.user.id)
+        r = self._shard(room_id)
         # incr per-user count; add to set when it becomes 1
-        new_count = await self.r.incr(keys["counts"])
+        pipe = r.pipeline()
+        pipe.incr(keys["counts"])
+        pipe.expire(keys["counts"], COUNT_TTL)
+        pipe.scard(keys["members"])
+        new_count, _, members = await pipe.execute()
         if new_count == 1:
-            await self.r.sadd(room_presence_keys(self.room_id)["members"], str(self.user.id))
+            members += await r.sadd(keys["members"], str(self.user.id))
+        return members
 
-    async def _presence_decrement(self):
-        keys = room_presence_keys(self.room_id, self.user.id)
+    async def _presence_decrement(self, room_id):
+        keys = room_presence_keys(room_id, self.user.id)
+        r = self._shard(room_id)
         # if no key, nothing to do
-        if not await self.r.exists(keys["counts"]):
+        if not await r.exists(keys["counts"]):
             return
-        new_count = await self.r.decr(keys["counts"])
+        new_count = await r.decr(keys["counts"])
         if new_count <= 0:
-            pipe = self.r.pipeline()
+            pipe = r.pipeline()
             pipe.delete(keys["counts"])
-            pipe.srem(room_presence_keys(self.room_id)["members"], str(self.user.id))
+            pipe.srem(keys["members"], str(self.user.id))
             await pipe.execute()
 
-    async def _broadcast_presence(self):
-        live_ids = await self._live_user_ids()
-        users = await self._users_payload(live_ids)
-        await self.channel_layer.group_send(
-            self.group_name,
-            {"type": "presence.update", "users": users},
-        )
-    
-    async def _touch_heartbeat(self):
+    async def _broadcast_presence(self, room_id):
+        with metrics.presence_broadcast.time():
+            live_ids = await self._live_user_ids(room_id)
+            users = await self._users_payload(live_ids)
+            await self._room_send(
+                room_id,
+                {"type": "presence.update", "room": int(room_id), "users": users},
+            )
+        metrics.ws_group_sends.inc(event="presence.update")
+
+    async def _touch_heartbeat(self, *room_ids):
         """
-        Set/refresh a per-user heartbeat key that expires automatically.
+        Set/refresh a per-user heartbeat key that expires automatically,
+        and keep the tab counter alive alongside it. One round trip per
+        shard for any number of rooms.
         """
-        key = f"presence:room:{self.room_id}:user:{self.user.id}:hb"
-        await self.r.setex(key, HEARTBEAT_TTL, "1")
+        pipes = {}
+        for room_id in room_ids:
+            r = self._shard(room_id)
+            pipe = pipes.get(id(r))
+            if pipe is None:
+                pipe = pipes[id(r)] = r.pipeline()
+            keys = room_presence_keys(room_id, self.user.id)
+            pipe.setex(keys["heartbeat"], HEARTBEAT_TTL, "1")
+            pipe.expire(keys["counts"], COUNT_TTL)
+        await asyncio.gather(*(pipe.execute() for pipe in pipes.values()))
 
-    async def _live_user_ids(self):
+    async def _live_user_ids(self, room_id):
         """
         From the room members set, only keep users whose heartbeat key still exists.
         """
-        members_key = room_presence_keys(self.room_id)["members"]
-        user_ids = await self.r.smembers(members_key)
+        members_key = room_presence_keys(room_id)["members"]
+        r = self._shard(room_id)
+        user_ids = await r.smembers(members_key)
         if not user_ids:
             return []
 
-        pipe = self.r.pipeline()
+        pipe = r.pipeline()
         for uid in user_ids:
-            key = f"presence:room:{self.room_id}:user:{uid}:hb"
-            pipe.exists(key)
+            pipe.exists(heartbeat_key(room_id, uid))
         exists_flags = await pipe.execute()
 
         # keep only users with a live heartbeat
@@ -171,9 +235,11 @@ class RoomConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def _save_message(self, user_id, room_id, body):
         from .models import Room, Message
-        room = Room.objects.get(id=room_id)
-        msg = Message.objects.create(user_id=user_id, room=room, body=body)
-        u = msg.user
+        # websocket writes (and the reads they depend on) never touch the replica
+        with use_primary():
+            room = Room.objects.get(id=room_id)
+            msg = Message.objects.create(user_id=user_id, room=room, body=body)
+            u = msg.user
         img = getattr(getattr(u, "profile", None), "profile_img", None)
         return {
             "id": msg.id,
@@ -182,4 +248,197 @@ class RoomConsumer(AsyncWebsocketConsumer):
             "body": msg.body,
             "created": msg.created.isoformat(),
             "profile_img": (img.url if img else None),
-        }
\ No newline at end of file
+        }
+
+    # ---------- connection bookkeeping ----------
+
+    def _shard(self, room_id):
+        """Redis client for the room's presence shard, resolved once per connection."""
+        room_id = int(room_id)
+        r = self._room_shards.get(room_id)
+        if r is None:
+            url = shard_url(room_id)
+            if url == settings.REDIS_URL:
+                r = self.r
+            elif url in self._shard_clients:
+                r = self._shard_clients[url]
+            else:
+                r = self._shard_clients[url] = async_redis(url)
+            self._room_shards[room_id] = r
+        return r
+
+    async def _open(self):
+        """Common connect steps. Returns False if the socket was refused."""
+        # require auth
+        if isinstance(self.scope["user"], AnonymousUser):
+            await self.close()
+            return False
+
+        self.user = self.scope["user"]
+        # superusers can profile their own socket with ?__profile=1
+        self.profile_armed = (
+            self.user.is_superuser
+            and PROFILE_PARAM.encode() in self.scope.get("query_string", b"")
+        )
+
+        # Redis client (reused)
+        self.r = async_redis()
+        self._shard_clients = {}    # url -> client, other than self.r
+        self._room_shards = {}      # room_id -> client
+        self._tiered_rooms = set()
+        return True
+
+    async def _accepted(self):
+        await self.accept()
+        metrics.ws_open.inc()
+        self._ws_counted = True
+
+    async def _close_resources(self):
+        if getattr(self, "_ws_counted", False):
+            metrics.ws_open.dec()
+            self._ws_counted = False
+        if hasattr(self, "r"):
+            await self.r.close()
+            for r in self._shard_clients.values():
+                await r.close()
+
+    async def receive(self, text_data):
+        if self.profile_armed or sampled(settings.PROFILE_SAMPLE_RATE):
+            async with aprofile(f"ws {type(self).__name__} receive"):
+                return await self._receive(text_data)
+        return await self._receive(text_data)
+
+
+class RoomConsumer(RoomChannelMixin, AsyncWebsocketConsumer):
+    """One socket per room: ws/rooms/<room_id>/"""
+
+    async def connect(self):
+        if not await self._open():
+            return
+        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
+        await self._accepted()
+        await self._join_room(self.room_id)
+
+    async def disconnect(self, code):
+        try:
+            if hasattr(self, "room_id"):
+                await self._leave_room(self.room_id)
+        finally:
+            await self._close_resources()
+
+    async def _receive(self, text_data):
+        parse_wall, parse_started = time.time(), time.perf_counter()
+        data = json.loads(text_data or "{}")
+        parse_took = time.perf_counter() - parse_started
+        msg_type = data.get("type")
+
+        # Heartbeat from client
+        if msg_type == "ping":
+            await self._touch_heartbeat(self.room_id)
+            await self._broadcast_presence(self.room_id)
+            return
+
+        # Graceful disconnect
+        if msg_type == "bye":
+            await self._presence_decrement(self.room_id)
+            await self._broadcast_presence(self.room_id)
+            return
+
+        # Regular chat message
+        body = (data.get("body") or "").strip()
+        if not body:
+            return
+
+        await self._post_chat(self.room_id, body, parse_wall, parse_took, len(text_data),
+                              data.get("client_msg_id"))
+
+
+class MultiRoomConsumer(RoomChannelMixin, AsyncWebsocketConsumer):
+    """
+    One socket for many rooms: ws/rooms/
+
+    Client frames (every server frame carries "room" too):
+      {"type": "subscribe",   "room": 12}
+      {"type": "unsubscribe", "room": 12}
+      {"type": "chat",        "room": 12, "body": "hi", "client_msg_id": "c1"}
+      {"type": "ping"}        heartbeat for every subscribed room
+      {"type": "bye"}         leave all rooms' presence, keep the socket
+    client_msg_id is optional (also on RoomConsumer). With it, resends inside
+    CHAT_DEDUPE_WINDOW are not saved again, and every send is answered with
+    {"type": "ack", "room", "client_msg_id", "id", "duplicate"}.
+    Presence is ref-counted per subscription, so a user subscribed to the
+    same room from several sockets stays present until the last one leaves.
+    """
+
+    async def connect(self):
+        if not await self._open():
+            return
+        self.rooms = set()
+        await self._accepted()
+
+    async def disconnect(self, code):
+        try:
+            for room_id in list(getattr(self, "rooms", ())):
+                await self._unsubscribe(room_id)
+        finally:
+            await self._close_resources()
+
+    @database_sync_to_async
+    def _room_exists(self, room_id):
+        return Room.objects.filter(id=room_id).exists()
+
+    async def _subscribe(self, room_id):
+        if room_id in self.rooms:
+            return
+        if len(self.rooms) >= settings.WS_MAX_SUBSCRIPTIONS:
+            await self._error(room_id, "too many subscriptions")
+            return
+        if not await self._room_exists(room_id):
+            await self._error(room_id, "no such room")
+            return
+        self.rooms.add(room_id)
+        await self._join_room(room_id)
+        await self.send(text_data=json.dumps({"type": "subscribed", "room": room_id}))
+
+    async def _unsubscribe(self, room_id):
+        if room_id not in self.rooms:
+            return
+        self.rooms.discard(room_id)
+        await self._leave_room(room_id)
+
+    async def _receive(self, text_data):
+        parse_wall, parse_started = time.time(), time.perf_counter()
+        data = json.loads(text_data or "{}")
+        parse_took = time.perf_counter() - parse_started
+        msg_type = data.get("type")
+
+        if msg_type == "ping":
+            if self.rooms:
+                await self._touch_heartbeat(*self.rooms)
+                for room_id in self.rooms:
+                    await self._broadcast_presence(room_id)
+            return
+
+        if msg_type == "bye":
+            for room_id in list(self.rooms):
+                await self._unsubscribe(room_id)
+            return
+
+        try:
+            room_id = int(data.get("room"))
+        except (TypeError, ValueError):
+            await self._error(None, "room is required")
+            return
+
+        if msg_type == "subscribe":
+            await self._subscribe(room_id)
+        elif msg_type == "unsubscribe":
+            await self._unsubscribe(room_id)
+        elif msg_type == "chat":
+            if room_id not in self.rooms:
+                await self._error(room_id, "not subscribed")
+                return
+            body = (data.get("body") or "").strip()
+            if body:
+                await self._post_chat(room_id, body, parse_wall, parse_took, len(text_data),
+                                      data.get("client_msg_id"))
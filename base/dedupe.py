@@ -0,0 +1,46 @@
+"""
+Idempotent chat sends.
+
+A client may tag a chat frame with ``client_msg_id`` and resend it after a
+timeout. The first frame claims
+
+  chat:dedupe:<uid>:<client_msg_id>   "pending", then the saved Message id
+
+with SET NX. The "pending" claim only lives ``CHAT_DEDUPE_PENDING_TTL``
+seconds, so a worker dying mid-save does not swallow the client's retries
+for the whole window; ``settle`` stores the id for ``CHAT_DEDUPE_WINDOW``
+seconds. A retry inside the window costs one GET. It is acked with the
+canonical message id, with no insert and no fan-out. Keys live on
+REDIS_URL, since they are per user, not per room.
+"""
+
+from django.conf import settings
+
+PENDING = "pending"
+MAX_ID_LENGTH = 64
+
+
+def dedupe_key(user_id, client_msg_id):
+    return f"chat:dedupe:{user_id}:{client_msg_id}"
+
+
+def valid_client_msg_id(value):
+    return isinstance(value, str) and 0 < len(value) <= MAX_ID_LENGTH and value.isprintable()
+
+
+async def claim(r, user_id, client_msg_id):
+    """None if this frame is the first; otherwise PENDING or the saved message id."""
+    key = dedupe_key(user_id, client_msg_id)
+    if await r.set(key, PENDING, nx=True, ex=settings.CHAT_DEDUPE_PENDING_TTL):
+        return None
+    seen = await r.get(key)
+    return int(seen) if seen and seen != PENDING else PENDING
+
+
+async def settle(r, user_id, client_msg_id, message_id):
+    await r.set(dedupe_key(user_id, client_msg_id), message_id, ex=settings.CHAT_DEDUPE_WINDOW)
+
+
+async def release(r, user_id, client_msg_id):
+    # the insert failed: let the client's retry go through
+    await r.delete(dedupe_key(user_id, client_msg_id))
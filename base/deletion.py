@@ -0,0 +1,172 @@
+"""
+Background deletion of rooms and users in bounded chunks.
+
+Calling ``.delete()`` on a big room makes Django's collector load every
+Message into memory and delete them all in one long transaction. Instead:
+
+  1. ``queue_room_deletion`` / ``queue_user_deletion`` hide the entity at
+     once (``Room.deleted_at`` / ``User.is_active = False``) and record a
+     DeletionJob. The request returns straight away.
+  2. ``manage.py run_deletions`` (the ``deletions`` Procfile process) removes
+     the dependents, ``DELETION_CHUNK_SIZE`` rows per short transaction,
+     saving progress after each chunk. Then it deletes the row itself, which
+     by then has nothing left to cascade to.
+
+Every step only touches rows that still exist, so a job can be resumed. A
+job left ``running`` by a crashed worker is picked up again after
+``DELETION_STALE_AFTER`` seconds and continues where it stopped.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from studybud.db_router import use_primary
+from .archive import drop_author
+from .auth_backends import deactivate_users
+from .changes import record_message_deletions
+from .models import ActivityRollup, DeletionJob, Message, MessageArchive, Room, RoomChange
+from .redis_client import sync_redis
+from .topic_index import topic_index
+from .unread import seq_key
+
+logger = logging.getLogger(__name__)
+
+Participant = Room.participants.through
+
+
+def _queue(kind, object_id, requested_by):
+    # asking twice returns the job already in flight
+    job = DeletionJob.objects.filter(
+        kind=kind, object_id=object_id, status__in=[DeletionJob.PENDING, DeletionJob.RUNNING]
+    ).first()
+    return job or DeletionJob.objects.create(kind=kind, object_id=object_id, requested_by=requested_by)
+
+
+def queue_room_deletion(room, requested_by=None):
+    with transaction.atomic():
+        hidden = Room.all_objects.filter(pk=room.pk, deleted_at__isnull=True).update(deleted_at=timezone.now())
+        if hidden and room.topic_id:
+            # hidden rooms leave the topic counts now, not when the job deletes them
+            topic_index.bump(room.topic_id, -1)
+        return _queue(DeletionJob.ROOM, room.pk, requested_by)
+
+
+def queue_user_deletion(user, requested_by=None):
+    with transaction.atomic():
+        # inactive users can't log in; this also drops their cached auth entry
+        deactivate_users(User.objects.filter(pk=user.pk))
+        user.is_active = False
+        return _queue(DeletionJob.USER, user.pk, requested_by)
+
+
+def progress(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "object_id": job.object_id,
+        "status": job.status,
+        "total": job.total,
+        "deleted": job.deleted,
+        "percent": 100.0 if job.status == DeletionJob.DONE else
+                   round(100 * job.deleted / job.total, 1) if job.total else 0.0,
+        "error": job.error or None,
+    }
+
+
+# ---------- worker ----------
+
+def claim_next():
+    """Lock and mark the oldest runnable job; None when there is nothing to do."""
+    stale = timezone.now() - timedelta(seconds=settings.DELETION_STALE_AFTER)
+    with transaction.atomic():
+        job = (DeletionJob.objects.select_for_update(skip_locked=True)
+               .filter(Q(status=DeletionJob.PENDING) | Q(status=DeletionJob.RUNNING, updated__lt=stale))
+               .order_by("created")
+               .first())
+        if job is not None:
+            job.status = DeletionJob.RUNNING
+            job.save(update_fields=["status", "updated"])
+    return job
+
+
+def _steps(job):
+    """(queryset, action) pairs to drain, then the final delete of the row itself."""
+    if job.kind == DeletionJob.ROOM:
+        return [
+            # no tombstones: the room's change log goes with it
+            (Message.objects.filter(room_id=job.object_id), "raw_delete"),
+            (MessageArchive.objects.filter(room_id=job.object_id), "delete"),
+            (Participant.objects.filter(room_id=job.object_id), "delete"),
+            (RoomChange.objects.filter(room_id=job.object_id), "delete"),
+            (ActivityRollup.objects.filter(scope=ActivityRollup.ROOM, object_id=job.object_id), "delete"),
+        ], Room.all_objects.filter(pk=job.object_id)
+    return [
+        (Message.objects.filter(user_id=job.object_id), "tombstone_delete"),
+        # archived rows keep the username and body: rewrite the chunks without them
+        (MessageArchive.objects.filter(authors=job.object_id), "drop_author"),
+        (Room.all_objects.filter(host_id=job.object_id), "unset_host"),  # on_delete=SET_NULL
+        (Participant.objects.filter(user_id=job.object_id), "delete"),
+        (ActivityRollup.objects.filter(scope=ActivityRollup.USER, object_id=job.object_id), "delete"),
+    ], User.objects.filter(pk=job.object_id)
+
+
+def _drain(job, qs, action, chunk):
+    while True:
+        ids = list(qs.order_by().values_list("pk", flat=True)[:chunk])
+        if not ids:
+            return
+        batch = qs.model._base_manager.filter(pk__in=ids)
+        with transaction.atomic():
+            if action == "unset_host":
+                batch.update(host=None)
+            elif action == "tombstone_delete":
+                # one INSERT for the chunk's tombstones instead of a signal per row
+                record_message_deletions(batch.values_list("id", "room_id"))
+                batch._raw_delete(batch.db)
+            elif action == "drop_author":
+                drop_author(batch.select_for_update(), job.object_id)
+            elif action == "raw_delete":
+                batch._raw_delete(batch.db)
+            else:
+                batch.delete()
+        DeletionJob.objects.filter(pk=job.pk).update(
+            deleted=F("deleted") + len(ids), updated=timezone.now()
+        )
+        if settings.DELETION_PAUSE:
+            # give other writers a turn at the locks between chunks
+            time.sleep(settings.DELETION_PAUSE)
+
+
+def run(job, chunk=None):
+    chunk = chunk or settings.DELETION_CHUNK_SIZE
+    with use_primary():
+        try:
+            steps, final = _steps(job)
+            if not job.total:
+                job.total = sum(qs.count() for qs, _ in steps)
+                job.save(update_fields=["total", "updated"])
+            for qs, action in steps:
+                _drain(job, qs, action, chunk)
+            with transaction.atomic():
+                final.delete()
+        except Exception as exc:
+            logger.exception("deletion job %s failed", job.pk)
+            DeletionJob.objects.filter(pk=job.pk).update(
+                status=DeletionJob.FAILED, error=f"{type(exc).__name__}: {exc}", updated=timezone.now()
+            )
+            return False
+        DeletionJob.objects.filter(pk=job.pk).update(status=DeletionJob.DONE, updated=timezone.now())
+    if job.kind == DeletionJob.ROOM:
+        try:
+            sync_redis().delete(seq_key(job.object_id))
+        except RedisError:
+            logger.warning("could not drop unread counter for room %s", job.object_id)
+    return True
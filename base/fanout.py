@@ -0,0 +1,143 @@
+"""
+Tiered fan-out for very large rooms.
+
+Normally every socket in a room joins the channel-layer group ``room_<id>``.
+``group_send`` then pushes one copy per member channel from the sending
+worker, which stalls it in rooms with thousands of members. When a room has at
+least ``FANOUT_TIERED_THRESHOLD`` present users, new sockets join in tiered
+mode instead:
+
+  - each worker process joins ``room_<id>_workers`` once, through a single
+    relay channel, no matter how many of its sockets are in the room;
+  - the relay task receives one copy per worker and hands it to the local
+    consumers in memory.
+
+Senders publish to ``room_<id>``, and also to ``room_<id>_workers`` while the
+room is tiered, so sockets that joined before the switch keep receiving on
+``room_<id>`` and no socket ever gets a message twice. A room is tiered while
+some worker relays it: relays list themselves in
+
+  presence:room:<id>:relays   SET of relay channels, on the room's shard
+
+which senders check with one EXISTS instead of a second group_send.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+
+from .redis_client import async_redis
+from .sharding import shard_url
+
+logger = logging.getLogger(__name__)
+
+# re-add relay memberships well before channels_redis' group_expiry drops them
+REFRESH_EVERY = 3600
+# a dead worker's relay entry outlives it by at most this long
+RELAYS_TTL = 2 * REFRESH_EVERY
+
+
+def worker_group(room_id):
+    return f"room_{room_id}_workers"
+
+
+def relays_key(room_id):
+    return f"presence:room:{room_id}:relays"
+
+
+class LocalFanout:
+    def __init__(self):
+        self.rooms = defaultdict(set)   # room_id -> local consumers in tiered mode
+        self.relay_channel = None
+        self._tasks = []
+        self._lock = asyncio.Lock()
+        self._redis = {}                # shard url -> client, outliving any one socket
+
+    async def join(self, layer, room_id, consumer):
+        await self._ensure_relay(layer)
+        members = self.rooms[room_id]
+        if not members:
+            # listed before joining, so no sender skips the group while we are in it
+            await self._advertise(room_id)
+            await layer.group_add(worker_group(room_id), self.relay_channel)
+        members.add(consumer)
+
+    async def leave(self, layer, room_id, consumer):
+        members = self.rooms.get(room_id)
+        if members is None:
+            return
+        members.discard(consumer)
+        if not members:
+            del self.rooms[room_id]
+            await layer.group_discard(worker_group(room_id), self.relay_channel)
+            await self._shard(room_id).srem(relays_key(room_id), self.relay_channel)
+
+    async def tiered(self, r, room_id):
+        """Whether any worker relays the room. r is a client for the room's shard."""
+        if room_id in self.rooms:
+            return True
+        return bool(await r.exists(relays_key(room_id)))
+
+    async def close(self):
+        """Stop relaying (for benchmarks and tests; workers keep theirs for life)."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks, self.relay_channel = [], None
+        for r in self._redis.values():
+            await r.close()
+        self._redis.clear()
+
+    def _shard(self, room_id):
+        url = shard_url(room_id)
+        r = self._redis.get(url)
+        if r is None:
+            r = self._redis[url] = async_redis(url)
+        return r
+
+    async def _advertise(self, room_id):
+        pipe = self._shard(room_id).pipeline()
+        pipe.sadd(relays_key(room_id), self.relay_channel)
+        pipe.expire(relays_key(room_id), RELAYS_TTL)
+        await pipe.execute()
+
+    async def _ensure_relay(self, layer):
+        if self.relay_channel is not None:
+            return
+        async with self._lock:
+            if self.relay_channel is None:
+                self.relay_channel = await layer.new_channel("fanout.relay")
+                self._tasks = [
+                    asyncio.create_task(self._pump(layer)),
+                    asyncio.create_task(self._refresh(layer)),
+                ]
+
+    async def _pump(self, layer):
+        while True:
+            event = await layer.receive(self.relay_channel)
+            targets = list(self.rooms.get(event.get("room"), ()))
+            if not targets:
+                continue
+            handler = event["type"].replace(".", "_")
+            results = await asyncio.gather(
+                *(getattr(c, handler)(event) for c in targets), return_exceptions=True
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    logger.warning("tiered fan-out delivery failed: %r", r)
+
+    async def _refresh(self, layer):
+        while True:
+            await asyncio.sleep(REFRESH_EVERY)
+            for room_id in list(self.rooms):
+                await self._advertise(room_id)
+                await layer.group_add(worker_group(room_id), self.relay_channel)
+
+
+def use_tiered(member_count):
+    threshold = settings.FANOUT_TIERED_THRESHOLD
+    return threshold > 0 and member_count >= threshold
+
+
+local_fanout = LocalFanout()
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from base.archive import pack
+from base.models import Message, MessageArchive
+from base.partitions import drop_empty_partitions_before, is_partitioned
+from studybud.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = "Move messages older than the archive age into compressed MessageArchive chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--chunk-size", type=int, default=settings.MESSAGE_ARCHIVE_CHUNK_SIZE)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timedelta(days=opts["older_than_days"])
+        chunk_size = opts["chunk_size"]
+
+        with use_primary():
+            old = Message.objects.filter(created__lt=cutoff)
+            room_ids = list(old.order_by().values_list("room_id", flat=True).distinct())
+            if opts["dry_run"]:
+                self.stdout.write(f"{old.count()} message(s) in {len(room_ids)} room(s) older than {cutoff:%Y-%m-%d}")
+                return
+
+            moved = chunks = 0
+            for room_id in room_ids:
+                while True:
+                    # oldest first so chunks are contiguous and never overlap
+                    batch = list(old.filter(room_id=room_id)
+                                 .select_related("user")
+                                 .order_by("created", "id")[:chunk_size])
+                    if not batch:
+                        break
+                    with transaction.atomic():
+                        chunk = MessageArchive.objects.create(
+                            room_id=room_id,
+                            start=batch[0].created,
+                            end=batch[-1].created,
+                            count=len(batch),
+                            min_id=min(m.id for m in batch),
+                            max_id=max(m.id for m in batch),
+                            payload=pack(reversed(batch)),
+                        )
+                        chunk.authors.set({m.user_id for m in batch})
+                        # moved, not deleted: skip the collector and delete signals.
+                        # The created bound lets PostgreSQL prune to old partitions.
+                        Message.objects.filter(
+                            id__in=[m.id for m in batch], created__lt=cutoff
+                        )._raw_delete(Message.objects.db)
+                    moved += len(batch)
+                    chunks += 1
+
+            dropped = []
+            if is_partitioned(connection):
+                dropped = drop_empty_partitions_before(connection, cutoff)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"archived {moved} message(s) into {chunks} chunk(s); dropped partitions: {', '.join(dropped) or 'none'}"
+        ))
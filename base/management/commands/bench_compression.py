@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+
+from base.api.renderers import FastJSONRenderer
+from base.compression import brotli, compress
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch pages in-process and report bytes saved and CPU cost per encoding, "
+        "plus stock vs orjson rendering time for JSON bodies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=["/api/rooms/", "/", "/activity/"])
+        parser.add_argument("--rounds", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        client = Client()
+        encodings = ["gzip"] + (["br"] if brotli is not None else [])
+        for path in opts["paths"]:
+            # no Accept-Encoding, so the middleware hands back the raw body
+            body = client.get(path).content
+            self.stdout.write(f"{path}  raw={len(body)}B")
+            for enc in encodings:
+                started = time.perf_counter()
+                for _ in range(opts["rounds"]):
+                    out = compress(body, enc)
+                us = (time.perf_counter() - started) * 1e6 / opts["rounds"]
+                saved = 100 * (1 - len(out) / max(1, len(body)))
+                self.stdout.write(f"  {enc:<5} {len(out):>8}B  saved={saved:5.1f}%  cpu={us:8.1f}us")
+
+            try:
+                data = json.loads(body)
+            except ValueError:
+                continue
+            for renderer in (JSONRenderer(), FastJSONRenderer()):
+                started = time.perf_counter()
+                for _ in range(opts["rounds"]):
+                    renderer.render(data)
+                us = (time.perf_counter() - started) * 1e6 / opts["rounds"]
+                self.stdout.write(f"  render {type(renderer).__name__:<17} {us:8.1f}us")
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from base.fanout import LocalFanout, worker_group
+from base.redis_client import async_redis
+from base.sharding import shard_url
+
+
+class _Socket:
+    """Stands in for a consumer: notes that the relay handed it the event."""
+
+    def __init__(self):
+        self.got = asyncio.Event()
+
+    async def chat_message(self, event):
+        self.got.set()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare direct (one group member per socket) and tiered (one relay per "
+        "worker, in-memory delivery) fan-out on the configured channel layer. "
+        "Workers are simulated in this process; the tiered run uses LocalFanout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=10000)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--messages", type=int, default=5)
+
+    def handle(self, *args, **opts):
+        async_to_sync(self._run)(opts["members"], opts["workers"], opts["messages"])
+
+    async def _run(self, members, workers, messages):
+        layer = get_channel_layer()
+        event = {"type": "chat.message", "room": 0, "message": {"body": "x" * 200}}
+
+        # ---------- direct ----------
+        group = "bench_direct"
+        channels = [await layer.new_channel() for _ in range(members)]
+        for ch in channels:
+            await layer.group_add(group, ch)
+        send_t, total_t = [], []
+        for _ in range(messages):
+            started = time.perf_counter()
+            await layer.group_send(group, event)
+            send_t.append(time.perf_counter() - started)
+            await asyncio.gather(*(layer.receive(ch) for ch in channels))
+            total_t.append(time.perf_counter() - started)
+        for ch in channels:
+            await layer.group_discard(group, ch)
+        self._report("direct", members, send_t, total_t)
+
+        # ---------- tiered ----------
+        # the shipped path: one LocalFanout per simulated worker, and the
+        # sender's tiered check plus group_send to the worker group
+        room_id = 0
+        per_worker = members // workers
+        sockets = [_Socket() for _ in range(per_worker * workers)]
+        fanouts = [LocalFanout() for _ in range(workers)]
+        for i, sock in enumerate(sockets):
+            await fanouts[i % workers].join(layer, room_id, sock)
+        sender, r = LocalFanout(), async_redis(shard_url(room_id))
+        event = dict(event, room=room_id)
+
+        send_t, total_t = [], []
+        try:
+            for _ in range(messages):
+                for sock in sockets:
+                    sock.got.clear()
+                started = time.perf_counter()
+                if await sender.tiered(r, room_id):
+                    await layer.group_send(worker_group(room_id), event)
+                send_t.append(time.perf_counter() - started)
+                await asyncio.gather(*(sock.got.wait() for sock in sockets))
+                total_t.append(time.perf_counter() - started)
+        finally:
+            for i, sock in enumerate(sockets):
+                await fanouts[i % workers].leave(layer, room_id, sock)
+            for fanout in fanouts:
+                await fanout.close()
+            await r.close()
+        self._report(f"tiered({workers} workers)", len(sockets), send_t, total_t)
+
+    def _report(self, mode, members, send_t, total_t):
+        avg = lambda xs: 1000 * sum(xs) / len(xs)
+        self.stdout.write(
+            f"{mode:<22} members={members:<6} sender_stall={avg(send_t):8.1f}ms "
+            f"all_delivered={avg(total_t):8.1f}ms"
+        )
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure password hashing cost per configured hasher (and PBKDF2 iteration "
+        "count) to size login workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=10, help="Hashes timed per setting")
+        parser.add_argument("--iterations", type=int, nargs="*", default=[],
+                            help="Extra PBKDF2 iteration counts to try, e.g. 600000 1000000")
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"{'hasher':<28}{'iterations':>12}{'ms/hash':>10}{'logins/s/core':>15}")
+        for path in settings.PASSWORD_HASHERS:
+            algorithm = path.rsplit(".", 1)[-1]
+            try:
+                hasher = get_hasher(self._algorithm(path))
+            except ValueError as exc:
+                # e.g. argon2/bcrypt libraries not installed
+                self.stdout.write(f"{algorithm:<28}{'-':>12}  skipped: {exc}")
+                continue
+
+            settings_to_try = [None]
+            if hasattr(hasher, "iterations"):
+                settings_to_try += [n for n in opts["iterations"] if n != hasher.iterations]
+            for iterations in settings_to_try:
+                ms = self._time(hasher, iterations, opts["rounds"])
+                label = iterations or getattr(hasher, "iterations", "-")
+                self.stdout.write(f"{algorithm:<28}{label:>12}{ms:>10.1f}{1000 / ms:>15.1f}")
+
+    def _algorithm(self, path):
+        from django.utils.module_loading import import_string
+        return import_string(path).algorithm
+
+    def _time(self, hasher, iterations, rounds):
+        salt = hasher.salt()
+        kwargs = {"iterations": iterations} if iterations else {}
+        hasher.encode("correct horse battery staple", salt, **kwargs)  # warm up
+        started = time.perf_counter()
+        for _ in range(rounds):
+            hasher.encode("correct horse battery staple", salt, **kwargs)
+        return (time.perf_counter() - started) * 1000 / rounds
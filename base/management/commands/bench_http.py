@@ -0,0 +1,57 @@
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GETs at a running server and report throughput and latency. "
+        "Run it against daphne before/after a change to compare, e.g. "
+        "`bench_http /api/rooms/1/messages /api/profiles/1/ --concurrency 200`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--header", action="append", default=[],
+                            help="Extra request header, e.g. 'Accept-Encoding: gzip'")
+
+    def handle(self, *args, **opts):
+        headers = dict(h.split(":", 1) for h in opts["header"])
+        headers = {k.strip(): v.strip() for k, v in headers.items()}
+        for path in opts["paths"]:
+            self._run(opts["base_url"] + path, headers, opts["concurrency"], opts["requests"])
+
+    def _run(self, url, headers, concurrency, total):
+        def fetch(_):
+            req = urllib.request.Request(url, headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as res:
+                    size = len(res.read())
+                    ok = res.status == 200
+            except Exception:
+                size, ok = 0, False
+            return time.perf_counter() - started, size, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(r[0] for r in results)
+        failed = sum(1 for r in results if not r[2])
+        avg_bytes = sum(r[1] for r in results) / max(1, total - failed)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f"{url}\n"
+            f"  {total / elapsed:8.1f} req/s  c={concurrency}  failed={failed}\n"
+            f"  p50={pct(0.50):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms  avg_body={avg_bytes:.0f}B"
+        )
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from studybud.db_pool import pool_stats
+
+
+class Command(BaseCommand):
+    help = "Hammer the database from many threads and report server connection counts and pool saturation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=64)
+        parser.add_argument("--seconds", type=float, default=20)
+        parser.add_argument("--sample-every", type=float, default=1.0)
+
+    def handle(self, *args, **opts):
+        if connection.vendor != "postgresql":
+            raise CommandError("The load test needs PostgreSQL (pg_stat_activity).")
+
+        stop = threading.Event()
+        done = [0]
+        errors = [0]
+        lock = threading.Lock()
+
+        def worker():
+            # every thread gets its own Django connection, exactly like the
+            # database_sync_to_async executor threads under ASGI
+            while not stop.is_set():
+                try:
+                    with connection.cursor() as cur:
+                        cur.execute("SELECT pg_sleep(0.005)")
+                    with lock:
+                        done[0] += 1
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                finally:
+                    # hands the connection back to the pool (or closes it without one)
+                    connection.close()
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(opts["threads"])]
+        for t in threads:
+            t.start()
+
+        samples = []
+        started = time.monotonic()
+        while time.monotonic() - started < opts["seconds"]:
+            time.sleep(opts["sample_every"])
+            backends = self._server_connections()
+            samples.append(backends)
+            stats = pool_stats().get("default", {})
+            self.stdout.write(
+                f"t={time.monotonic() - started:5.1f}s server_conns={backends} "
+                f"pool_size={stats.get('pool_size', '-')} available={stats.get('pool_available', '-')} "
+                f"waiting={stats.get('requests_waiting', '-')} queries={done[0]}"
+            )
+
+        stop.set()
+        for t in threads:
+            t.join()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{done[0]} queries in {elapsed:.1f}s ({done[0] / elapsed:.0f}/s), {errors[0]} errors; "
+            f"server connections min={min(samples)} max={max(samples)}"
+        ))
+
+    def _server_connections(self):
+        # sampled from the main thread; its own connection is excluded from the count
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            )
+            count = cur.fetchone()[0]
+        connection.close()
+        return count
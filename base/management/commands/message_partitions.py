@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from base.partitions import ensure_partitions, is_partitioned, months_in_default, next_month
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions of base_message (PostgreSQL). Run daily from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        if not is_partitioned(connection):
+            self.stdout.write("base_message is not partitioned on this database, nothing to do.")
+            return
+
+        now = datetime.now(timezone.utc)
+        end = now
+        for _ in range(opts["months_ahead"]):
+            end = next_month(end)
+        created = ensure_partitions(connection, now - timedelta(days=1), end)
+        # months whose rows arrived before their partition existed
+        for month in months_in_default(connection):
+            created += ensure_partitions(connection, month, month)
+        for name in created:
+            self.stdout.write(f"created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partition(s) created"))
@@ -0,0 +1,102 @@
+import re
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base.models import Room
+from base.sharding import HashRing, room_key
+
+PRESENCE_RE = re.compile(rb"^presence:room:(\d+):")
+
+
+def _urls(value):
+    return [u.strip() for u in value.split(",") if u.strip()]
+
+
+def _merge(src, dst, key):
+    """Union one key into dst, keeping its TTL. Safe to repeat."""
+    kind = src.type(key)
+    if kind == b"set":
+        values = src.smembers(key)
+        if values:
+            dst.sadd(key, *values)
+    elif kind == b"zset":
+        # channel group memberships, scored by join time
+        items = src.zrange(key, 0, -1, withscores=True)
+        if items:
+            dst.zadd(key, dict(items), gt=True)
+    elif kind == b"string":
+        value = src.get(key)
+        if value is None:
+            return False
+        dst.set(key, value, nx=True)
+    else:
+        return False
+    ttl = src.pttl(key)
+    if ttl > 0:
+        dst.pexpire(key, ttl)
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan or perform moving rooms' presence keys and channel groups when "
+        "REDIS_SHARD_URLS changes. Without --copy it only prints the plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="old", default=",".join(settings.REDIS_SHARD_URLS),
+                            help="Comma-separated old node list (default: current setting)")
+        parser.add_argument("--to", dest="new", required=True, help="Comma-separated new node list")
+        parser.add_argument("--copy", action="store_true", help="Merge moved keys into their new node")
+        parser.add_argument("--purge", action="store_true", help="With --copy, delete them from the old node")
+        parser.add_argument("--synthetic", type=int, default=0,
+                            help="Plan over room ids 1..N instead of the database")
+
+    def handle(self, *args, **opts):
+        old, new = HashRing(_urls(opts["old"])), HashRing(_urls(opts["new"]))
+        if opts["purge"] and not opts["copy"]:
+            raise CommandError("--purge only makes sense with --copy")
+
+        self._plan(old, new, opts["synthetic"])
+        if opts["copy"]:
+            # every node that may still hold keys; safe to run again
+            for url in dict.fromkeys(old.urls + new.urls):
+                self._move_from(url, new, opts["purge"])
+
+    def _plan(self, old, new, synthetic):
+        ids = range(1, synthetic + 1) if synthetic else Room.objects.values_list("id", flat=True).iterator()
+        total, moved, per_node = 0, 0, Counter()
+        for room_id in ids:
+            key = room_key(room_id)
+            dst = new.url(key)
+            per_node[dst] += 1
+            moved += old.url(key) != dst
+            total += 1
+        self.stdout.write(f"{moved}/{total} rooms move ({100 * moved / max(total, 1):.1f}%)")
+        for url in new.urls:
+            self.stdout.write(f"  {url}: {per_node[url]} rooms")
+
+    def _move_from(self, url, new, purge):
+        prefix = settings.CHANNEL_LAYERS["default"]["CONFIG"].get("prefix", "asgi")
+        group_re = re.compile(rb"^" + re.escape(prefix.encode()) + rb":group:room_(\d+)(?:_workers)?$")
+        src = redis.Redis.from_url(url)
+        targets = {}
+        copied = 0
+        for pattern, rx in ((b"presence:room:*", PRESENCE_RE), (f"{prefix}:group:room_*".encode(), group_re)):
+            for key in src.scan_iter(match=pattern, count=500):
+                m = rx.match(key)
+                if not m:
+                    continue
+                dst_url = new.url(room_key(int(m[1])))
+                if dst_url == url:
+                    continue
+                if dst_url not in targets:
+                    targets[dst_url] = redis.Redis.from_url(dst_url)
+                if _merge(src, targets[dst_url], key):
+                    copied += 1
+                    if purge:
+                        src.delete(key)
+        self.stdout.write(f"{url}: {'moved' if purge else 'copied'} {copied} keys")
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.rollups import recompute
+from studybud.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the activity rollups for the last N days straight from Message "
+        "(GROUP BY in the database) and move the incremental cursor to match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30,
+                            help="How far back to rebuild; older buckets are left alone")
+
+    def handle(self, *args, **opts):
+        start = timezone.now() - timedelta(days=opts["days"])
+        with use_primary():
+            rows = recompute(start)
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {rows} rollup row(s) since {start:%Y-%m-%d}"))
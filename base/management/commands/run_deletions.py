@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.deletion import claim_next, progress, run
+from studybud.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Work through queued room/user deletions in small chunks. "
+        "Use --loop to keep polling for new jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Rows per transaction (default: DELETION_CHUNK_SIZE)")
+        parser.add_argument("--loop", type=float, default=0,
+                            help="Seconds to wait when the queue is empty; 0 drains it once and exits")
+
+    def handle(self, *args, **opts):
+        while True:
+            with use_primary():
+                job = claim_next()
+            if job is None:
+                if not opts["loop"]:
+                    return
+                time.sleep(opts["loop"])
+                continue
+
+            started = time.monotonic()
+            ok = run(job, opts["chunk_size"])
+            with use_primary():
+                job.refresh_from_db()
+            report = progress(job)
+            self.stdout.write(
+                f"deletion {report['id']} ({report['kind']} {report['object_id']}): {report['status']} "
+                f"{report['deleted']}/{report['total']} rows in {time.monotonic() - started:.1f}s"
+                + ("" if ok else f" error={report['error']}")
+            )
@@ -0,0 +1,33 @@
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base.tracing import RATE_KEY, RATE_REFRESH
+
+
+class Command(BaseCommand):
+    help = "Show or change the chat tracing sample rate on every running worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("rate", nargs="?", help="0.0-1.0, or 'reset' to fall back to TRACE_SAMPLE_RATE")
+
+    def handle(self, *args, **opts):
+        r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        rate = opts["rate"]
+
+        if rate is None:
+            current = r.get(RATE_KEY)
+            self.stdout.write(f"override={current} default={settings.TRACE_SAMPLE_RATE}")
+            return
+
+        if rate == "reset":
+            r.delete(RATE_KEY)
+        else:
+            try:
+                value = float(rate)
+            except ValueError:
+                raise CommandError("rate must be a number between 0 and 1")
+            if not 0 <= value <= 1:
+                raise CommandError("rate must be a number between 0 and 1")
+            r.set(RATE_KEY, value)
+        self.stdout.write(self.style.SUCCESS(f"Workers pick this up within {RATE_REFRESH}s."))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.rollups import apply_new_changes, prune_hourly
+from studybud.db_router import use_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new messages from the room change log into the hourly/daily activity "
+        "rollups. Use --loop to keep following the log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=None,
+                            help="Changes per transaction (default: ROLLUP_BATCH_SIZE)")
+        parser.add_argument("--loop", type=float, default=0,
+                            help="Seconds to wait once caught up; 0 catches up once and exits")
+
+    def handle(self, *args, **opts):
+        while True:
+            started = time.monotonic()
+            folded = 0
+            with use_primary():
+                while n := apply_new_changes(opts["batch"]):
+                    folded += n
+                pruned = prune_hourly()
+            if folded or pruned or not opts["loop"]:
+                self.stdout.write(
+                    f"rollups: folded {folded} change(s), pruned {pruned} hourly row(s) "
+                    f"in {time.monotonic() - started:.1f}s"
+                )
+            if not opts["loop"]:
+                return
+            time.sleep(opts["loop"])
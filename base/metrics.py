@@ -0,0 +1,268 @@
+"""
+Tiny in-process metrics registry rendered in the Prometheus text format.
+
+Everything here is per worker process and kept deliberately cheap (a dict
+lookup and a lock per observation) so it can stay on all the time. Scrape
+each worker's ``/metrics`` and let Prometheus do the aggregation.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# anything else a client sends is counted as "other"
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for n, v in zip(names, values)
+    )
+    return "{%s}" % pairs
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_one(key, value))
+        return lines
+
+    def _render_one(self, key, value):
+        return [f"{self.name}{_label_str(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_one(self, key, state):
+        counts, total, n = state[0][:], state[1], state[2]
+        names = self.labelnames + ("le",)
+        lines, running = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            running += count
+            lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {running}")
+        base = _label_str(self.labelnames, key)
+        lines.append(f"{self.name}_sum{base} {total}")
+        lines.append(f"{self.name}_count{base} {n}")
+        return lines
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    _collect_pool_stats()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- HTTP ----------
+
+http_requests = _register(Counter(
+    "studybud_http_requests_total", "HTTP requests handled.", ("route", "method", "status")))
+http_latency = _register(Histogram(
+    "studybud_http_request_duration_seconds", "HTTP request latency.", ("route", "method")))
+http_inflight = _register(Gauge(
+    "studybud_http_requests_inflight", "HTTP requests currently being handled by this worker."))
+http_db_queries = _register(Histogram(
+    "studybud_http_db_queries", "DB queries issued per HTTP request.", ("route",), COUNT_BUCKETS))
+http_db_time = _register(Histogram(
+    "studybud_http_db_time_seconds", "Time spent in the DB per HTTP request.", ("route",)))
+
+# ---------- DB / Redis ----------
+
+db_queries = _register(Counter(
+    "studybud_db_queries_total", "DB queries executed.", ("alias",)))
+db_query_time = _register(Histogram(
+    "studybud_db_query_duration_seconds", "Single DB query latency.", ("alias",), FAST_BUCKETS))
+redis_calls = _register(Counter(
+    "studybud_redis_round_trips_total", "Redis round trips (a pipeline counts once).", ("command",)))
+redis_latency = _register(Histogram(
+    "studybud_redis_round_trip_seconds", "Redis round trip latency.", (), FAST_BUCKETS))
+
+# ---------- WebSockets ----------
+
+ws_open = _register(Gauge(
+    "studybud_websockets_open", "Open WebSocket connections in this worker."))
+ws_group_sends = _register(Counter(
+    "studybud_group_send_total", "channel_layer.group_send calls.", ("event",)))
+chat_deduplicated = _register(Counter(
+    "studybud_chat_deduplicated_total", "Chat frames answered from the client_msg_id window.", ("outcome",)))
+presence_broadcast = _register(Histogram(
+    "studybud_presence_broadcast_seconds", "Time to build and send a presence snapshot.", (), FAST_BUCKETS))
+db_pool = _register(Gauge(
+    "studybud_db_pool", "Connection pool state (pool_size, pool_available, requests_waiting, ...).",
+    ("alias", "stat")))
+
+
+def _collect_pool_stats():
+    from studybud.db_pool import pool_stats
+    for alias, stats in pool_stats().items():
+        for stat, value in stats.items():
+            db_pool.set(value, alias=alias, stat=stat)
+
+
+# ---------- query accounting ----------
+
+# (queries, seconds) accumulated for the request currently being handled
+_request_db = ContextVar("request_db", default=None)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    alias = context["connection"].alias
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        db_queries.inc(alias=alias)
+        db_query_time.observe(elapsed, alias=alias)
+        acc = _request_db.get()
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += elapsed
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver: time every query on every connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+class MetricsMiddleware:
+    """Per-route latency, status and DB usage. Works in sync and async stacks."""
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            acc = self._end(token)
+        self._finish(request, response, started, acc)
+        return response
+
+    async def __acall__(self, request):
+        token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            acc = self._end(token)
+        self._finish(request, response, started, acc)
+        return response
+
+    def _start(self):
+        http_inflight.inc()
+        return _request_db.set([0, 0.0]), time.perf_counter()
+
+    def _end(self, token):
+        http_inflight.dec()
+        acc = _request_db.get()
+        _request_db.reset(token)
+        return acc
+
+    def _finish(self, request, response, started, acc):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        # the route pattern, not the path, keeps label cardinality bounded
+        route = match.route if match is not None else "unmatched"
+        # likewise the method, which the client picks freely
+        method = request.method if request.method in HTTP_METHODS else "other"
+        http_requests.inc(route=route, method=method, status=response.status_code)
+        http_latency.observe(elapsed, route=route, method=method)
+        http_db_queries.observe(acc[0], route=route)
+        http_db_time.observe(acc[1], route=route)
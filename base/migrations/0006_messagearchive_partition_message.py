@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def partition_messages(apps, schema_editor):
+    # PostgreSQL only; SQLite keeps the plain table
+    from base.partitions import is_partitioned, partition_message_table
+
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql" and not is_partitioned(connection):
+        partition_message_table(connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0005_alter_profile_profile_img"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("count", models.PositiveIntegerField()),
+                ("payload", models.BinaryField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archives",
+                        to="base.room",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-end"],
+                "indexes": [
+                    models.Index(
+                        fields=["room", "-end"], name="archive_room_end_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(partition_messages, migrations.RunPython.noop),
+    ]
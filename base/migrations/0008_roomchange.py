@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0007_room_deleted_at_deletionjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoomChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("message.created", "message.created"),
+                            ("message.updated", "message.updated"),
+                            ("message.deleted", "message.deleted"),
+                            ("room.updated", "room.updated"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("created", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="base.room",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["room", "id"], name="roomchange_room_id_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-20 09:00
+
+from django.db import migrations, models
+
+
+def fill_id_bounds(apps, schema_editor):
+    from base.archive import unpack
+
+    MessageArchive = apps.get_model("base", "MessageArchive")
+    for chunk in MessageArchive.objects.filter(min_id__isnull=True).iterator():
+        ids = [row["id"] for row in unpack(chunk.payload)]
+        if ids:
+            chunk.min_id, chunk.max_id = min(ids), max(ids)
+            chunk.save(update_fields=["min_id", "max_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0009_activityrollup_rollupcursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagearchive",
+            name="min_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="messagearchive",
+            name="max_id",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="messagearchive",
+            index=models.Index(fields=["max_id"], name="archive_max_id_idx"),
+        ),
+        migrations.RunPython(fill_id_bounds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-20 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_authors(apps, schema_editor):
+    from base.archive import _rewrite, unpack
+
+    MessageArchive = apps.get_model("base", "MessageArchive")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Author = MessageArchive.authors.through
+    for chunk in MessageArchive.objects.iterator():
+        rows = unpack(chunk.payload)
+        user_ids = {row["user"] for row in rows}
+        existing = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+        if existing != user_ids:
+            # users deleted before this migration left their archived rows behind
+            rows = [row for row in rows if row["user"] in existing]
+            _rewrite(chunk, rows)
+            if not rows:
+                continue
+        Author.objects.bulk_create(
+            [Author(messagearchive_id=chunk.id, user_id=uid) for uid in existing],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0010_messagearchive_id_bounds"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagearchive",
+            name="authors",
+            field=models.ManyToManyField(blank=True, related_name="archived_chunks", to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_authors, migrations.RunPython.noop),
+    ]
@@ -4,12 +4,25 @@ from cloudinary_storage.storage import MediaCloudinaryStorage
 # For user built in diff import
 # Create your models here.
 
+class TopicQuerySet(models.QuerySet):
+    def with_room_count(self):
+        # rooms queued for deletion no longer count
+        return self.annotate(room_count=models.Count('room', filter=models.Q(room__deleted_at__isnull=True)))
+
 class Topic(models.Model):
     name = models.CharField(max_length=200)
 
+    objects = TopicQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+class LiveRoomManager(models.Manager):
+    # rooms queued for background deletion disappear from every listing and
+    # lookup at once; Room.all_objects still sees them (see base/deletion.py)
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Room(models.Model):
     host = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     topic = models.ForeignKey(Topic, on_delete=models.SET_NULL, null=True)
@@ -23,6 +36,10 @@ class Room(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     # Should specify a more complex ID for other projects
     # auto_now_add is for create timeStamp
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveRoomManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ['-updated', '-created']
@@ -31,6 +48,11 @@ class Room(models.Model):
     def __str__(self):
         return self.name
       
+class MessageQuerySet(models.QuerySet):
+    def in_live_rooms(self):
+        # a hidden room's messages stay until its deletion job drains them
+        return self.filter(room__deleted_at__isnull=True)
+
 class Message(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
@@ -40,6 +62,8 @@ class Message(models.Model):
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated', '-created']
 
@@ -49,10 +73,120 @@ class Message(models.Model):
 def profile_upload_path(instance, filename):
     return f"profiles/user_{instance.user_id}/{filename}"
 
+class ProfileManager(models.Manager):
+    def for_user(self, user):
+        # lazy fallback for users that somehow have no profile row yet
+        profile, _ = self.get_or_create(user=user)
+        return profile
+
+    def ensure_for(self, users):
+        # one INSERT for a whole batch, e.g. after User.objects.bulk_create()
+        return self.bulk_create([Profile(user=u) for u in users], ignore_conflicts=True)
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     profile_img = models.ImageField(storage=MediaCloudinaryStorage(), blank=True, null=True)
     # add more fields if you like, e.g. bio = models.TextField(blank=True)
 
+    objects = ProfileManager()
+
+    def __str__(self):
+        return f"{self.user.username}'s profile"
+
+class MessageArchive(models.Model):
+    # Cold storage for old messages: a zlib-compressed JSON list (newest first)
+    # of up to ARCHIVE_CHUNK_SIZE messages from one room, see base/archive.py
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="archives")
+    start = models.DateTimeField()  # oldest message in the chunk
+    end = models.DateTimeField()    # newest message in the chunk
+    count = models.PositiveIntegerField()
+    # id bounds, so a single archived message can be found without unpacking every chunk
+    min_id = models.BigIntegerField(null=True)
+    max_id = models.BigIntegerField(null=True)
+    # who wrote the chunk's messages, so deleting a user finds their archived rows
+    authors = models.ManyToManyField(User, related_name='archived_chunks', blank=True)
+    payload = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-end']
+        indexes = [
+            models.Index(fields=['room', '-end'], name='archive_room_end_idx'),
+            models.Index(fields=['max_id'], name='archive_max_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id}: {self.count} messages up to {self.end:%Y-%m-%d}"
+
+
+class DeletionJob(models.Model):
+    # A room or user being deleted in the background, chunk by chunk
+    ROOM, USER = "room", "user"
+    KINDS = [(ROOM, "Room"), (USER, "User")]
+    PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+    STATUSES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    kind = models.CharField(max_length=8, choices=KINDS)
+    object_id = models.BigIntegerField()
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="+")
+    status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+    total = models.PositiveIntegerField(default=0)    # dependent rows counted when queued
+    deleted = models.PositiveIntegerField(default=0)  # dependent rows removed so far
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created']
+        indexes = [models.Index(fields=['status', 'created'], name='deletionjob_status_idx')]
+
     def __str__(self):
-        return f"{self.user.username}'s profile"
\ No newline at end of file
+        return f"delete {self.kind} {self.object_id}: {self.status}"
+
+class RoomChange(models.Model):
+    # Append-only log behind GET /api/rooms/<pk>/changes; the id is the sync cursor
+    MESSAGE_CREATED = "message.created"
+    MESSAGE_UPDATED = "message.updated"
+    MESSAGE_DELETED = "message.deleted"   # tombstone
+    ROOM_UPDATED = "room.updated"
+    KINDS = [(k, k) for k in (MESSAGE_CREATED, MESSAGE_UPDATED, MESSAGE_DELETED, ROOM_UPDATED)]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="changes")
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.BigIntegerField()  # message id, or the room id for room.updated
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['room', 'id'], name='roomchange_room_id_idx')]
+
+    def __str__(self):
+        return f"{self.room_id} #{self.id}: {self.kind} {self.object_id}"
+
+class ActivityRollup(models.Model):
+    # Message counts per room/topic/user per hour and per day, see base/rollups.py
+    ROOM, TOPIC, USER = "room", "topic", "user"
+    SCOPES = [(ROOM, "Room"), (TOPIC, "Topic"), (USER, "User")]
+    HOUR, DAY = "hour", "day"
+    GRANULARITIES = [(HOUR, "Hour"), (DAY, "Day")]
+
+    scope = models.CharField(max_length=5, choices=SCOPES)
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    object_id = models.BigIntegerField()
+    bucket = models.DateTimeField()  # start of the hour/day, UTC
+    messages = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the lookup path for one object's series (sparklines)
+            models.UniqueConstraint(fields=['scope', 'granularity', 'object_id', 'bucket'], name='rollup_unique'),
+        ]
+        indexes = [models.Index(fields=['scope', 'granularity', 'bucket'], name='rollup_scope_bucket_idx')]
+
+    def __str__(self):
+        return f"{self.scope} {self.object_id} {self.granularity} {self.bucket:%Y-%m-%d %H:00}: {self.messages}"
+
+class RollupCursor(models.Model):
+    # how far into the RoomChange log the incremental rollup has got
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
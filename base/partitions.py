@@ -0,0 +1,169 @@
+"""
+Monthly range partitioning of ``base_message`` on PostgreSQL.
+
+Migration 0006 turns ``base_message`` into a table partitioned by ``created``
+with one partition per month (``base_message_pYYYYMM``) plus a default
+partition. Run ``manage.py message_partitions`` from cron so upcoming months
+always exist before rows arrive; rows that landed in the default partition
+anyway are moved into their month's partition when it is created. On other
+databases every helper is a no-op.
+"""
+
+import re
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+TABLE = "base_message"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(r"^base_message_p(\d{4})(\d{2})$")
+
+
+def month_floor(dt):
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(dt):
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cur.fetchone() is not None
+
+
+def ensure_partitions(connection, start, end):
+    """Create monthly partitions covering [start, end]. Returns the names created."""
+    created = []
+    month = month_floor(start)
+    with connection.cursor() as cur:
+        while month <= end:
+            name = partition_name(month)
+            cur.execute("SELECT to_regclass(%s)", [name])
+            if cur.fetchone()[0] is None:
+                with transaction.atomic(using=connection.alias):
+                    _create_partition(cur, name, month)
+                created.append(name)
+            month = next_month(month)
+    return created
+
+
+def _create_partition(cur, name, month):
+    bounds = [month, next_month(month)]
+    cur.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+    has_default = cur.fetchone()[0] is not None
+    if has_default:
+        cur.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "created" >= %s AND "created" < %s)',
+            bounds,
+        )
+        has_default = cur.fetchone()[0]
+    if not has_default:
+        cur.execute(f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)', bounds)
+        return
+    # PostgreSQL refuses a partition whose range has rows in the default
+    # partition: build the month's table, move those rows in, then attach it
+    cur.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cur.execute(
+        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE "created" >= %s AND "created" < %s RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved',
+        bounds,
+    )
+    cur.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def months_in_default(connection):
+    """Months that have rows sitting in the default partition."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+        if cur.fetchone()[0] is None:
+            return []
+        cur.execute(
+            f"SELECT DISTINCT date_trunc('month', \"created\" AT TIME ZONE 'UTC') FROM \"{DEFAULT_PARTITION}\""
+        )
+        return sorted(row[0].replace(tzinfo=timezone.utc) for row in cur.fetchall())
+
+
+def monthly_partitions(connection):
+    """[(name, month_start)] for every monthly partition, oldest first."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cur.fetchall()]
+    result = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            result.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)))
+    return sorted(result, key=lambda p: p[1])
+
+
+def drop_empty_partitions_before(connection, cutoff):
+    """Detach and drop monthly partitions that end before cutoff and hold no rows."""
+    dropped = []
+    for name, month in monthly_partitions(connection):
+        if next_month(month) > cutoff:
+            break
+        with connection.cursor() as cur:
+            cur.execute(f'SELECT EXISTS (SELECT 1 FROM "{name}")')
+            if cur.fetchone()[0]:
+                continue
+            cur.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cur.execute(f'DROP TABLE "{name}"')
+        dropped.append(name)
+    return dropped
+
+
+def partition_message_table(connection):
+    """One-off conversion of an existing base_message into a partitioned table."""
+    with connection.cursor() as cur:
+        cur.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{TABLE}_unpartitioned"')
+        cur.execute(f"""
+            CREATE TABLE "{TABLE}" (
+                "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+                "body" text NOT NULL,
+                "updated" timestamp with time zone NOT NULL,
+                "created" timestamp with time zone NOT NULL,
+                "room_id" bigint NOT NULL
+                    REFERENCES "base_room" ("id") DEFERRABLE INITIALLY DEFERRED,
+                "user_id" integer NOT NULL
+                    REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED,
+                PRIMARY KEY ("id", "created")
+            ) PARTITION BY RANGE ("created")
+        """)
+        cur.execute(f'CREATE INDEX "{TABLE}_room_created" ON "{TABLE}" ("room_id", "created" DESC)')
+        cur.execute(f'CREATE INDEX "{TABLE}_user_created" ON "{TABLE}" ("user_id", "created" DESC)')
+        cur.execute(f'CREATE INDEX "{TABLE}_created" ON "{TABLE}" ("created" DESC)')
+        cur.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+        cur.execute(f'SELECT MIN("created"), MAX("created") FROM "{TABLE}_unpartitioned"')
+        oldest, newest = cur.fetchone()
+        now = datetime.now(timezone.utc)
+        ensure_partitions(connection, oldest or now, max(newest or now, now))
+
+        cur.execute(f"""
+            INSERT INTO "{TABLE}" ("id", "body", "updated", "created", "room_id", "user_id")
+            SELECT "id", "body", "updated", "created", "room_id", "user_id"
+            FROM "{TABLE}_unpartitioned"
+        """)
+        cur.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+            f'COALESCE((SELECT MAX("id") FROM "{TABLE}"), 0) + 1, false)',
+            [TABLE],
+        )
+        cur.execute(f'DROP TABLE "{TABLE}_unpartitioned"')
@@ -0,0 +1,170 @@
+"""
+Redis presence keyspace shared by RoomConsumer and the background sweeper.
+
+Per room:
+  presence:room:<id>:members            SET of user ids with an open socket
+  presence:room:<id>:user:<uid>:count   INT open sockets (tabs) for that user
+  presence:room:<id>:user:<uid>:hb      heartbeat, expires after HEARTBEAT_TTL
+
+A socket that dies without ``disconnect`` running leaves its member and count
+behind. ``PresenceSweeper`` finds them with SCAN and removes any entry whose
+heartbeat has expired.
+
+``online_counts`` reads live counts for many rooms at once, for room lists.
+"""
+
+import re
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+HEARTBEAT_TTL = 70
+# safety net for counters: refreshed on every heartbeat, so only dead ones expire
+COUNT_TTL = 15 * 60
+
+MEMBERS_RE = re.compile(r"^presence:room:(\d+):members$")
+COUNT_RE = re.compile(r"^presence:room:(\d+):user:(\d+):count$")
+SWEEP_CURSOR_KEY = "presence:sweep:cursor"
+
+def room_presence_keys(room_id, user_id=None):
+    base = f"presence:room:{room_id}"
+    return {
+        "members": f"{base}:members",                          # SET of user_ids (strings)
+        "counts":  f"{base}:user:{user_id}:count" if user_id else None,  # INT counter per user
+        "heartbeat": f"{base}:user:{user_id}:hb" if user_id else None,   # expiring liveness flag
+    }
+
+def heartbeat_key(room_id, user_id):
+    return f"presence:room:{room_id}:user:{user_id}:hb"
+
+
+# Removes a user's presence only if their heartbeat is still gone at the moment
+# of removal, so a reconnect racing the sweeper is never wiped out.
+# KEYS: members, count, heartbeat. ARGV: user id. Returns [srem, del].
+_REAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+  return {0, 0}
+end
+return {redis.call('SREM', KEYS[1], ARGV[1]), redis.call('DEL', KEYS[2])}
+"""
+
+
+class PresenceSweeper:
+    """
+    Incremental, rate-limited reconciliation of the presence keyspace.
+
+    Each ``step`` resumes the SCAN from the cursor saved in Redis, so runs can
+    be short and frequent. Running it twice (or on two hosts) is harmless:
+    every removal re-checks the heartbeat atomically.
+    """
+
+    def __init__(self, r, batch=200, max_keys_per_sec=2000):
+        self.r = r
+        self.batch = batch
+        self.max_keys_per_sec = max_keys_per_sec
+        self._reap = r.register_script(_REAP_SCRIPT)
+
+    def step(self):
+        """One SCAN page. Returns (finished_full_pass, report)."""
+        report = {"keys_scanned": 0, "rooms": 0, "members_removed": 0, "counters_removed": 0}
+        cursor = int(self.r.get(SWEEP_CURSOR_KEY) or 0)
+        cursor, keys = self.r.scan(cursor=cursor, match="presence:room:*", count=self.batch)
+        report["keys_scanned"] = len(keys)
+
+        for key in keys:
+            if m := MEMBERS_RE.match(key):
+                report["rooms"] += 1
+                self._sweep_members(m[1], report)
+            elif m := COUNT_RE.match(key):
+                self._sweep_counter(m[1], m[2], report)
+
+        self.r.set(SWEEP_CURSOR_KEY, cursor)
+        return cursor == 0, report
+
+    def _sweep_members(self, room_id, report):
+        keys = room_presence_keys(room_id)
+        user_ids = self.r.smembers(keys["members"])
+        if not user_ids:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.exists(heartbeat_key(room_id, uid))
+        alive = pipe.execute()
+        for uid, ok in zip(user_ids, alive):
+            if not ok:
+                self._reap_user(room_id, uid, report)
+
+    def _sweep_counter(self, room_id, user_id, report):
+        # counters can outlive their membership entry (e.g. a crash mid-disconnect)
+        if not self.r.exists(heartbeat_key(room_id, user_id)):
+            self._reap_user(room_id, user_id, report)
+
+    def _reap_user(self, room_id, user_id, report):
+        keys = room_presence_keys(room_id, user_id)
+        removed_member, removed_count = self._reap(
+            keys=[keys["members"], keys["counts"], keys["heartbeat"]], args=[user_id]
+        )
+        report["members_removed"] += removed_member
+        report["counters_removed"] += removed_count
+
+    def run_pass(self, on_step=None):
+        """Sweep the whole keyspace once, pacing SCAN pages to max_keys_per_sec."""
+        totals = {}
+        while True:
+            started = time.monotonic()
+            finished, report = self.step()
+            for k, v in report.items():
+                totals[k] = totals.get(k, 0) + v
+            if on_step:
+                on_step(report)
+            if finished:
+                return totals
+            budget = report["keys_scanned"] / self.max_keys_per_sec
+            time.sleep(max(0.0, budget - (time.monotonic() - started)))
+
+
+# Live members of one room: members whose heartbeat still exists.
+# KEYS: members. ARGV: heartbeat key prefix ("presence:room:<id>:user:").
+_LIVE_COUNT_SCRIPT = """
+local n = 0
+for _, uid in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+  n = n + redis.call('EXISTS', ARGV[1] .. uid .. ':hb')
+end
+return n
+"""
+
+
+def online_counts(room_ids):
+    """
+    room id -> users online now, for many rooms. Misses in the shared cache
+    (PRESENCE_COUNT_CACHE_TTL) cost one pipelined round trip per shard.
+    """
+    from .redis_client import sync_redis
+    from .sharding import shard_url
+
+    room_ids = list(dict.fromkeys(int(i) for i in room_ids))
+    cached = cache.get_many([f"presence:online:{i}" for i in room_ids]) if room_ids else {}
+    counts = {i: cached[f"presence:online:{i}"] for i in room_ids if f"presence:online:{i}" in cached}
+
+    by_shard = defaultdict(list)
+    for room_id in room_ids:
+        if room_id not in counts:
+            by_shard[shard_url(room_id)].append(room_id)
+
+    fresh = {}
+    for url, ids in by_shard.items():
+        # plain EVAL: a Script object would add a SCRIPT EXISTS round trip per pipeline
+        pipe = sync_redis(url).pipeline(transaction=False)
+        for room_id in ids:
+            pipe.eval(
+                _LIVE_COUNT_SCRIPT, 1,
+                room_presence_keys(room_id)["members"], f"presence:room:{room_id}:user:",
+            )
+        fresh.update(zip(ids, (int(n) for n in pipe.execute())))
+
+    if fresh:
+        cache.set_many({f"presence:online:{i}": n for i, n in fresh.items()}, settings.PRESENCE_COUNT_CACHE_TTL)
+        counts.update(fresh)
+    return counts
@@ -0,0 +1,156 @@
+"""
+Opt-in statistical profiler for live requests and RoomConsumer handlers.
+
+A background thread samples Python stacks every ``PROFILE_INTERVAL`` seconds
+while the profiled work runs and writes them in the collapsed ("folded")
+format that flamegraph.pl, speedscope and inferno read directly.
+
+Nothing is sampled unless profiling is armed for a request:
+  - the request falls into the random ``PROFILE_SAMPLE_RATE`` slice, or
+  - a superuser sends ``X-Profile: 1`` or ``?__profile=1``.
+When it isn't armed, the only cost is one float compare and one header
+lookup; the user is only loaded for requests that ask to be profiled.
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "__profile"
+
+
+class Sampler:
+    """Samples one thread (sync code) or every thread (async code that hops threads)."""
+
+    def __init__(self, thread_id=None, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or settings.PROFILE_INTERVAL
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self.samples[self._fold(frame)] += 1
+                continue
+            for ident, frame in frames.items():
+                if ident != own:
+                    prefix = names.get(ident, str(ident))
+                    self.samples[prefix + ";" + self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+
+def write_folded(samples, label):
+    if not samples:
+        return None
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:80] or "root"
+    path = os.path.join(settings.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{slug}.folded")
+    with open(path, "w", encoding="utf-8") as fh:
+        for stack, count in samples.most_common():
+            fh.write(f"{stack} {count}\n")
+    return path
+
+
+@contextmanager
+def profile(label):
+    """Profile the calling thread for the duration of the block."""
+    sampler = Sampler(thread_id=threading.get_ident()).start()
+    try:
+        yield
+    finally:
+        write_folded(sampler.stop(), label)
+
+
+@asynccontextmanager
+async def aprofile(label):
+    """Profile async work; samples every thread because awaited sync code runs elsewhere."""
+    sampler = Sampler().start()
+    try:
+        yield
+    finally:
+        # joining the sampler and writing the file would block the event loop
+        await sync_to_async(_finish, thread_sensitive=False)(sampler, label)
+
+
+def _finish(sampler, label):
+    return write_folded(sampler.stop(), label)
+
+
+def sampled(rate):
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    """Must sit below AuthenticationMiddleware so the superuser check can see request.user."""
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._armed(request):
+            return self.get_response(request)
+        with profile(f"{request.method} {request.path}"):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not await self._aarmed(request):
+            return await self.get_response(request)
+        async with aprofile(f"{request.method} {request.path}"):
+            return await self.get_response(request)
+
+    def _requested(self, request):
+        return PROFILE_HEADER in request.META or PROFILE_PARAM in request.GET
+
+    # the random slice applies to everyone, asking for a profile only adds to it
+    def _armed(self, request):
+        if sampled(settings.PROFILE_SAMPLE_RATE):
+            return True
+        return self._requested(request) and request.user.is_superuser
+
+    async def _aarmed(self, request):
+        if sampled(settings.PROFILE_SAMPLE_RATE):
+            return True
+        if not self._requested(request):
+            return False
+        user = await request.auser()
+        return user.is_superuser
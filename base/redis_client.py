@@ -0,0 +1,82 @@
+import time
+
+import redis
+from django.conf import settings
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from . import metrics
+
+
+class _InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            metrics.redis_calls.inc(command="PIPELINE")
+            metrics.redis_latency.observe(time.perf_counter() - started)
+
+
+class InstrumentedRedis(Redis):
+    """redis.asyncio client that counts every round trip for /metrics."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            metrics.redis_calls.inc(command=str(args[0]).upper())
+            metrics.redis_latency.observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def async_redis(url=None):
+    return InstrumentedRedis.from_url(
+        url or settings.REDIS_URL, encoding="utf-8", decode_responses=True
+    )
+
+
+class _InstrumentedSyncPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.redis_calls.inc(command="PIPELINE")
+            metrics.redis_latency.observe(time.perf_counter() - started)
+
+
+class InstrumentedSyncRedis(redis.Redis):
+    """Blocking twin of InstrumentedRedis for sync views."""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.redis_calls.inc(command=str(args[0]).upper())
+            metrics.redis_latency.observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _InstrumentedSyncPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+_sync_clients = {}
+
+
+def sync_redis(url=None):
+    """Process-wide client per URL (default REDIS_URL); its connection pool is thread-safe."""
+    url = url or settings.REDIS_URL
+    client = _sync_clients.get(url)
+    if client is None:
+        client = _sync_clients[url] = InstrumentedSyncRedis.from_url(
+            url, encoding="utf-8", decode_responses=True
+        )
+    return client
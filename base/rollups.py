@@ -0,0 +1,176 @@
+"""
+Hourly and daily message counts per room, topic and user.
+
+ActivityRollup rows are kept up to date from the RoomChange log, not from the
+chat hot path:
+
+  - ``apply_new_changes`` (``manage.py update_rollups --loop``) reads the
+    ``message.created`` changes after the stored RollupCursor, looks up those
+    messages in one query, and adds the counts with a single upsert per
+    batch. The cursor moves in the same transaction, so every message is
+    counted exactly once.
+  - ``recompute`` (``manage.py recompute_rollups``) rebuilds a time range
+    with GROUP BY queries on Message and resets the cursor to match. Use it
+    after a backfill or to repair drift.
+
+Counts measure activity: deleting a message later does not un-count it.
+Messages moved to the archive are counted for as long as their range is not
+recomputed.
+
+Reads (``series``, ``trending_topics``) only touch ActivityRollup.
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .changes import settled_before
+from .models import ActivityRollup, Message, RollupCursor, RoomChange, Topic
+
+CURSOR = "messages"
+STEP = {ActivityRollup.HOUR: timedelta(hours=1), ActivityRollup.DAY: timedelta(days=1)}
+
+
+def floor(dt, granularity):
+    dt = dt.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if granularity == ActivityRollup.DAY else dt
+
+
+# ---------- writes ----------
+
+def _upsert(counts):
+    """Add counts {(scope, object_id, granularity, bucket): n} in one statement per batch."""
+    if not counts:
+        return
+    table = connection.ops.quote_name(ActivityRollup._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    # same ON CONFLICT syntax on PostgreSQL and SQLite
+    sql = (
+        f"INSERT INTO {table} (scope, object_id, granularity, bucket, messages) "
+        f"VALUES (%s, %s, %s, %s, %s) "
+        f"ON CONFLICT (scope, granularity, object_id, bucket) "
+        f"DO UPDATE SET messages = {table}.messages + EXCLUDED.messages"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (scope, object_id, granularity, adapt(bucket), n)
+            for (scope, object_id, granularity, bucket), n in counts.items()
+        ])
+
+
+def apply_new_changes(batch=None):
+    """Fold the next batch of new messages into the rollups; returns how many changes were read."""
+    batch = batch or settings.ROLLUP_BATCH_SIZE
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR)
+        changes = list(RoomChange.objects
+                       .filter(id__gt=cursor.position, created__lt=settled_before(),
+                               kind=RoomChange.MESSAGE_CREATED)
+                       .order_by("id")
+                       .values_list("id", "object_id")[:batch])
+        if not changes:
+            return 0
+
+        counts = Counter()
+        # messages deleted since are skipped; their rooms may be gone already
+        for room_id, topic_id, user_id, created in (Message.objects
+                                                    .filter(id__in=[oid for _, oid in changes])
+                                                    .values_list("room_id", "room__topic_id", "user_id", "created")):
+            for granularity in (ActivityRollup.HOUR, ActivityRollup.DAY):
+                bucket = floor(created, granularity)
+                counts[(ActivityRollup.ROOM, room_id, granularity, bucket)] += 1
+                counts[(ActivityRollup.USER, user_id, granularity, bucket)] += 1
+                if topic_id:
+                    counts[(ActivityRollup.TOPIC, topic_id, granularity, bucket)] += 1
+        _upsert(counts)
+
+        cursor.position = changes[-1][0]
+        cursor.save(update_fields=["position", "updated"])
+    return len(changes)
+
+
+def recompute(start):
+    """
+    Rebuild every rollup from ``start`` (floored to the day) on, straight
+    from Message, and move the cursor past the changes this already covers.
+    """
+    start = floor(start, ActivityRollup.DAY)
+    until = settled_before()
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR)
+        ActivityRollup.objects.filter(bucket__gte=start).delete()
+
+        messages = Message.objects.filter(created__gte=start, created__lt=until).order_by()
+        rows = []
+        for granularity, trunc in ((ActivityRollup.HOUR, TruncHour), (ActivityRollup.DAY, TruncDay)):
+            for scope, field in ((ActivityRollup.ROOM, "room_id"),
+                                 (ActivityRollup.TOPIC, "room__topic_id"),
+                                 (ActivityRollup.USER, "user_id")):
+                grouped = (messages.exclude(**{f"{field}__isnull": True})
+                           .annotate(b=trunc("created", tzinfo=dt_timezone.utc))
+                           .values(field, "b")
+                           .annotate(n=Count("id"))
+                           .values_list(field, "b", "n"))
+                rows += [ActivityRollup(scope=scope, granularity=granularity, object_id=oid, bucket=b, messages=n)
+                         for oid, b, n in grouped]
+        ActivityRollup.objects.bulk_create(rows, batch_size=1000)
+
+        cursor.position = (RoomChange.objects.filter(created__lt=until)
+                           .order_by("-id").values_list("id", flat=True).first()) or 0
+        cursor.save(update_fields=["position", "updated"])
+    return len(rows)
+
+
+def prune_hourly():
+    """Hourly rows only matter for recent windows; days are kept."""
+    cutoff = timezone.now() - timedelta(days=settings.ROLLUP_HOURLY_RETENTION_DAYS)
+    deleted, _ = ActivityRollup.objects.filter(
+        granularity=ActivityRollup.HOUR, bucket__lt=cutoff
+    ).delete()
+    return deleted
+
+
+# ---------- reads ----------
+
+def series(scope, object_id, granularity, span):
+    """The last ``span`` buckets up to now, oldest first, with empty buckets filled in."""
+    end = floor(timezone.now(), granularity)
+    start = end - STEP[granularity] * (span - 1)
+    counts = dict(ActivityRollup.objects
+                  .filter(scope=scope, granularity=granularity, object_id=object_id,
+                          bucket__gte=start, bucket__lte=end)
+                  .values_list("bucket", "messages"))
+    return [
+        {"bucket": (start + STEP[granularity] * i).isoformat(),
+         "messages": counts.get(start + STEP[granularity] * i, 0)}
+        for i in range(span)
+    ]
+
+
+def trending_topics(hours, limit):
+    """
+    Topics ranked by how much their message count rose in the last ``hours``
+    compared with the ``hours`` before.
+    """
+    now = floor(timezone.now(), ActivityRollup.HOUR)
+    window = now - timedelta(hours=hours - 1)
+    previous = window - timedelta(hours=hours)
+
+    recent, before = defaultdict(int), defaultdict(int)
+    for topic_id, bucket, n in (ActivityRollup.objects
+                                .filter(scope=ActivityRollup.TOPIC, granularity=ActivityRollup.HOUR,
+                                        bucket__gte=previous)
+                                .values_list("object_id", "bucket", "messages")):
+        (recent if bucket >= window else before)[topic_id] += n
+
+    ranked = sorted(recent, key=lambda t: (recent[t] - before[t], recent[t]), reverse=True)[:limit]
+    names = dict(Topic.objects.filter(id__in=ranked).values_list("id", "name"))
+    return [
+        {"id": t, "name": names[t], "messages": recent[t], "previous": before[t], "rise": recent[t] - before[t]}
+        for t in ranked if t in names
+    ]
@@ -1,6 +1,7 @@
 from django.urls import re_path
-from .consumers import RoomConsumer
+from .consumers import RoomConsumer, MultiRoomConsumer
 
 websocket_urlpatterns = [
     re_path(r"^ws/rooms/(?P<room_id>\d+)/$", RoomConsumer.as_asgi()),
-]
\ No newline at end of file
+    re_path(r"^ws/rooms/$", MultiRoomConsumer.as_asgi()),
+]
@@ -0,0 +1,60 @@
+"""
+cached_db sessions that survive a Redis outage.
+
+Django's cached_db store tolerates a failed cache read or save, but not a
+failed refill after a miss, ``exists`` (called by ``cycle_key`` on every
+login) or ``delete``. Here those fall back to the session table too, so
+logging in, browsing and logging out keep working while Redis is down.
+"""
+
+import logging
+
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(CachedDBStore):
+    def load(self):
+        try:
+            return super().load()
+        except RedisError:
+            logger.warning("session cache unavailable, reading the session from the database")
+            return super(CachedDBStore, self).load()
+
+    async def aload(self):
+        try:
+            return await super().aload()
+        except RedisError:
+            logger.warning("session cache unavailable, reading the session from the database")
+            return await super(CachedDBStore, self).aload()
+
+    def exists(self, session_key):
+        try:
+            if session_key and (self.cache_key_prefix + session_key) in self._cache:
+                return True
+        except RedisError:
+            logger.warning("session cache unavailable, checking the database")
+        return super(CachedDBStore, self).exists(session_key)
+
+    async def aexists(self, session_key):
+        try:
+            if session_key and await self._cache.ahas_key(self.cache_key_prefix + session_key):
+                return True
+        except RedisError:
+            logger.warning("session cache unavailable, checking the database")
+        return await super(CachedDBStore, self).aexists(session_key)
+
+    def delete(self, session_key=None):
+        try:
+            super().delete(session_key)
+        except RedisError:
+            # the row is gone, but the cached copy is served until it expires
+            logger.warning("could not drop cached session, it lives until its expiry")
+
+    async def adelete(self, session_key=None):
+        try:
+            await super().adelete(session_key)
+        except RedisError:
+            logger.warning("could not drop cached session, it lives until its expiry")
@@ -0,0 +1,114 @@
+"""
+Rooms spread over several Redis nodes by consistent hashing.
+
+``REDIS_SHARD_URLS`` lists the nodes. A room's channel groups
+(``room_<id>``, ``room_<id>_workers``) and its ``presence:room:<id>:*`` keys
+live on the same node, which is picked from a hash ring with ``VNODES``
+points per node. Process inboxes (``specific.<x>!``) are hashed on the same
+ring by name. ``REDIS_URL`` keeps everything that is not per room (tracing,
+the cache).
+
+Consumers resolve a room's node once per connection and keep that client
+until the socket closes.
+
+Adding a node
+-------------
+Only about 1/N of the rooms move. A node is identified by host, port and db
+(not credentials), so rotating a password does not move anything.
+
+  1. ``manage.py rebalance_shards --to <new list>`` prints which rooms move.
+  2. Deploy with the new ``REDIS_SHARD_URLS``. Right after the rollout, run
+     ``rebalance_shards --from <old list> --to <new list> --copy``. The copy
+     merges moved presence keys and group memberships into their new node
+     and is safe to repeat.
+  3. Sockets opened before the deploy keep their old node until they
+     reconnect. Rolling restarts drain them; anything missed is bounded by
+     HEARTBEAT_TTL, because presence is rebuilt from heartbeats and the
+     sweeper. When the old workers are gone, run ``--copy --purge`` once more
+     to drop the moved keys from the old nodes.
+"""
+
+import bisect
+import hashlib
+import re
+from urllib.parse import urlparse
+
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+
+VNODES = 160
+
+ROOM_GROUP_RE = re.compile(r"^room_(\d+)(?:_workers)?$")
+
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def node_id(url):
+    u = urlparse(url)
+    return f"{u.hostname}:{u.port or 6379}{u.path or '/0'}"
+
+
+def room_key(room_id):
+    return f"room:{int(room_id)}"
+
+
+class HashRing:
+    def __init__(self, urls, vnodes=VNODES):
+        self.urls = list(urls)
+        points = sorted(
+            (_point(f"{node_id(url)}#{v}"), i)
+            for i, url in enumerate(self.urls)
+            for v in range(vnodes)
+        )
+        self._points = [p for p, _ in points]
+        self._owners = [i for _, i in points]
+
+    def index(self, key):
+        if len(self.urls) == 1:
+            return 0
+        i = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[i]
+
+    def url(self, key):
+        return self.urls[self.index(key)]
+
+
+_ring = None
+
+
+def ring():
+    global _ring
+    if _ring is None or _ring.urls != settings.REDIS_SHARD_URLS:
+        _ring = HashRing(settings.REDIS_SHARD_URLS)
+    return _ring
+
+
+def shard_url(room_id):
+    """Redis URL holding the room's presence keys and channel groups."""
+    return ring().url(room_key(room_id))
+
+
+class ShardedChannelLayer(RedisChannelLayer):
+    """
+    channels_redis splits its hosts into equal CRC ranges, so adding a host
+    moves almost every key. This places room groups on the same ring as
+    presence, and everything else by name on that ring.
+    """
+
+    def __init__(self, hosts=None, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.ring = HashRing([h.get("address") or f"redis://{h['host']}:{h['port']}" for h in self.hosts])
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        if isinstance(value, bytes):
+            value = value.decode("utf8")
+        if m := ROOM_GROUP_RE.match(value):
+            return self.ring.index(room_key(m[1]))
+        if "!" in value:
+            # a process inbox: hash only the non-local part so send and receive agree
+            value = value[: value.index("!") + 1]
+        return self.ring.index(value)
@@ -1,12 +1,82 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.db import transaction
 from django.contrib.auth.models import User
-from .models import Profile
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from studybud.db_router import untracked_writes
+from .models import Profile, Topic, Room, Message, RoomChange
+from .topic_index import topic_index
+from .auth_backends import forget_user
+from .changes import record
 
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # only on creation: last_login bumps and profile edits must not write here.
+    # Users created without signals (bulk_create) get theirs from
+    # Profile.objects.ensure_for(), and views fall back to for_user().
+    if created and not raw:
         Profile.objects.create(user=instance)
+
+# keep the in-process topic autocomplete index in step with writes
+@receiver(post_save, sender=Topic)
+def index_topic(sender, instance, created, **kwargs):
+    if created:
+        topic_index.add(instance)
     else:
-        Profile.objects.get_or_create(user=instance)
-        instance.profile.save()
\ No newline at end of file
+        topic_index.invalidate()
+
+@receiver(post_delete, sender=Topic)
+def unindex_topic(sender, instance, **kwargs):
+    topic_index.invalidate()
+
+@receiver(post_save, sender=Room)
+def count_room_topic(sender, instance, created, **kwargs):
+    if created and instance.topic_id:
+        topic_index.bump(instance.topic_id, 1)
+
+@receiver(post_delete, sender=Room)
+def uncount_room_topic(sender, instance, **kwargs):
+    # rooms deleted in the background were uncounted when they were hidden
+    if instance.topic_id and instance.deleted_at is None:
+        topic_index.bump(instance.topic_id, -1)
+
+# drop cached auth user objects whenever the underlying row may have changed
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # after commit, so a concurrent get_user can't re-cache the old row
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_user(pk))
+
+# Django's own last_login receiver, minus the replica pin (see db_router)
+user_logged_in.disconnect(dispatch_uid="update_last_login")
+
+@receiver(user_logged_in, dispatch_uid="update_last_login")
+def update_last_login_untracked(sender, request, user, **kwargs):
+    with untracked_writes():
+        update_last_login(sender, user)
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
+
+# append-only change log for delta sync (see base/changes.py)
+@receiver(post_save, sender=Message)
+def log_message_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        kind = RoomChange.MESSAGE_CREATED if created else RoomChange.MESSAGE_UPDATED
+        record(instance.room_id, kind, instance.pk)
+
+@receiver(post_delete, sender=Message)
+def log_message_deleted(sender, instance, origin=None, **kwargs):
+    # a cascade from the room itself: the room and its log are going away too
+    if isinstance(origin, Room) or getattr(origin, "model", None) is Room:
+        return
+    record(instance.room_id, RoomChange.MESSAGE_DELETED, instance.pk)
+
+@receiver(post_save, sender=Room)
+def log_room_updated(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        record(instance.pk, RoomChange.ROOM_UPDATED, instance.pk)
@@ -0,0 +1,26 @@
+import logging
+
+from django import template
+from redis.exceptions import RedisError
+
+from base.presence import online_counts as _online_counts
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+
+@register.simple_tag
+def online_counts(rooms):
+    """{% online_counts rooms as online %}: one presence lookup for the whole list."""
+    try:
+        return _online_counts(room.id for room in rooms)
+    except RedisError:
+        # the page still renders, just without online counts
+        logger.warning("presence unavailable, rendering rooms without online counts")
+        return None
+
+
+@register.filter
+def online_for(counts, room_id):
+    return counts.get(room_id, 0)
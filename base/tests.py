@@ -1,3 +1,1340 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User, update_last_login
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from studybud import health as probes
+from studybud.db_pool import configure_pool
+from studybud.db_router import PIN_COOKIE, PRIMARY, REPLICA, ReplicaPinningMiddleware
+from . import dedupe, metrics
+from .archive import room_history, unpack
+from .auth_backends import CachedModelBackend, deactivate_users
+from .bulk_import import import_topics, import_users
+from .compression import CompressionMiddleware
+from .changes import changes_since
+from .deletion import claim_next, queue_room_deletion, queue_user_deletion, run
+from .fanout import LocalFanout, relays_key, worker_group
+from .models import ActivityRollup, DeletionJob, Message, MessageArchive, Profile, Room, RoomChange, Topic
+from .presence import SWEEP_CURSOR_KEY, PresenceSweeper, heartbeat_key, online_counts, room_presence_keys
+from .profiling import ProfilingMiddleware, aprofile
+from .rollups import apply_new_changes, recompute, series, trending_topics
+from .sharding import HashRing, ShardedChannelLayer, room_key, shard_url
+from .topic_index import TopicPrefixIndex, topic_index
+from .tracing import tracer
+from .unread import mark_read, message_posted, unread_counts
+
+# tests must not need a Redis server for sessions and the auth user cache
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+INMEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
 # Create your tests here.
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedAuthUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ada")
+        self.backend = CachedModelBackend()
+
+    def test_second_lookup_is_served_from_the_cache(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = "Ada"
+            self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, "Ada")
+
+    def test_bulk_deactivation_logs_users_out_at_once(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(deactivate_users(User.objects.filter(username="ada")), 1)
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_queued_deletion_logs_the_user_out(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_user_deletion(self.user)
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_database_is_used_when_the_cache_is_down(self):
+        with mock.patch("base.auth_backends.cache.get", side_effect=RedisError("down")):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoginPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="ada", password="pw-1234567")
+        self.failed = []
+        user_login_failed.connect(self._login_failed)
+        self.addCleanup(user_login_failed.disconnect, self._login_failed)
+
+    def _login_failed(self, sender, credentials, **kwargs):
+        self.failed.append(credentials)
+
+    def _login(self, username, password):
+        return self.client.post("/login/", {"username": username, "password": password}, follow=True)
+
+    def _messages(self, response):
+        return [str(m) for m in response.context["messages"]]
+
+    def test_unknown_user(self):
+        response = self._login("nobody", "pw-1234567")
+        self.assertEqual(self._messages(response), ["User does not exist."])
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_inactive_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self._login("ada", "pw-1234567")
+        self.assertEqual(self._messages(response), ["This account is inactive."])
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_wrong_password_signals_failure(self):
+        response = self._login(" Ada ", "wrong")
+        self.assertEqual(self._messages(response), ["Incorrect password."])
+        self.assertEqual(self.failed, [{"username": "ada"}])
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_success_hashes_the_password_once(self):
+        from django.contrib.auth.hashers import MD5PasswordHasher
+
+        with mock.patch.object(MD5PasswordHasher, "verify", autospec=True, side_effect=MD5PasswordHasher.verify) as verify:
+            response = self.client.post("/login/", {"username": "ada", "password": "pw-1234567"})
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(self.client.session["_auth_user_id"], str(self.user.pk))
+        self.assertEqual(self.failed, [])
+
+    def test_stored_hash_is_upgraded_when_the_hasher_changes(self):
+        hashers = ["django.contrib.auth.hashers.PBKDF2PasswordHasher", "django.contrib.auth.hashers.MD5PasswordHasher"]
+        with self.settings(PASSWORD_HASHERS=hashers):
+            response = self.client.post("/login/", {"username": "ada", "password": "pw-1234567"})
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SessionCacheOutageTests(TestCase):
+    def setUp(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        cache.clear()
+        self.user = User.objects.create_user(username="ada", password="pw-1234567")
+        down = RedisError("Connection refused")
+        for name in ("get", "set", "has_key", "delete"):
+            patcher = mock.patch.object(LocMemCache, name, side_effect=down)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_login_browse_logout_without_the_cache(self):
+        with self.assertLogs("base.sessions", "WARNING"):
+            response = self.client.post("/login/", {"username": "ada", "password": "pw-1234567"})
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        key = self.client.session.session_key
+        self.assertTrue(SessionStore().exists(key))
+
+        with self.assertLogs("base", "WARNING"):
+            response = self.client.get("/update-user/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["user"], self.user)
+
+        with self.assertLogs("base", "WARNING"):
+            self.client.get("/logout/")
+        self.assertFalse(SessionStore().exists(key))
+
+    async def test_async_store_falls_back_to_the_database(self):
+        from .sessions import SessionStore as FallbackStore
+
+        session = FallbackStore()
+        session["k"] = "v"
+        with self.assertLogs("base.sessions", "WARNING"):
+            await session.asave(must_create=True)
+            self.assertTrue(await session.aexists(session.session_key))
+            self.assertEqual(await FallbackStore(session.session_key).aget("k"), "v")
+            await session.adelete()
+            self.assertFalse(await session.aexists(session.session_key))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TopicIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.python = Topic.objects.create(name="Python")
+        self.pytest = Topic.objects.create(name="pytest")
+        Topic.objects.create(name="Rust")
+        for i in range(3):
+            Room.objects.create(host=self.user, topic=self.pytest, name=f"pytest room {i}")
+        Room.objects.create(host=self.user, topic=self.python, name="python room")
+        topic_index.invalidate()
+
+    def _names(self, prefix, limit=10, index=topic_index):
+        return [t["name"] for t in index.suggest(prefix, limit)]
+
+    def test_prefix_matches_case_insensitively_ranked_by_rooms(self):
+        self.assertEqual(self._names("PY"), ["pytest", "Python"])
+        self.assertEqual(self._names("pyt"), ["pytest", "Python"])
+        self.assertEqual(self._names("pyth"), ["Python"])
+        self.assertEqual(self._names("go"), [])
+
+    def test_limit_and_empty_prefix(self):
+        self.assertEqual(self._names("py", limit=1), ["pytest"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._names("  "), [])
+
+    def test_lookups_are_served_from_memory_until_invalidated(self):
+        index = TopicPrefixIndex()
+        self.assertEqual(self._names("ru", index=index), ["Rust"])
+        Topic.objects.filter(name="Rust").update(name="Ruby")
+        with self.assertNumQueries(0):
+            self.assertEqual(self._names("ru", index=index), ["Rust"])
+        index.invalidate()
+        self.assertEqual(self._names("ru", index=index), ["Ruby"])
+
+    def test_writes_keep_the_shared_index_in_step(self):
+        self._names("py")  # build it
+        Topic.objects.create(name="pypy")
+        self.assertIn("pypy", self._names("pyp"))
+
+        room = Room.objects.get(name="python room")
+        self.client.force_login(self.user)
+        response = self.client.post(f"/update-room/{room.id}/",
+                                    {"name": "python room", "topic": "pytest", "description": ""})
+        self.assertEqual(response.status_code, 302)
+        counts = {t["name"]: t["room_count"] for t in topic_index.suggest("py")}
+        self.assertEqual((counts["pytest"], counts["Python"]), (4, 0))
+
+class ProfileWriteTests(TestCase):
+    def test_new_user_gets_a_profile(self):
+        # INSERT user + INSERT profile
+        with self.assertNumQueries(2):
+            user = User.objects.create(username="ada")
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+    def test_updating_a_user_does_not_touch_the_profile(self):
+        user = User.objects.create(username="ada")
+        user.email = "ada@example.com"
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_last_login_bump_is_a_single_update(self):
+        user = User.objects.create(username="ada")
+        with self.assertNumQueries(1):
+            update_last_login(None, user)
+
+    def test_bulk_created_users_get_profiles_in_one_query(self):
+        users = User.objects.bulk_create([User(username=f"u{i}") for i in range(50)])
+        with self.assertNumQueries(1):
+            Profile.objects.ensure_for(users)
+        self.assertEqual(Profile.objects.filter(user__in=users).count(), 50)
+
+    def test_missing_profile_is_created_lazily(self):
+        user = User.objects.create(username="ada")
+        Profile.objects.filter(user=user).delete()
+        self.assertEqual(Profile.objects.for_user(user).user_id, user.id)
+
+
+class UserHistoryPaginationTests(TestCase):
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response
+
+    def _user_with_history(self, username, n):
+        user = User.objects.create(username=username)
+        topic = Topic.objects.create(name=f"{username}-topic")
+        rooms = Room.objects.bulk_create(
+            [Room(host=user, topic=topic, name=f"{username} room {i}") for i in range(n)]
+        )
+        Message.objects.bulk_create(
+            [Message(user=user, room=rooms[i % n], body=f"m{i}") for i in range(n * 3)]
+        )
+        return user
+
+    def test_query_count_does_not_grow_with_history(self):
+        small = self._user_with_history("small", 3)
+        big = self._user_with_history("big", 60)
+        for name in ("rooms", "messages"):
+            small_q, _ = self._queries(f"/api/users/{small.id}/{name}")
+            big_q, _ = self._queries(f"/api/users/{big.id}/{name}")
+            self.assertEqual(small_q, big_q, name)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_profile_page_counts_participants_in_the_room_query(self):
+        cache.clear()
+        user = self._user_with_history("ada", 5)
+        guests = User.objects.bulk_create([User(username=f"guest{i}") for i in range(3)])
+        self.client.force_login(user)
+        url = f"/profile/{user.id}/"
+        with mock.patch("base.templatetags.presence_tags._online_counts", lambda ids: {}):
+            for room in user.room_set.all():
+                room.participants.add(*guests)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+        self.assertContains(response, "3 Joined", count=5)
+        # counted in the room query itself, no second query for the participants
+        participants = [q["sql"] for q in ctx.captured_queries if "base_room_participants" in q["sql"]]
+        self.assertEqual(len(participants), 1)
+        self.assertIn("COUNT(", participants[0])
+
+    def test_cursor_walks_every_row_once(self):
+        user = self._user_with_history("ada", 45)
+        seen, url = [], f"/api/users/{user.id}/rooms"
+        while url:
+            _, response = self._queries(url)
+            data = response.json()
+            seen += [r["id"] for r in data["results"]]
+            url = data["next"]
+        self.assertEqual(sorted(seen, reverse=True), seen)
+        self.assertEqual(len(set(seen)), 45)
+
+
+@override_settings(DELETION_PAUSE=0)
+class BackgroundDeletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.room = Room.objects.create(host=self.user, name="big room")
+        self.room.participants.add(self.user)
+        Message.objects.bulk_create([Message(user=self.user, room=self.room, body=f"m{i}") for i in range(25)])
+
+    def test_room_is_hidden_at_once_and_drained_in_chunks(self):
+        job = queue_room_deletion(self.room, requested_by=self.user)
+        self.assertFalse(Room.objects.filter(pk=self.room.pk).exists())
+        self.assertEqual(Message.objects.filter(room_id=self.room.pk).count(), 25)
+
+        self.assertEqual(claim_next().pk, job.pk)
+        self.assertTrue(run(job, chunk=10))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.deleted), (DeletionJob.DONE, 26, 26))
+        self.assertFalse(Room.all_objects.filter(pk=self.room.pk).exists())
+        self.assertFalse(Message.objects.filter(room_id=self.room.pk).exists())
+
+    def test_queueing_twice_returns_the_same_job(self):
+        first = queue_room_deletion(self.room)
+        self.assertEqual(queue_room_deletion(self.room).pk, first.pk)
+
+    def test_user_is_deactivated_then_removed(self):
+        job = queue_user_deletion(self.user)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertTrue(run(claim_next(), chunk=10))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertIsNone(Room.all_objects.get(pk=self.room.pk).host_id)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_api_delete_answers_with_the_job(self):
+        cache.clear()
+        self.client.force_login(User.objects.create(username="eve"))
+        self.assertEqual(self.client.delete(f"/api/users/{self.user.id}/").status_code, 403)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/users/{self.user.id}/")
+        self.assertEqual(response.status_code, 202)
+        job = DeletionJob.objects.get(kind=DeletionJob.USER, object_id=self.user.id)
+        self.assertEqual(response["Location"], reverse("deletion-detail", args=[job.id]))
+        self.assertEqual(response.json(), {
+            "id": job.id, "kind": DeletionJob.USER, "object_id": self.user.id, "status": DeletionJob.PENDING,
+            "total": job.total, "deleted": 0, "percent": 0.0, "error": None,
+        })
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+
+    def test_user_deletion_drains_their_archived_messages(self):
+        bob = User.objects.create(username="bob")
+        kept = Message.objects.create(user=bob, room=self.room, body="bob's")
+        gone = set(Message.objects.filter(user=self.user).values_list("id", flat=True))
+        call_command("archive_messages", older_than_days=0, chunk_size=10, stdout=StringIO())
+        self.assertEqual(self.user.archived_chunks.count(), 3)
+
+        queue_user_deletion(self.user)
+        self.assertTrue(run(claim_next(), chunk=2))
+        rows = [row for chunk in MessageArchive.objects.all() for row in unpack(chunk.payload)]
+        self.assertEqual([(row["id"], row["username"]) for row in rows], [(kept.id, "bob")])
+        self.assertEqual(list(MessageArchive.objects.get().authors.all()), [bob])
+        self.assertEqual(
+            set(RoomChange.objects.filter(kind=RoomChange.MESSAGE_DELETED).values_list("object_id", flat=True)),
+            gone,
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HiddenRoomTests(TestCase):
+    """Rooms queued for deletion vanish from every page before the job runs."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="ada")
+        self.topic = Topic.objects.create(name="math")
+        self.live = Room.objects.create(host=self.user, topic=self.topic, name="live")
+        self.hidden = Room.objects.create(host=self.user, topic=self.topic, name="hidden")
+        Message.objects.create(user=self.user, room=self.live, body="visible")
+        Message.objects.create(user=self.user, room=self.hidden, body="leaked")
+        topic_index.invalidate()
+        self.assertEqual(topic_index.suggest("ma")[0]["room_count"], 2)
+        self.job = queue_room_deletion(self.hidden)
+        self.client.force_login(self.user)
+        # room lists show presence counts, which live in Redis
+        patcher = mock.patch("base.templatetags.presence_tags._online_counts", lambda ids: {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _bodies(self, response, key="room_messages"):
+        return [m.body for m in response.context[key]]
+
+    def test_pages_list_only_live_rooms(self):
+        home = self.client.get("/")
+        self.assertEqual(self._bodies(home), ["visible"])
+        self.assertEqual([t.room_count for t in home.context["topics"]], [1])
+        self.assertEqual(self._bodies(self.client.get("/activity/")), ["visible"])
+        profile = self.client.get(f"/profile/{self.user.id}/")
+        self.assertEqual(self._bodies(profile), ["visible"])
+        self.assertEqual([t.room_count for t in profile.context["topics"]], [1])
+        api = self.client.get(f"/api/users/{self.user.id}/messages").json()
+        self.assertEqual([m["body"] for m in api["results"]], ["visible"])
+
+    def test_hidden_room_is_not_found(self):
+        self.assertEqual(self.client.get(f"/room/{self.hidden.id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/rooms/{self.hidden.id}/messages").status_code, 404)
+        self.assertEqual(self.client.get(f"/rooms/{self.hidden.id}/messages.json").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/rooms/{self.live.id}/messages").json()["total"], 1)
+
+    def test_topic_index_uncounts_the_room_once(self):
+        self.assertEqual(topic_index.suggest("ma")[0]["room_count"], 1)
+        self.assertTrue(run(self.job))
+        self.assertEqual(topic_index.suggest("ma")[0]["room_count"], 1)
+        topic_index.invalidate()
+        self.assertEqual(topic_index.suggest("ma")[0]["room_count"], 1)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.room = Room.objects.create(host=self.user, name="sync room")
+
+    def test_feed_collapses_edits_and_keeps_tombstones(self):
+        kept = Message.objects.create(user=self.user, room=self.room, body="first")
+        gone = Message.objects.create(user=self.user, room=self.room, body="oops")
+        kept.body = "first, edited"
+        kept.save()
+        gone_id = gone.id
+        gone.delete()
+        self.room.name = "renamed"
+        self.room.save()
+
+        changes, cursor, has_more = changes_since(self.room, 0, 100)
+        self.assertFalse(has_more)
+        self.assertEqual(
+            [(c["type"], c.get("id") or c.get("message", c.get("room"))["id"]) for c in changes],
+            [("message.created", kept.id), ("message.deleted", gone_id), ("room.updated", self.room.id)],
+        )
+        self.assertEqual(changes[0]["message"]["body"], "first, edited")
+        self.assertEqual(changes_since(self.room, cursor, 100)[0], [])
+
+    def test_pages_follow_the_cursor(self):
+        for i in range(5):
+            Message.objects.create(user=self.user, room=self.room, body=f"m{i}")
+        first, cursor, has_more = changes_since(self.room, 0, 3)
+        self.assertTrue(has_more)
+        rest, _, has_more = changes_since(self.room, cursor, 3)
+        self.assertFalse(has_more)
+        self.assertEqual(len(first) + len(rest), 5)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ActivityRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.topic = Topic.objects.create(name="python")
+        self.room = Room.objects.create(host=self.user, topic=self.topic, name="rollup room")
+        for i in range(7):
+            Message.objects.create(user=self.user, room=self.room, body=f"m{i}")
+
+    def _today(self):
+        return series(ActivityRollup.ROOM, self.room.id, ActivityRollup.DAY, 1)[0]["messages"]
+
+    def test_incremental_counts_each_message_once(self):
+        self.assertEqual(apply_new_changes(batch=3), 3)
+        while apply_new_changes(batch=3):
+            pass
+        self.assertEqual(self._today(), 7)
+        self.assertEqual(apply_new_changes(), 0)
+        self.assertEqual(self._today(), 7)
+        self.assertEqual(trending_topics(24, 5)[0]["messages"], 7)
+
+    def test_recompute_matches_incremental_and_moves_the_cursor(self):
+        recompute(timezone.now() - timedelta(days=1))
+        self.assertEqual(self._today(), 7)
+        self.assertEqual(apply_new_changes(), 0)
+        self.assertEqual(
+            series(ActivityRollup.USER, self.user.id, ActivityRollup.HOUR, 1)[0]["messages"], 7
+        )
+
+
+class AsyncReadViewTests(TestCase):
+    def test_public_profile_is_json_and_never_writes(self):
+        user = User.objects.create(username="ada")
+        Profile.objects.filter(user=user).delete()
+        response = self.client.get(f"/api/profiles/{user.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user_id"], user.id)
+        self.assertFalse(Profile.objects.filter(user=user).exists())
+
+        response = self.client.get("/api/profiles/999999/")
+        self.assertEqual((response.status_code, response["Content-Type"]), (404, "application/json"))
+        self.assertEqual(response.json(), {"detail": "Not found."})
+
+    def test_room_messages_keep_the_api_contract(self):
+        user = User.objects.create(username="ada")
+        room = Room.objects.create(host=user, name="history")
+        Message.objects.create(user=user, room=room, body="hi")
+        data = self.client.get(f"/api/rooms/{room.id}/messages?limit=5").json()
+        self.assertEqual((data["total"], data["messages"][0]["body"]), (1, "hi"))
+
+        response = self.client.post(f"/api/rooms/{room.id}/messages")
+        self.assertEqual(response.status_code, 405)
+        self.assertIn("detail", response.json())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchivedMessageDeleteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.room = Room.objects.create(host=self.user, name="old room")
+        self.messages = [Message.objects.create(user=self.user, room=self.room, body=f"m{i}") for i in range(3)]
+        call_command("archive_messages", older_than_days=0, stdout=StringIO())
+        self.client.force_login(self.user)
+
+    def test_author_deletes_an_archived_message(self):
+        gone = self.messages[1]
+        self.assertEqual(self.client.get(f"/delete-message/{gone.id}/").status_code, 200)
+        self.assertEqual(self.client.post(f"/delete-message/{gone.id}/").status_code, 302)
+
+        chunk = MessageArchive.objects.get(room=self.room)
+        self.assertEqual(chunk.count, 2)
+        history, total = async_to_sync(room_history)(self.room.id, 0, 10)
+        self.assertEqual(([m["body"] for m in history], total), (["m2", "m0"], 2))
+        self.assertTrue(RoomChange.objects.filter(kind=RoomChange.MESSAGE_DELETED, object_id=gone.id).exists())
+
+    def test_others_and_unknown_ids_are_refused(self):
+        self.client.force_login(User.objects.create(username="eve"))
+        self.assertEqual(self.client.post(f"/delete-message/{self.messages[0].id}/").status_code, 403)
+        self.assertEqual(self.client.get("/delete-message/999999/").status_code, 404)
+        self.assertEqual(MessageArchive.objects.get(room=self.room).count, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BulkImportTests(TestCase):
+    def setUp(self):
+        cache.clear()  # user ids repeat across tests; drop other tests' cached users
+        self.admin = User.objects.create(username="root", is_superuser=True)
+        self.client.force_login(self.admin)
+
+    def test_every_row_gets_a_result_in_input_order(self):
+        results = import_users([
+            {"username": "Ada", "password": "pw-1234567"},
+            {"username": "ada"},
+            {"username": "root"},
+            {"username": "bad name!"},
+            "not an object",
+            {"username": "grace", "email": "grace@example.com"},
+        ])
+        self.assertEqual([(r["row"], r["status"]) for r in results],
+                         [(0, "created"), (1, "error"), (2, "error"), (3, "error"), (4, "error"), (5, "created")])
+        self.assertIn("username", results[1]["errors"])
+        self.assertTrue(User.objects.get(username="ada").check_password("pw-1234567"))
+        self.assertFalse(User.objects.get(username="grace").has_usable_password())
+        self.assertTrue(Profile.objects.filter(user__username="grace").exists())
+
+    @override_settings(BULK_IMPORT_CHUNK_SIZE=2)
+    def test_rows_are_written_one_chunk_at_a_time(self):
+        Topic.objects.create(name="t1")
+        with CaptureQueriesContext(connection) as ctx:
+            results = import_topics([{"name": f"t{i}"} for i in range(5)] + [{"name": "t0"}])
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual([r["status"] for r in results],
+                         ["created", "exists", "created", "created", "created", "exists"])
+        self.assertEqual(results[0]["id"], results[5]["id"])
+
+    def test_uploads_are_not_capped_by_the_form_body_limit(self):
+        padding = "x" * 1000
+        body = "\n".join(f'{{"name": "topic {i}", "note": "{padding}"}}' for i in range(3000))
+        self.assertGreater(len(body), settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        response = self.client.post("/api/import/topics", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["total"], response.json()["failed"]), (3000, 0))
+
+    @override_settings(BULK_IMPORT_MAX_BYTES=100)
+    def test_byte_limit(self):
+        body = json.dumps([{"name": f"topic {i}"} for i in range(10)])
+        response = self.client.post("/api/import/topics", body, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Topic.objects.exists())
+
+
+class CompressionTests(TestCase):
+    def _get(self, body, content_type):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="br, gzip")
+        view = lambda r: HttpResponse(body, content_type=content_type)
+        return CompressionMiddleware(view)(request)
+
+    def test_html_is_gzipped_with_breach_padding(self):
+        body = b"<p>csrf token and reflected ?q= input</p>" * 100
+        responses = [self._get(body, "text/html; charset=utf-8") for _ in range(20)]
+        self.assertEqual({r["Content-Encoding"] for r in responses}, {"gzip"})
+        self.assertEqual(gzip.decompress(responses[0].content), body)
+        self.assertGreater(len({len(r.content) for r in responses}), 1)
+
+    @skipUnless(find_spec("brotli"), "brotli is not installed")
+    def test_json_may_use_brotli(self):
+        response = self._get(b'{"rooms": []}' * 200, "application/json")
+        self.assertEqual(response["Content-Encoding"], "br")
+
+    async def test_async_chain_compresses_without_a_thread_hop(self):
+        async def view(request):
+            return HttpResponse(b"<p>hi</p>" * 200, content_type="text/html")
+
+        middleware = CompressionMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+
+class MetricsTests(TestCase):
+    def _sample(self, line):
+        """Value of one exposition line (name and labels), 0 if absent."""
+        for got in metrics.render().splitlines():
+            if got.startswith(line + " "):
+                return float(got.rsplit(" ", 1)[1])
+        return 0
+
+    def test_histogram_exposition(self):
+        h = metrics.Histogram("test_seconds", "Test.", ("path",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            h.observe(value, path='a"b')
+        self.assertEqual(h.render(), [
+            "# HELP test_seconds Test.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{path="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{path="a\\"b",le="1"} 3',
+            'test_seconds_bucket{path="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{path="a\\"b"} 4.05',
+            'test_seconds_count{path="a\\"b"} 4',
+        ])
+
+    def test_middleware_counts_by_route_with_bounded_methods(self):
+        line = 'studybud_http_requests_total{route="livez",method="%s",status="200"}'
+        before = [self._sample(line % m) for m in ("GET", "other")]
+        self.client.get("/livez")
+        self.client.generic("BREW", "/livez")
+        self.client.generic("X" * 50, "/livez")
+        self.assertEqual([self._sample(line % m) for m in ("GET", "other")], [before[0] + 1, before[1] + 2])
+        self.assertNotIn("BREW", metrics.render())
+        self.assertGreater(self._sample('studybud_http_request_duration_seconds_count{route="livez",method="GET"}'), 0)
+
+    @override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_metrics_endpoint_is_ip_gated(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9").status_code, 403)
+        response = self.client.get("/metrics", REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn(b"# TYPE studybud_http_requests_total counter", response.content)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "base.sharding.ShardedChannelLayer", "CONFIG": {"hosts": ["redis://shard-0", "redis://shard-1"]}}},
+    REDIS_URL="redis://cache:6379/0",
+    READY_CHECK_TIMEOUT=0.05,
+    READY_CACHE_TTL=60,
+)
+class ReadinessTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(probes._cached, {"at": 0.0, "checks": None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis_down = set()
+        self.real_check_db = probes._check_db
+
+        def check_redis(url):
+            if url in self.redis_down:
+                raise RedisError("connection refused")
+
+        self.check_redis = mock.Mock(side_effect=check_redis)
+        self.check_db = mock.Mock()
+        for name, stub in (("_check_redis", self.check_redis), ("_check_db", self.check_db)):
+            patcher = mock.patch.object(probes, name, stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_ready_when_every_dependency_answers(self):
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["status"], "ready")
+        self.assertEqual(list(body["checks"]), ["database", "redis_shard_0", "redis_shard_1", "redis"])
+        self.assertFalse(body["load"]["saturated"])
+
+    def test_failed_shard_is_reported_and_livez_stays_up(self):
+        self.redis_down.add("redis://shard-1")
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        body = response.json()
+        self.assertEqual(body["status"], "unavailable")
+        self.assertEqual(body["checks"]["redis_shard_1"]["error"], "RedisError: connection refused")
+        self.assertTrue(body["checks"]["redis_shard_0"]["ok"])
+        self.assertEqual(self.client.get("/livez").status_code, 200)
+
+    def test_hung_database_times_out(self):
+        stuck = threading.Event()
+        self.addCleanup(stuck.set)
+        db = mock.MagicMock()
+        db.__getitem__.return_value.cursor.side_effect = lambda: stuck.wait(5)
+        with mock.patch.object(probes, "_check_db", self.real_check_db), \
+                mock.patch.object(probes, "connections", db):
+            started = time.monotonic()
+            response = self.client.get("/readyz")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["checks"]["database"]["error"], "timeout")
+        self.assertEqual(self.client.get("/livez").status_code, 200)
+
+    def test_results_are_cached_for_the_window(self):
+        self.redis_down.add("redis://cache:6379/0")
+        self.assertEqual(self.client.get("/readyz").status_code, 503)
+        self.redis_down.clear()
+        # within READY_CACHE_TTL the failure is served from cache, nothing is re-probed
+        self.assertEqual(self.client.get("/readyz").status_code, 503)
+        self.assertEqual(self.check_db.call_count, 1)
+
+        probes._cached["at"] -= 60
+        self.assertEqual(self.client.get("/readyz").status_code, 200)
+        self.assertEqual(self.check_db.call_count, 2)
+
+    @override_settings(READY_MAX_WEBSOCKETS=1)
+    def test_saturated_worker_is_not_ready(self):
+        metrics.ws_open.inc()
+        self.addCleanup(metrics.ws_open.dec)
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(all(c["ok"] for c in response.json()["checks"].values()))
+        self.assertEqual(response.json()["load"]["websockets_open"], 1)
+
+
+class AsyncStackTests(SimpleTestCase):
+    def test_no_middleware_is_adapted_under_asgi(self):
+        # an adapted sync middleware would put every request on the shared sync thread;
+        # Django only logs adaptations with DEBUG on
+        with override_settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    def test_static_files_are_served_ahead_of_the_app(self):
+        from asgiref.testing import ApplicationCommunicator
+        from studybud.static import ASGIStaticFiles
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(os.path.join(root, "app.css"), "w") as f:
+            f.write("body{}")
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def get(handler, path):
+            scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []}
+            app = ApplicationCommunicator(handler, scope)
+            await app.send_input({"type": "http.request", "body": b""})
+            response = await app.receive_output(1)
+            response["body"] = b""
+            while True:
+                # Django ends streamed responses with a body-less message
+                chunk = await app.receive_output(1)
+                response["body"] += chunk.get("body", b"")
+                if not chunk.get("more_body"):
+                    return response
+
+        with override_settings(STATIC_ROOT=root):
+            handler = ASGIStaticFiles(app)
+        response = async_to_sync(get)(handler, "/static/app.css")
+        self.assertEqual((response["status"], response["body"]), (200, b"body{}"))
+        self.assertEqual(async_to_sync(get)(handler, "/static/missing.css")["status"], 404)
+        self.assertEqual(async_to_sync(get)(handler, "/")["status"], 204)
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+@override_settings(CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=INMEMORY_LAYERS, REDIS_SHARD_URLS=[settings.REDIS_URL])
+class MultiRoomConsumerTests(TestCase):
+    def setUp(self):
+        from fakeredis import FakeRedis, FakeServer
+        from fakeredis.aioredis import FakeRedis as AsyncFakeRedis
+
+        server = FakeServer()
+        for target in ("base.consumers.async_redis", "base.fanout.async_redis"):
+            patcher = mock.patch(target, lambda url=None: AsyncFakeRedis(server=server, decode_responses=True))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # a fresh relay per test: the process-wide one would outlive the test's event loop
+        self.fanout = LocalFanout()
+        patcher = mock.patch("base.consumers.local_fanout", self.fanout)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.r = FakeRedis(server=server, decode_responses=True)
+        self.user = User.objects.create(username="ada")
+        self.rooms = [Room.objects.create(host=self.user, name=f"room {i}") for i in range(2)]
+
+    async def _connect(self, user=None):
+        from channels.testing import WebsocketCommunicator
+        from .consumers import MultiRoomConsumer
+
+        ws = WebsocketCommunicator(MultiRoomConsumer.as_asgi(), "/ws/rooms/")
+        ws.scope["user"] = user or self.user
+        connected, _ = await ws.connect()
+        self.assertTrue(connected)
+        return ws
+
+    async def _send(self, ws, frame):
+        """Send a frame and wait until the consumer has handled it."""
+        await ws.send_json_to(frame)
+        # frames are handled in order, so the error for a room-less frame marks the end
+        await ws.send_json_to({"type": "subscribe"})
+        while (await ws.receive_json_from()) != {"type": "error", "room": None, "detail": "room is required"}:
+            pass
+
+    def _present(self, room):
+        return self.r.smembers(room_presence_keys(room.id)["members"])
+
+    def _tabs(self, room):
+        return self.r.get(room_presence_keys(room.id, self.user.id)["counts"])
+
+    async def test_presence_is_ref_counted_across_sockets(self):
+        room = self.rooms[0]
+        first, second = await self._connect(), await self._connect()
+        for ws in (first, second, second):  # a repeated subscribe is a no-op
+            await self._send(ws, {"type": "subscribe", "room": room.id})
+        self.assertEqual((self._present(room), self._tabs(room)), ({str(self.user.id)}, "2"))
+
+        await self._send(first, {"type": "unsubscribe", "room": room.id})
+        self.assertEqual((self._present(room), self._tabs(room)), ({str(self.user.id)}, "1"))
+
+        await self._send(second, {"type": "bye"})
+        self.assertEqual((self._present(room), self._tabs(room)), (set(), None))
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_disconnect_leaves_every_subscribed_room(self):
+        ws = await self._connect()
+        for room in self.rooms:
+            await self._send(ws, {"type": "subscribe", "room": room.id})
+        self.assertEqual([self._tabs(room) for room in self.rooms], ["1", "1"])
+
+        await ws.disconnect()
+        self.assertEqual([self._present(room) for room in self.rooms], [set(), set()])
+
+    @override_settings(FANOUT_TIERED_THRESHOLD=2)
+    async def test_tiered_and_direct_sockets_get_each_message_once(self):
+        room = self.rooms[0]
+        bob = await User.objects.acreate(username="bob")
+        direct, tiered = await self._connect(), await self._connect(bob)
+        await self._send(direct, {"type": "subscribe", "room": room.id})
+        await self._send(tiered, {"type": "subscribe", "room": room.id})  # second member: tiered
+        self.assertIn(room.id, self.fanout.rooms)
+
+        await direct.send_json_to({"type": "chat", "room": room.id, "body": "hi"})
+        for ws in (direct, tiered):
+            while (got := await ws.receive_json_from())["type"] != "chat":
+                pass
+            self.assertEqual(got["message"]["body"], "hi")
+            self.assertTrue(await ws.receive_nothing())
+
+        await direct.disconnect()
+        await tiered.disconnect()
+        self.assertEqual(self.r.exists(relays_key(room.id)), 0)
+        await self.fanout.close()
+
+    async def test_resent_chat_is_acked_without_saving_again(self):
+        room = self.rooms[0]
+        ws = await self._connect()
+        await self._send(ws, {"type": "subscribe", "room": room.id})
+        acks = []
+        for _ in range(2):
+            await ws.send_json_to({"type": "chat", "room": room.id, "body": "once", "client_msg_id": "c1"})
+            while (got := await ws.receive_json_from())["type"] != "ack":
+                pass
+            acks.append(got)
+        self.assertEqual([a["duplicate"] for a in acks], [False, True])
+        self.assertEqual(acks[0]["id"], acks[1]["id"])
+        self.assertEqual(await Message.objects.filter(room=room).acount(), 1)
+        await ws.disconnect()
+
+    @override_settings(TRACE_SAMPLE_RATE=1)
+    async def test_trace_follows_the_message_to_every_receiver(self):
+        room = self.rooms[0]
+        spans = []
+        # in-memory exporter in place of the file writer
+        exporter = mock.Mock(emit=spans.append)
+        bob = await User.objects.acreate(username="bob")
+        sender, receiver = await self._connect(), await self._connect(bob)
+        for ws in (sender, receiver):
+            await self._send(ws, {"type": "subscribe", "room": room.id})
+        with mock.patch("base.tracing._writer", exporter), \
+                mock.patch.object(tracer, "rate", None), \
+                mock.patch.object(tracer, "resume", wraps=tracer.resume) as resume:
+            await sender.send_json_to({"type": "chat", "room": room.id, "body": "traced"})
+            for ws in (sender, receiver):
+                while (await ws.receive_json_from())["type"] != "chat":
+                    pass
+
+        carriers = [call.args[0] for call in resume.call_args_list]
+        self.assertEqual(len(carriers), 2)  # one group event per subscribed socket
+        trace_id = carriers[0]["id"]
+        self.assertEqual({c["id"] for c in carriers}, {trace_id})
+        self.assertTrue(all(isinstance(c["sent"], float) for c in carriers))
+
+        self.assertEqual({s["trace_id"] for s in spans}, {trace_id})
+        names = [s["span"] for s in spans]
+        for name in ("receive.parse", "save_message", "group_send"):
+            self.assertEqual(names.count(name), 1)
+        # both consumers, the receiver included, record the fan-out against the sender's trace
+        delivered = [s["channel"] for s in spans if s["span"] == "chat_message.send"]
+        self.assertEqual(len(set(delivered)), 2)
+        self.assertEqual(names.count("fanout.delivery"), 2)
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_unknown_room_is_refused(self):
+        ws = await self._connect()
+        await ws.send_json_to({"type": "subscribe", "room": 999999})
+        self.assertEqual((await ws.receive_json_from())["detail"], "no such room")
+        self.assertEqual(self.r.keys("presence:*"), [])
+        await ws.disconnect()
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+@override_settings(CACHES=LOCMEM_CACHES)
+class UnreadTests(TestCase):
+    def setUp(self):
+        from fakeredis import FakeRedis, FakeServer
+
+        self.server = FakeServer()
+        self.r = FakeRedis(server=self.server, decode_responses=True)
+        self.author, self.reader = User.objects.create(username="ada"), User.objects.create(username="bob")
+        self.room = Room.objects.create(host=self.author, name="unread")
+
+    def test_counts_follow_posts_and_read_markers(self):
+        other = Room.objects.create(host=self.author, name="quiet")
+        for _ in range(3):
+            message_posted(self.r, self.room.id, self.author.id)
+        self.assertEqual(unread_counts(self.r, self.reader.id, [self.room.id, other.id]), {self.room.id: 3, other.id: 0})
+        # posting marks the room read for the author
+        self.assertEqual(unread_counts(self.r, self.author.id, [self.room.id]), {self.room.id: 0})
+
+        self.assertEqual(mark_read(self.r, self.reader.id, self.room.id), 3)
+        message_posted(self.r, self.room.id, self.author.id)
+        self.assertEqual(unread_counts(self.r, self.reader.id, [self.room.id]), {self.room.id: 1})
+        self.assertEqual(unread_counts(self.r, self.reader.id, []), {})
+
+    def test_async_client_shares_the_counters(self):
+        from fakeredis.aioredis import FakeRedis as AsyncFakeRedis
+
+        async def post():
+            r = AsyncFakeRedis(server=self.server, decode_responses=True)
+            return await message_posted(r, self.room.id, self.author.id)
+
+        self.assertEqual(async_to_sync(post)(), 1)
+        self.assertEqual(unread_counts(self.r, self.reader.id, [self.room.id]), {self.room.id: 1})
+
+    def test_room_page_works_without_redis(self):
+        from fakeredis import FakeRedis
+
+        self.server.connected = False
+        cache.clear()
+        self.client.force_login(self.reader)
+        with mock.patch("base.views.sync_redis", lambda: FakeRedis(server=self.server)):
+            self.assertEqual(self.client.get(f"/room/{self.room.id}/").status_code, 200)
+            response = self.client.post(f"/room/{self.room.id}/", {"body": "still here"})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Message.objects.filter(room=self.room, body="still here").exists())
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+@override_settings(CHAT_DEDUPE_WINDOW=600, CHAT_DEDUPE_PENDING_TTL=30)
+class DedupeTests(SimpleTestCase):
+    def setUp(self):
+        from fakeredis.aioredis import FakeRedis
+
+        self.r = FakeRedis(decode_responses=True)
+        self.key = dedupe.dedupe_key(1, "c1")
+
+    async def test_settled_send_is_replayed_for_the_whole_window(self):
+        self.assertIsNone(await dedupe.claim(self.r, 1, "c1"))
+        await dedupe.settle(self.r, 1, "c1", 42)
+        self.assertEqual(await dedupe.claim(self.r, 1, "c1"), 42)
+        self.assertGreater(await self.r.ttl(self.key), 30)
+        self.assertIsNone(await dedupe.claim(self.r, 2, "c1"))  # ids are per user
+
+    async def test_pending_claim_expires_quickly(self):
+        self.assertIsNone(await dedupe.claim(self.r, 1, "c1"))
+        self.assertEqual(await dedupe.claim(self.r, 1, "c1"), dedupe.PENDING)
+        self.assertTrue(0 < await self.r.ttl(self.key) <= 30)
+
+    async def test_released_claim_lets_the_retry_through(self):
+        self.assertIsNone(await dedupe.claim(self.r, 1, "c1"))
+        await dedupe.release(self.r, 1, "c1")
+        self.assertIsNone(await dedupe.claim(self.r, 1, "c1"))
+
+    def test_client_msg_id_is_validated(self):
+        self.assertTrue(dedupe.valid_client_msg_id("c1"))
+        for bad in ("", "x" * (dedupe.MAX_ID_LENGTH + 1), "a\nb", 7):
+            self.assertFalse(dedupe.valid_client_msg_id(bad))
+
+
+SHARDS = [f"redis://10.0.0.{i}:6379/0" for i in range(1, 5)]
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+@override_settings(CACHES=LOCMEM_CACHES, REDIS_SHARD_URLS=SHARDS[:2], PRESENCE_COUNT_CACHE_TTL=60)
+class OnlineCountTests(SimpleTestCase):
+    def setUp(self):
+        from fakeredis import FakeRedis
+
+        cache.clear()
+        self.shards = {url: FakeRedis(decode_responses=True) for url in SHARDS[:2]}
+        patcher = mock.patch("base.redis_client.sync_redis", lambda url=None: self.shards[url])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _present(self, room_id, user_id, live=True):
+        r = self.shards[shard_url(room_id)]
+        r.sadd(room_presence_keys(room_id)["members"], user_id)
+        if live:
+            r.set(heartbeat_key(room_id, user_id), "1")
+
+    def test_counts_live_members_on_each_rooms_shard(self):
+        rooms = {shard_url(i): i for i in range(1, 50)}
+        a, b = rooms[SHARDS[0]], rooms[SHARDS[1]]
+        self._present(a, 1)
+        self._present(a, 2, live=False)  # heartbeat expired, not yet swept
+        self._present(b, 1)
+        self._present(b, 3)
+        self.assertEqual(online_counts([a, b, 999, a]), {a: 1, b: 2, 999: 0})
+
+    def test_counts_are_shared_from_the_cache(self):
+        self._present(1, 1)
+        self.assertEqual(online_counts([1]), {1: 1})
+        self._present(1, 2)
+        self.assertEqual(online_counts([1]), {1: 1})
+        cache.clear()
+        self.assertEqual(online_counts([1]), {1: 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REDIS_SHARD_URLS=["redis://127.0.0.1:1/0"])
+class PresenceOutageTests(TestCase):
+    def setUp(self):
+        import redis
+
+        cache.clear()
+        self.user = User.objects.create(username="ada")
+        Room.objects.create(host=self.user, name="quiet")
+        self.client.force_login(self.user)
+        # nothing listens on port 1: every presence lookup is refused
+        patcher = mock.patch("base.redis_client.sync_redis", lambda url=None: redis.Redis.from_url(url))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_room_lists_render_without_online_counts(self):
+        for url in ("/", f"/profile/{self.user.id}/"):
+            with self.assertLogs("base.templatetags.presence_tags", "WARNING"):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "Joined")
+            self.assertNotContains(response, " online")
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+class PresenceSweeperTests(SimpleTestCase):
+    def setUp(self):
+        from fakeredis import FakeRedis
+
+        self.r = FakeRedis(decode_responses=True)
+
+    def _present(self, room_id, user_id, tabs=1, member=True, live=True):
+        keys = room_presence_keys(room_id, user_id)
+        if member:
+            self.r.sadd(keys["members"], user_id)
+        self.r.set(keys["counts"], tabs)
+        self.r.set(keys["heartbeat"], "1", px=1 if not live else None)
+
+    def _snapshot(self):
+        return {key: self.r.dump(key) for key in self.r.scan_iter("presence:room:*")}
+
+    def test_reaps_only_expired_heartbeats(self):
+        self._present(1, 1, tabs=2)
+        self._present(1, 2, live=False)
+        self._present(2, 3, member=False, live=False)  # counter left behind by a crash mid-disconnect
+        self._present(2, 4, member=False)
+        time.sleep(0.01)  # let the 1 ms heartbeats expire
+
+        totals = PresenceSweeper(self.r, batch=2).run_pass()
+        self.assertEqual((totals["members_removed"], totals["counters_removed"]), (1, 2))
+        self.assertEqual(self.r.smembers(room_presence_keys(1)["members"]), {"1"})
+        self.assertEqual(self.r.get(room_presence_keys(1, 1)["counts"]), "2")
+        self.assertEqual(self.r.get(room_presence_keys(2, 4)["counts"]), "1")
+        for room_id, user_id in ((1, 2), (2, 3)):
+            self.assertFalse(self.r.exists(room_presence_keys(room_id, user_id)["counts"]))
+        self.assertEqual(self.r.get(SWEEP_CURSOR_KEY), "0")
+
+    def test_second_pass_is_a_no_op(self):
+        self._present(1, 1)
+        self._present(1, 2, live=False)
+        time.sleep(0.01)
+        sweeper = PresenceSweeper(self.r, batch=2)
+        sweeper.run_pass()
+        before = self._snapshot()
+
+        totals = sweeper.run_pass()
+        self.assertEqual((totals["members_removed"], totals["counters_removed"]), (0, 0))
+        self.assertEqual(self._snapshot(), before)
+
+    def test_heartbeat_back_before_removal_keeps_the_user(self):
+        self._present(1, 1)
+        report = {"members_removed": 0, "counters_removed": 0}
+        # the sweeper saw the heartbeat missing, the user reconnected before the reap ran
+        PresenceSweeper(self.r)._reap_user("1", "1", report)
+        self.assertEqual(report, {"members_removed": 0, "counters_removed": 0})
+        self.assertEqual(self.r.smembers(room_presence_keys(1)["members"]), {"1"})
+
+
+class HashRingTests(SimpleTestCase):
+    keys = [room_key(i) for i in range(5000)]
+
+    def _placement(self, urls):
+        ring = HashRing(urls)
+        return {key: ring.url(key) for key in self.keys}
+
+    def test_placement_depends_only_on_the_nodes(self):
+        before = self._placement(SHARDS)
+        self.assertEqual(self._placement(list(reversed(SHARDS))), before)
+        # credentials are not part of a node's identity
+        rotated = [u.replace("redis://", "redis://:secret@") for u in SHARDS]
+        self.assertEqual(
+            [url.replace(":secret@", "") for url in self._placement(rotated).values()], list(before.values())
+        )
+        self.assertEqual(set(before.values()), set(SHARDS))
+
+    def test_adding_a_node_moves_only_its_share(self):
+        before = self._placement(SHARDS)
+        new = "redis://10.0.0.5:6379/0"
+        after = self._placement(SHARDS + [new])
+        moved = [key for key in self.keys if after[key] != before[key]]
+        self.assertTrue(all(after[key] == new for key in moved))
+        self.assertLess(abs(len(moved) / len(self.keys) - 1 / 5), 0.05)
+
+    def test_removing_a_node_moves_only_its_keys(self):
+        before = self._placement(SHARDS)
+        after = self._placement(SHARDS[1:])
+        self.assertEqual(
+            [key for key in self.keys if after[key] != before[key]],
+            [key for key in self.keys if before[key] == SHARDS[0]],
+        )
+
+    @override_settings(REDIS_SHARD_URLS=SHARDS)
+    def test_channel_layer_puts_a_room_where_its_presence_lives(self):
+        layer = ShardedChannelLayer(hosts=SHARDS)
+        for room_id in range(50):
+            index = layer.consistent_hash(f"room_{room_id}")
+            self.assertEqual(layer.consistent_hash(f"room_{room_id}_workers".encode()), index)
+            self.assertEqual(layer.hosts[index]["address"], shard_url(room_id))
+        # a process inbox: every channel in it hashes like its prefix
+        self.assertEqual(
+            layer.consistent_hash("specific.abc!one"), layer.consistent_hash("specific.abc!two")
+        )
+
+
+class _RelayedSocket:
+    def __init__(self):
+        self.events = []
+        self.got = asyncio.Event()
+
+    async def chat_message(self, event):
+        self.events.append(event)
+        self.got.set()
+
+
+@skipUnless(find_spec("fakeredis"), "fakeredis is not installed")
+class LocalFanoutTests(SimpleTestCase):
+    def setUp(self):
+        from fakeredis import FakeServer
+        from fakeredis.aioredis import FakeRedis
+
+        server = FakeServer()
+        self.connect = lambda url=None: FakeRedis(server=server, decode_responses=True)
+        patcher = mock.patch("base.fanout.async_redis", self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_relay_hands_each_event_to_every_local_socket_once(self):
+        layer, fanout, r = InMemoryChannelLayer(), LocalFanout(), self.connect()
+        sockets = [_RelayedSocket() for _ in range(3)]
+        for sock in sockets:
+            await fanout.join(layer, 7, sock)
+        self.assertTrue(layer.valid_channel_name(fanout.relay_channel))
+        # a sender in another worker sees the room as tiered
+        self.assertTrue(await LocalFanout().tiered(r, 7))
+        self.assertFalse(await LocalFanout().tiered(r, 8))
+
+        await layer.group_send(worker_group(7), {"type": "chat.message", "room": 7, "message": {}})
+        await asyncio.wait_for(asyncio.gather(*(sock.got.wait() for sock in sockets)), 1)
+        self.assertEqual([len(sock.events) for sock in sockets], [1, 1, 1])
+
+        for sock in sockets:
+            await fanout.leave(layer, 7, sock)
+        self.assertFalse(await LocalFanout().tiered(r, 7))
+        await fanout.close()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Two SQLite databases: the test one as primary and a file as the replica,
+    which only sees rows copied over by replicate(), like a lagging replica.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # registered after the runner and the class set up their databases
+        tmp = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, tmp)
+        replica = {**connections.settings[PRIMARY], "NAME": os.path.join(tmp, "replica.sqlite3")}
+        cls.enterClassContext(mock.patch.dict(settings.DATABASES, {REPLICA: replica}))
+        connections.settings[REPLICA] = replica
+        cls.addClassCleanup(cls._drop_replica)
+        cls.databases = cls.databases | {REPLICA}
+
+    @classmethod
+    def _drop_replica(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        self.user = User.objects.create(username="ada")
+        self.replicate()
+
+    def replicate(self):
+        connections[PRIMARY].ensure_connection()
+        connections[REPLICA].ensure_connection()
+        connections[PRIMARY].connection.backup(connections[REPLICA].connection)
+
+    def _get(self, view, **cookies):
+        request = RequestFactory().get("/")
+        request.COOKIES.update(cookies)
+        return ReplicaPinningMiddleware(view)(request)
+
+    def test_reads_go_to_the_replica_until_the_client_writes(self):
+        topic = Topic.objects.create(name="fresh")  # not replicated yet
+
+        def view(request):
+            return HttpResponse(str(Topic.objects.filter(pk=topic.pk).exists()))
+
+        response = self._get(view)
+        self.assertEqual(response.content, b"False")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self._get(view, **{PIN_COOKIE: "9999999999"}).content, b"True")
+
+    def test_reads_after_a_write_in_the_same_request_use_the_primary(self):
+        def view(request):
+            topic = Topic.objects.create(name="fresh")
+            return HttpResponse(str(Topic.objects.filter(pk=topic.pk).exists()))
+
+        response = self._get(view)
+        self.assertEqual(response.content, b"True")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_session_and_last_login_writes_do_not_pin(self):
+        def view(request):
+            user_logged_in.send(sender=User, request=request, user=self.user)
+            SessionStore().save()
+            return HttpResponse(str(User.objects.get(pk=self.user.pk).last_login))
+
+        response = self._get(view)
+        self.assertEqual(response.content, b"None")  # still read from the replica
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIsNotNone(User.objects.using(PRIMARY).get(pk=self.user.pk).last_login)
+
+
+@skipUnless(find_spec("psycopg_pool"), "psycopg_pool is not installed")
+class ConnectionPoolTests(TestCase):
+    def test_postgres_backend_builds_the_pool(self):
+        db = configure_pool({"ENGINE": "django.db.backends.postgresql", "NAME": "studybud", "HOST": "localhost"})
+        wrapper = ConnectionHandler({"default": db})["default"]
+        pool = wrapper.pool  # not opened, so no server is needed
+        self.addCleanup(wrapper.close_pool)
+        self.assertEqual(pool.max_size, db["OPTIONS"]["pool"]["max_size"])
+        self.assertIsNotNone(pool._check)
+
+    def test_other_engines_are_left_alone(self):
+        db = {"ENGINE": "django.db.backends.sqlite3", "NAME": "x"}
+        self.assertNotIn("OPTIONS", configure_pool(db))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.enterContext(override_settings(PROFILE_DIR=tmp, PROFILE_INTERVAL=0.001))
+        self.dir = tmp
+
+    def _armed(self, rate, user, **extra):
+        request = RequestFactory().get("/", **extra)
+        request.user = user
+        with override_settings(PROFILE_SAMPLE_RATE=rate):
+            return ProfilingMiddleware(lambda r: HttpResponse())._armed(request)
+
+    def test_header_only_arms_for_superusers_and_never_opts_out(self):
+        admin = User(username="root", is_superuser=True)
+        self.assertTrue(self._armed(0, admin, HTTP_X_PROFILE="1"))
+        self.assertFalse(self._armed(0, AnonymousUser(), HTTP_X_PROFILE="1"))
+        self.assertTrue(self._armed(1, AnonymousUser(), HTTP_X_PROFILE="1"))
+
+    def test_async_profile_writes_folded_stacks(self):
+        async def work():
+            async with aprofile("async work"):
+                time.sleep(0.05)
+
+        async_to_sync(work)()
+        files = os.listdir(self.dir)
+        self.assertEqual(len(files), 1)
+        self.assertIn("async_work", files[0])
@@ -0,0 +1,86 @@
+import bisect
+import threading
+import time
+
+
+# How long a process keeps its index before rebuilding from the DB, so topics
+# created by other workers (and room count drift) show up eventually.
+INDEX_TTL = 300
+
+
+class TopicPrefixIndex:
+    """
+    In-memory prefix index over topic names, ranked by room count.
+
+    Names are kept in a sorted list of lowercased keys so a prefix lookup is a
+    bisect plus a short scan instead of a LIKE query over the whole table.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys = []       # sorted list of (lower_name, topic_id)
+        self._topics = {}     # topic_id -> [name, room_count]
+        self._built_at = None
+
+    def _build(self):
+        from .models import Topic
+        rows = (Topic.objects
+                .with_room_count()
+                .values_list("id", "name", "room_count"))
+        topics = {tid: [name, count] for tid, name, count in rows}
+        keys = sorted((name.lower(), tid) for tid, (name, _) in topics.items())
+        self._topics, self._keys = topics, keys
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self._build()
+
+    def suggest(self, prefix, limit=10):
+        prefix = (prefix or "").strip().lower()
+        if not prefix:
+            return []  # would rank every topic
+        with self._lock:
+            self._ensure_fresh()
+            start = bisect.bisect_left(self._keys, (prefix,))
+            matches = []
+            for key, tid in self._keys[start:]:
+                if not key.startswith(prefix):
+                    break
+                name, count = self._topics[tid]
+                matches.append((-count, key, tid, name, count))
+        matches.sort()
+        return [
+            {"id": tid, "name": name, "room_count": count}
+            for _, _, tid, name, count in matches[:limit]
+        ]
+
+    def add(self, topic):
+        with self._lock:
+            if self._built_at is None or topic.id in self._topics:
+                return
+            self._topics[topic.id] = [topic.name, 0]
+            bisect.insort(self._keys, (topic.name.lower(), topic.id))
+
+    def bump(self, topic_id, delta=1):
+        with self._lock:
+            entry = self._topics.get(topic_id)
+            if entry is not None:
+                entry[1] = max(0, entry[1] + delta)
+
+    def move(self, old_topic_id, new_topic_id):
+        """A room switched topics."""
+        if old_topic_id == new_topic_id:
+            return
+        if old_topic_id:
+            self.bump(old_topic_id, -1)
+        if new_topic_id:
+            self.bump(new_topic_id, 1)
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+
+topic_index = TopicPrefixIndex()
@@ -0,0 +1,182 @@
+"""
+Sampled span tracing for the chat message path.
+
+A trace is started when ``RoomConsumer.receive`` gets a chat frame. Its id and
+send timestamp ride along inside the ``chat.message`` group event, so the
+fan-out on every receiving consumer is recorded against the message that
+caused it. Spans are written as JSON lines to ``TRACE_FILE`` by a background
+thread, so the event loop never blocks on disk.
+
+The sample rate starts at ``TRACE_SAMPLE_RATE`` and can be changed on a live
+deployment with ``manage.py trace_sampling <rate>``. Workers pick up the new
+value from Redis within ``RATE_REFRESH`` seconds.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+RATE_KEY = "tracing:sample_rate"
+RATE_REFRESH = 15
+
+
+class _Writer:
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(settings.TRACE_FILE, "a", encoding="utf-8") as fh:
+                    fh.writelines(json.dumps(r) + "\n" for r in batch)
+            except OSError:
+                pass  # tracing must never take the chat path down
+
+
+_writer = _Writer()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "started", "wall")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record = {
+            "trace_id": self.trace.trace_id,
+            "span": self.name,
+            "start": self.wall,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "pid": self.trace.pid,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.attrs:
+            record.update(self.attrs)
+        _writer.emit(record)
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    sampled = True
+    pid = None
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+
+    def span(self, name, **attrs):
+        return _Span(self, name, attrs)
+
+    def record(self, name, start, duration, **attrs):
+        """Emit a span whose timing was measured elsewhere (e.g. across processes)."""
+        record = {
+            "trace_id": self.trace_id,
+            "span": name,
+            "start": start,
+            "duration_ms": round(duration * 1000, 3),
+            "pid": self.pid,
+        }
+        record.update(attrs)
+        _writer.emit(record)
+
+    def context(self):
+        """Carrier for the group event payload."""
+        return {"id": self.trace_id, "sent": time.time()}
+
+
+class _NoopTrace:
+    sampled = False
+    trace_id = None
+
+    def span(self, name, **attrs):
+        return _NOOP_SPAN
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def context(self):
+        return None
+
+
+NOOP_TRACE = _NoopTrace()
+
+
+class Tracer:
+    def __init__(self):
+        self.rate = None
+        self._checked = 0.0
+
+    def _rate(self):
+        return settings.TRACE_SAMPLE_RATE if self.rate is None else self.rate
+
+    async def refresh(self, r):
+        """Pick up a runtime override of the sample rate; cheap when fresh."""
+        now = time.monotonic()
+        if now - self._checked < RATE_REFRESH:
+            return
+        self._checked = now
+        try:
+            value = await r.get(RATE_KEY)
+        except Exception:
+            return
+        self.rate = float(value) if value is not None else None
+
+    def start(self):
+        rate = self._rate()
+        if rate <= 0 or random.random() >= rate:
+            return NOOP_TRACE
+        return self._make(uuid.uuid4().hex)
+
+    def resume(self, carrier):
+        if not carrier:
+            return NOOP_TRACE
+        return self._make(carrier["id"])
+
+    def _make(self, trace_id):
+        trace = Trace(trace_id)
+        trace.pid = os.getpid()
+        return trace
+
+
+tracer = Tracer()
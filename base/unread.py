@@ -0,0 +1,85 @@
+"""
+Per-user, per-room unread counts kept in Redis, without counting messages.
+
+  unread:room:<id>:seq   INT   bumped once per message posted in the room
+  unread:user:<uid>      HASH  room id -> the seq the user has read up to
+
+unread = seq - read marker. Posting costs one INCR however many participants
+the room has. Posting also marks the room read for the author. A user with no
+marker for a room has every message since counting began unread. All keys
+live on REDIS_URL, not on the room shards, so one pipeline answers for all of
+a user's rooms.
+
+The helpers take either a sync or an asyncio client. With an async client,
+await what they return.
+"""
+
+from redis.asyncio import Redis as AsyncRedis
+from redis.commands.core import AsyncScript, Script
+
+
+def seq_key(room_id):
+    return f"unread:room:{room_id}:seq"
+
+
+def read_key(user_id):
+    return f"unread:user:{user_id}"
+
+
+# KEYS: room seq, author's markers. ARGV: room id. Returns the new seq.
+_POSTED_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('HSET', KEYS[2], ARGV[1], seq)
+return seq
+"""
+
+# KEYS: room seq, user's markers. ARGV: room id. Returns the seq marked read.
+_READ_SCRIPT = """
+local seq = tonumber(redis.call('GET', KEYS[1]) or '0')
+redis.call('HSET', KEYS[2], ARGV[1], seq)
+return seq
+"""
+
+
+
+class _Script:
+    """
+    A Lua script hashed once per process and run with whichever client is
+    passed: EVALSHA, with a SCRIPT LOAD the first time a server lacks it.
+    """
+
+    def __init__(self, source):
+        source = source.encode()  # bytes, so hashing needs no client
+        self._sync = Script(None, source)
+        self._async = AsyncScript(None, source)
+
+    def __call__(self, r, keys, args):
+        script = self._async if isinstance(r, AsyncRedis) else self._sync
+        return script(keys=keys, args=args, client=r)
+
+
+_posted = _Script(_POSTED_SCRIPT)
+_read = _Script(_READ_SCRIPT)
+
+
+def message_posted(r, room_id, author_id):
+    return _posted(r, [seq_key(room_id), read_key(author_id)], [room_id])
+
+
+def mark_read(r, user_id, room_id):
+    return _read(r, [seq_key(room_id), read_key(user_id)], [room_id])
+
+
+def unread_counts(r, user_id, room_ids):
+    """room id -> unread count for the given rooms, in one round trip (sync client)."""
+    room_ids = list(room_ids)
+    if not room_ids:
+        return {}
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(read_key(user_id), room_ids)
+    pipe.mget([seq_key(room_id) for room_id in room_ids])
+    markers, seqs = pipe.execute()
+    return {
+        room_id: max(0, int(seq or 0) - int(marker or 0))
+        for room_id, marker, seq in zip(room_ids, markers, seqs)
+    }
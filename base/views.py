@@ -1,13 +1,27 @@
-from django.shortcuts import render, redirect
-from django.db.models import Q
-from django.http import HttpResponseForbidden
+import logging
+
+from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.db.models import Q, Count
+from django.urls import reverse
+from django.http import Http404, HttpResponseForbidden
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
+from django.contrib.auth.signals import user_login_failed
 from django.contrib.auth.forms import UserCreationForm
-from .models import Room, Topic, User, Message
+from .models import Room, Topic, User, Message, Profile
 from .forms import RoomForm, UserForm, ProfileForm
-from django.http import JsonResponse
+from .archive import room_history, find_archived, delete_archived
+from .deletion import queue_room_deletion
+from .api.async_views import async_api_view
+from .api.pagination import NewestFirstCursorPagination
+from .redis_client import sync_redis
+from .unread import message_posted, mark_read
+from .topic_index import topic_index
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -30,19 +44,14 @@ def loginPage(request):
             messages.error(request, 'This account is inactive.')
             return redirect('login')
 
-        # Check password explicitly so we can show a specific message
+        # Verify the password exactly once; authenticate() would hash it again.
+        # check_password also upgrades the stored hash if the hasher changed.
         if not user_obj.check_password(password):
+            user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
             messages.error(request, 'Incorrect password.')
             return redirect('login')
 
-        # If we reached here, credentials are correct
-        user = authenticate(request, username=username, password=password)
-        if user is None:
-            # Extremely rare path (custom backend quirks)
-            messages.error(request, 'Authentication failed due to a server configuration issue.')
-            return redirect('login')
-
-        login(request, user)
+        login(request, user_obj, backend=settings.AUTHENTICATION_BACKENDS[0])
         return redirect('home')
 
     return render(request, 'base/login_register.html', {'page': page})
@@ -80,14 +89,14 @@ def home(request):
         Q(topic__name=q) |
         Q(name__icontains=q) |
         Q(description__icontains=q)
-        )
+        ).annotate(participant_count=Count('participants'))
     # methods for ModelName.objects include .all() to return all
     # get to get specific object
     # filter to filter and returns objects matching condition e.g. WHERE
     # exclude to filter out and return objects not matching condition e.g. WHERE NOT
-    topics = Topic.objects.all()[:5]
+    topics = Topic.objects.with_room_count()[:5]
     room_count = rooms.count() # Faster than python len
-    room_messages = Message.objects.filter(Q(room__topic__name__icontains=q)).order_by('-created')[:10]
+    room_messages = Message.objects.in_live_rooms().filter(Q(room__topic__name__icontains=q)).order_by('-created')[:10]
     context = {'rooms': rooms, 
                'topics': topics, 
                'room_count': room_count, 
@@ -95,7 +104,7 @@ def home(request):
     return render(request, 'base/home.html', context)
 
 def room(request, pk):
-    room = Room.objects.get(id=pk)
+    room = get_object_or_404(Room, id=pk)
     roomMessages = room.message_set.all().order_by('-created')[:10]
     participants = room.participants.all()
     # message_set -> modelname_set is to access children 
@@ -108,8 +117,18 @@ def room(request, pk):
         )
         room.participants.add(request.user)
         # So that they are dynamically added once they comment
+        # unread counters are best effort: the page works without Redis
+        try:
+            message_posted(sync_redis(), room.id, request.user.id)
+        except RedisError:
+            logger.warning("could not bump the unread counter for room %s", room.id)
         return redirect('room', pk=room.id)
         # To avoid POST from messing up functionality redirect fully reloads
+    if request.user.is_authenticated:
+        try:
+            mark_read(sync_redis(), request.user.id, room.id)
+        except RedisError:
+            logger.warning("could not mark room %s read for user %s", room.id, request.user.id)
     context = {'room': room, 
                'roomMessages': roomMessages, 
                'participants': participants,
@@ -122,7 +141,6 @@ def room(request, pk):
 @login_required(login_url='login')
 def createRoom(request):
     form = RoomForm();
-    topics = Topic.objects.all();
     if request.method == 'POST':
         topic_name = request.POST.get('topic')
         topic, created = Topic.objects.get_or_create(name=topic_name)
@@ -134,14 +152,14 @@ def createRoom(request):
         )
         return redirect('home')
         # ModelForm helps to handle all the saving
-    context = {'form': form, 'topics': topics}
+    # topic datalist is filled client-side from /api/topics/suggest
+    context = {'form': form}
     return render(request, 'base/room_form.html', context)
 
 @login_required(login_url='login')
 def updateRoom(request, pk):
     # pk is like the params.id
-    room = Room.objects.get(id=pk)
-    topics = Topic.objects.all();
+    room = get_object_or_404(Room, id=pk)
     form = RoomForm(instance=room)
     # To pass in initial room values
 
@@ -151,29 +169,35 @@ def updateRoom(request, pk):
     if request.method == 'POST':
         topic_name = request.POST.get('topic')
         topic, created = Topic.objects.get_or_create(name=topic_name)
+        old_topic_id = room.topic_id
         room.name = request.POST.get('name')
         room.topic = topic
         room.description = request.POST.get('description')
         room.save()
+        topic_index.move(old_topic_id, room.topic_id)
         return redirect('home')
-    context = {'form': form, 'topics': topics, "room": room}
+    context = {'form': form, "room": room}
     return render(request, 'base/room_form.html', context)
 
 @login_required(login_url='login')
 def deleteRoom(request, pk):
-    room = Room.objects.get(id=pk)
+    room = get_object_or_404(Room, id=pk)
 
     if request.user != room.host:
         return HttpResponseForbidden("You are not allowed here!")
     
     if request.method == 'POST':
-        room.delete()
+        # hidden now, messages removed in the background (base/deletion.py)
+        queue_room_deletion(room, requested_by=request.user)
+        messages.info(request, f'"{room.name}" was deleted.')
         return redirect('home')
     return render(request, 'base/delete.html', {'obj':room})
 
 @login_required(login_url='login')
 def deleteMessage(request, pk):
-    message = Message.objects.get(id=pk)
+    message = Message.objects.filter(id=pk).first() if pk.isdigit() else None
+    if message is None:
+        return deleteArchivedMessage(request, pk)
 
     if request.user != message.user:
         return HttpResponseForbidden("You are not allowed here!")
@@ -183,13 +207,39 @@ def deleteMessage(request, pk):
         return redirect('home')
     return render(request, 'base/delete.html', {'obj': message})
 
+def deleteArchivedMessage(request, pk):
+    # old messages live in compressed MessageArchive chunks (base/archive.py)
+    chunk, row = find_archived(int(pk)) if pk.isdigit() else (None, None)
+    if chunk is None:
+        raise Http404("No such message.")
+
+    if request.user.id != row['user']:
+        return HttpResponseForbidden("You are not allowed here!")
+
+    if request.method == 'POST':
+        delete_archived(chunk, row['id'])
+        return redirect('home')
+    return render(request, 'base/delete.html', {'obj': row['body'][0:50]})
+
 @login_required(login_url='login')
 def userProfile(request, pk):
-    user = User.objects.get(id=pk)
-    rooms = user.room_set.all()
-    room_messages = user.message_set.all()
-    topics = Topic.objects.all()
-    context = {'user': user, 'rooms': rooms, "topics": topics, "room_messages": room_messages}
+    # first page only, with every FK the components touch loaded up front;
+    # "load more" pages come from the cursor-paginated /api/users/<pk>/... endpoints
+    user = get_object_or_404(User.objects.select_related('profile'), id=pk, is_active=True)
+    rooms, rooms_next = NewestFirstCursorPagination().page_for_template(
+        request,
+        user.room_set.select_related('host__profile', 'topic')
+            .annotate(participant_count=Count('participants')),
+        reverse('api-user-rooms', args=[user.id]),
+    )
+    room_messages, messages_next = NewestFirstCursorPagination().page_for_template(
+        request,
+        user.message_set.in_live_rooms().select_related('user__profile', 'room'),
+        reverse('api-user-messages', args=[user.id]),
+    )
+    topics = Topic.objects.with_room_count()[:5]
+    context = {'user': user, 'rooms': rooms, "topics": topics, "room_messages": room_messages,
+               'rooms_next': rooms_next, 'messages_next': messages_next}
     return render(request, 'base/profile.html', context)
     
 def topicsPage(request): 
@@ -199,14 +249,14 @@ def topicsPage(request):
     return render(request, 'base/topics.html', context)
 
 def activityPage(request):
-    room_messages = Message.objects.all().order_by('-created')[:4]
+    room_messages = Message.objects.in_live_rooms().order_by('-created')[:4]
     context = {'room_messages': room_messages}
     return render(request, 'base/activity.html', context)
 
 @login_required(login_url='login')
 def updateUser(request):
     user = request.user
-    profile = user.profile
+    profile = Profile.objects.for_user(user)
 
     if request.method == "POST":
         user_form = UserForm(request.POST, instance=user)
@@ -225,7 +275,8 @@ def updateUser(request):
         "profile_form": profile_form
     })
 
-def room_messages_json(request, pk):
+@async_api_view
+async def room_messages_json(request, pk):
     try:
         offset = int(request.GET.get("offset", 0))
         limit = int(request.GET.get("limit", 10))
@@ -233,30 +284,12 @@ def room_messages_json(request, pk):
     except ValueError:
         offset, limit = 0, 10
 
-    qs = (Message.objects
-          .filter(room_id=pk)
-          .select_related("user__profile")
-          .order_by("-created"))
-
-    total = qs.count()
-    items = list(qs[offset:offset+limit])
-
-    data = []
-    for m in items:
-        img = getattr(getattr(m.user, "profile", None), "profile_img", None)
-        data.append({
-            "id": m.id,
-            "user": m.user_id,
-            "username": m.user.username,
-            "body": m.body,
-            "created": m.created.isoformat(),
-            "profile_img": (img.url if img else None),
-        })
-
-    return JsonResponse({
+    data, total = await room_history(pk, offset, limit)
+
+    return {
         "messages": data,
         "total": total,
         "offset": offset,
         "limit": limit,
-        "has_more": (offset + len(items) < total),
-    })
\ No newline at end of file
+        "has_more": (offset + len(data) < total),
+    }
@@ -17,11 +17,13 @@ from channels.auth import AuthMiddlewareStack
 django_asgi_app = get_asgi_application()
 
 import base.routing
+from studybud.static import ASGIStaticFiles
 
 
 
 application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+    # static files are served ahead of the middleware chain (see studybud/static.py)
+    "http": ASGIStaticFiles(django_asgi_app),
     "websocket": AuthMiddlewareStack(
         URLRouter(base.routing.websocket_urlpatterns)
     ),
@@ -0,0 +1,54 @@
+"""
+Bounded PostgreSQL connection pooling.
+
+Django's persistent connections (``CONN_MAX_AGE``) are tied to the thread that
+opened them, which under ASGI means every ``database_sync_to_async`` executor
+thread keeps its own connection. A psycopg pool is shared by all threads of a
+worker process instead, so the number of server connections is capped at
+``DB_POOL_MAX_SIZE`` per process regardless of WebSocket load.
+"""
+
+import os
+
+POSTGRES_ENGINES = ("django.db.backends.postgresql",)
+
+
+def pool_options():
+    min_size = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    # overflow connections are opened on demand above min_size and reaped when idle
+    overflow = int(os.getenv("DB_POOL_OVERFLOW", "8"))
+    return {
+        "min_size": min_size,
+        "max_size": min_size + overflow,
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        # no "check": Django passes its own, from CONN_HEALTH_CHECKS
+    }
+
+
+def configure_pool(db):
+    """Switch a DATABASES entry from persistent connections to a pool."""
+    if db.get("ENGINE") not in POSTGRES_ENGINES:
+        return db
+    db["CONN_MAX_AGE"] = 0  # required by Django when a pool is configured
+    db["CONN_HEALTH_CHECKS"] = True  # the pool checks connections before lending them
+    db.setdefault("OPTIONS", {})["pool"] = pool_options()
+    return db
+
+
+def pool_stats():
+    """
+    Saturation numbers for every pooled alias in this process, e.g.
+    {"default": {"pool_size": 4, "pool_available": 1, "requests_waiting": 0, ...}}
+    """
+    from django.db import connections
+
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            continue
+        data = pool.get_stats()
+        data["pool_max"] = pool.max_size
+        stats[alias] = data
+    return stats
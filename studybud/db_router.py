@@ -0,0 +1,139 @@
+"""
+Primary/replica database routing with read-your-writes stickiness.
+
+Reads go to the ``replica`` alias when one is configured, writes always go to
+``default``. A client that has just written is pinned to the primary for
+``REPLICA_PIN_SECONDS`` (tracked with a cookie) so it never reads stale data
+from a lagging replica. Within a request, reads that follow a write go to the
+primary too.
+
+Session saves and ``last_login`` bumps happen on nearly every authenticated
+request or login and don't change what the client reads back, so they
+neither pin the client nor move the request's reads.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY = "default"
+REPLICA = "replica"
+PIN_COOKIE = "db_pin"
+
+_force_primary = ContextVar("force_primary", default=False)
+_wrote = ContextVar("wrote", default=False)
+_untracked = ContextVar("untracked", default=False)
+
+# written on most requests; see the module docstring
+UNTRACKED_MODELS = {"sessions.Session"}
+
+
+def replica_enabled():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def use_primary():
+    """Send every query in this block (reads included) to the primary."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+@contextmanager
+def untracked_writes():
+    """Writes in this block don't pin the client to the primary."""
+    token = _untracked.set(True)
+    try:
+        yield
+    finally:
+        _untracked.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _force_primary.get() or _wrote.get() or not replica_enabled():
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if not _untracked.get() and model._meta.label not in UNTRACKED_MODELS:
+            _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data, so cross-alias relations are fine
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is populated by replication, never migrated directly
+        return db == PRIMARY
+
+
+class ReplicaPinningMiddleware:
+    """
+    Must sit above SessionMiddleware so session reads honour the pin.
+
+    Unsafe methods and clients holding a fresh pin cookie read from the
+    primary. Any request that wrote refreshes the pin.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_enabled():
+            return self.get_response(request)
+
+        tokens = self._enter(request)
+        try:
+            return self._finish(self.get_response(request))
+        finally:
+            self._exit(tokens)
+
+    async def __acall__(self, request):
+        if not replica_enabled():
+            return await self.get_response(request)
+
+        tokens = self._enter(request)
+        try:
+            return self._finish(await self.get_response(request))
+        finally:
+            self._exit(tokens)
+
+    def _enter(self, request):
+        pinned = request.method not in self.SAFE_METHODS or self._has_pin(request)
+        return _force_primary.set(pinned), _wrote.set(False)
+
+    def _exit(self, tokens):
+        force_token, wrote_token = tokens
+        _wrote.reset(wrote_token)
+        _force_primary.reset(force_token)
+
+    def _finish(self, response):
+        if _wrote.get():
+            pin_for = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + pin_for)),
+                max_age=pin_for, httponly=True, samesite="Lax",
+            )
+        return response
+
+    def _has_pin(self, request):
+        try:
+            return int(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,113 @@
+"""
+Liveness and readiness probes for the load balancer.
+
+``/livez`` only proves the process can serve a request. ``/readyz`` checks the
+database, every Redis shard (channel layer and presence) and REDIS_URL, each
+with a timeout. It also reports how loaded this worker is, and returns 503
+when a dependency is down or the worker is over its limits, so the balancer
+stops routing to it.
+Readiness results are cached for ``READY_CACHE_TTL`` seconds, so frequent
+probes never put extra load on the dependencies.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import redis
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from base import metrics
+
+# one long-lived thread keeps its DB connection between checks
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readyz-db")
+_lock = threading.Lock()
+_cached = {"at": 0.0, "checks": None}
+
+
+def _check_db():
+    def ping():
+        with connections["default"].cursor() as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+    _db_executor.submit(ping).result(timeout=settings.READY_CHECK_TIMEOUT)
+
+
+def _check_redis(url):
+    client = redis.Redis.from_url(
+        url,
+        socket_timeout=settings.READY_CHECK_TIMEOUT,
+        socket_connect_timeout=settings.READY_CHECK_TIMEOUT,
+    )
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+
+def _channel_layer_urls():
+    hosts = settings.CHANNEL_LAYERS["default"]["CONFIG"]["hosts"]
+    return [h if isinstance(h, str) else h["address"] for h in hosts]
+
+
+def _run(name, fn, *args):
+    started = time.perf_counter()
+    try:
+        fn(*args)
+        ok, error = True, None
+    except TimeoutError:
+        ok, error = False, "timeout"
+    except Exception as exc:
+        ok, error = False, f"{type(exc).__name__}: {exc}"
+    result = {"ok": ok, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    if error:
+        result["error"] = error
+    return name, result
+
+
+def dependency_checks():
+    now = time.monotonic()
+    if _cached["checks"] is not None and now - _cached["at"] < settings.READY_CACHE_TTL:
+        return _cached["checks"]
+    # one probe refreshes, concurrent probes reuse whatever is cached
+    if not _lock.acquire(blocking=_cached["checks"] is None):
+        return _cached["checks"]
+    try:
+        checks = dict([_run("database", _check_db)])
+        # shards carry the channel layer and presence; REDIS_URL the rest
+        for i, url in enumerate(_channel_layer_urls()):
+            checks.update([_run(f"redis_shard_{i}", _check_redis, url)])
+        checks.update([_run("redis", _check_redis, settings.REDIS_URL)])
+        _cached["checks"], _cached["at"] = checks, time.monotonic()
+        return checks
+    finally:
+        _lock.release()
+
+
+def worker_load():
+    inflight = metrics.http_inflight.value()
+    sockets = metrics.ws_open.value()
+    return {
+        "http_inflight": inflight,
+        "websockets_open": sockets,
+        "saturated": (
+            inflight >= settings.READY_MAX_INFLIGHT
+            or sockets >= settings.READY_MAX_WEBSOCKETS
+        ),
+    }
+
+
+def liveness(request):
+    return JsonResponse({"status": "ok"})
+
+
+def readiness(request):
+    checks = dependency_checks()
+    load = worker_load()
+    ready = all(c["ok"] for c in checks.values()) and not load["saturated"]
+    return JsonResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks, "load": load},
+        status=200 if ready else 503,
+    )
@@ -15,6 +15,7 @@ import dj_database_url
 from pathlib import Path
 from dotenv import load_dotenv
 from urllib.parse import urlparse
+from .db_pool import configure_pool
 
 load_dotenv()
 
@@ -55,13 +56,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    'base.compression.CompressionMiddleware',
+    'studybud.db_router.ReplicaPinningMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'base.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,11 +101,28 @@ DATABASES = {
     )
 }
 
+# Optional read replica, e.g. DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 locally.
+# Safe reads are routed there; writers stay pinned to the primary for a short window.
+if os.getenv("DATABASE_REPLICA_URL"):
+    DATABASES["replica"] = dj_database_url.config(
+        env="DATABASE_REPLICA_URL",
+        conn_max_age=600,
+    )
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+# Bounded per-process pool on PostgreSQL (shared by request threads, async views
+# and the consumer's database_sync_to_async helpers). Set DB_POOL=False to opt out.
+if os.getenv("DB_POOL", "True") == "True":
+    for db in DATABASES.values():
+        configure_pool(db)
+
+DATABASE_ROUTERS = ["studybud.db_router.PrimaryReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'base.api.renderers.FastJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
@@ -110,6 +131,20 @@ REST_FRAMEWORK = {
 }
 
 
+# Sessions are written through to the DB but read from the shared cache, and
+# auth user objects are cached too, so WebSocket connects skip the DB
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL", os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")),
+        "KEY_PREFIX": "cache",
+    }
+}
+SESSION_ENGINE = "base.sessions"
+AUTHENTICATION_BACKENDS = ["base.auth_backends.CachedModelBackend"]
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -179,14 +214,89 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Rooms one multiplexed socket (ws/rooms/) may subscribe to at once
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "50"))
+
+# Seconds a chat client_msg_id is remembered, so resent frames are not saved twice
+CHAT_DEDUPE_WINDOW = int(os.getenv("CHAT_DEDUPE_WINDOW", "600"))
+# Seconds a claim may stay "pending" before a retry is saved anyway, in case
+# the worker saving the first copy died
+CHAT_DEDUPE_PENDING_TTL = int(os.getenv("CHAT_DEDUPE_PENDING_TTL", "30"))
+
+# Seconds room-list online counts are shared from the cache
+PRESENCE_COUNT_CACHE_TTL = int(os.getenv("PRESENCE_COUNT_CACHE_TTL", "5"))
+
+# Rooms with at least this many present users switch new sockets to tiered
+# fan-out (one delivery per worker, then in-memory); 0 disables it
+FANOUT_TIERED_THRESHOLD = int(os.getenv("FANOUT_TIERED_THRESHOLD", "500"))
+
+# Chat path tracing: fraction of chat messages traced (tunable live with
+# `manage.py trace_sampling`) and the JSON-lines file spans are appended to
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", str(BASE_DIR / "traces.jsonl"))
+
+# Sampling profiler: superusers arm it per request (X-Profile header or
+# ?__profile=1); PROFILE_SAMPLE_RATE profiles a random slice of all traffic
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(BASE_DIR / "profiles"))
+
+# Messages older than this are moved to compressed archive chunks by
+# `manage.py archive_messages`; history endpoints read through to them
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "365"))
+MESSAGE_ARCHIVE_CHUNK_SIZE = int(os.getenv("MESSAGE_ARCHIVE_CHUNK_SIZE", "1000"))
+
+# Background deletion (manage.py run_deletions): rows per transaction, pause
+# between chunks, and how long a "running" job may go without progress before
+# another worker takes it over
+DELETION_CHUNK_SIZE = int(os.getenv("DELETION_CHUNK_SIZE", "1000"))
+DELETION_PAUSE = float(os.getenv("DELETION_PAUSE", "0.05"))
+DELETION_STALE_AFTER = int(os.getenv("DELETION_STALE_AFTER", "300"))
+
+# Room change feed (/api/rooms/<pk>/changes) holds back rows younger than this,
+# so a cursor never jumps past a transaction that has not committed yet
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "2"))
+
+# Activity rollups (manage.py update_rollups): changes folded per pass, and
+# how long hourly buckets are kept (daily ones are kept for good)
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "14"))
+
+# Bulk import API (/api/import/...): rows and bytes per request (whichever is
+# hit first; uploads bypass DATA_UPLOAD_MAX_MEMORY_SIZE), rows per INSERT, and
+# password hashing threads (0 = one per CPU). User rows with passwords are also
+# bounded by the worker timeout, see base/bulk_import.py
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "50000"))
+BULK_IMPORT_MAX_BYTES = int(os.getenv("BULK_IMPORT_MAX_BYTES", str(32 * 1024 * 1024)))
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "1000"))
+BULK_IMPORT_HASH_WORKERS = int(os.getenv("BULK_IMPORT_HASH_WORKERS", "0"))
+
+# Readiness probe: per-dependency timeout, result cache and load-shedding limits
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "1.0"))
+READY_CACHE_TTL = float(os.getenv("READY_CACHE_TTL", "3"))
+READY_MAX_INFLIGHT = int(os.getenv("READY_MAX_INFLIGHT", "64"))
+READY_MAX_WEBSOCKETS = int(os.getenv("READY_MAX_WEBSOCKETS", "5000"))
+
+# Dynamic response compression (brotli when installed and accepted, else gzip)
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Clients allowed to scrape /metrics
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
 parsed = urlparse(REDIS_URL)
 
+# Comma-separated Redis nodes that rooms are consistently hashed over (channel
+# groups and presence keys); see base/sharding.py before changing the list
+REDIS_SHARD_URLS = [u.strip() for u in os.getenv("REDIS_SHARD_URLS", REDIS_URL).split(",") if u.strip()]
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "base.sharding.ShardedChannelLayer",
         "CONFIG": {
-            "hosts": [REDIS_URL],
+            "hosts": REDIS_SHARD_URLS,
             # Enable SSL when using rediss://
             # "connection_kwargs": {"ssl": True} if parsed.scheme == "reddis" else {},
         },
@@ -0,0 +1,51 @@
+"""
+Static files, served in front of Django instead of from its middleware.
+
+WhiteNoiseMiddleware is sync-only. Under ASGI, Django would wrap it, and so
+every request, in the one thread shared by all sync code, which defeats the
+async views. These handlers answer ``STATIC_URL`` requests with WhiteNoise's
+file table and headers before the middleware chain runs (the async one in a
+worker thread) and pass everything else straight to the app.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler, StaticFilesHandler
+from django.core.handlers.exception import response_for_exception
+from django.http import Http404
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+def _not_found(request):
+    raise Http404("No such static file.")
+
+
+class _WhiteNoiseServe:
+    def __init__(self, application):
+        super().__init__(application)
+        self.whitenoise = WhiteNoiseMiddleware(_not_found)
+
+    def serve(self, request):
+        return self.whitenoise(request)
+
+
+class WSGIStaticFiles(_WhiteNoiseServe, StaticFilesHandler):
+    pass
+
+
+class ASGIStaticFiles(_WhiteNoiseServe, ASGIStaticFilesHandler):
+    async def get_response_async(self, request):
+        # never on the shared sync thread: not the lookup, not the file read
+        try:
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request)
+        except Http404 as e:
+            response = await sync_to_async(response_for_exception, thread_sensitive=False)(request, e)
+        response._resource_closers.append(request.close)
+        if response.streaming and not response.is_async:
+            chunks = response.streaming_content
+
+            async def read():
+                for part in await sync_to_async(list, thread_sensitive=False)(chunks):
+                    yield part
+
+            response.streaming_content = read()
+        return response
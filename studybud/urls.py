@@ -17,7 +17,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from base import metrics
+from . import health as probes
 
 def health(request):
     html = """
@@ -79,9 +82,18 @@ def health(request):
     """
     return HttpResponse(html)
 
+def metrics_view(request):
+    # scraped from inside the host/cluster only, never exposed publicly
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('base.urls')),
     path('api/', include('base.api.urls')),
-    path("healthz/", health, name="healthz")
+    path("healthz/", health, name="healthz"),
+    path("livez", probes.liveness, name="livez"),
+    path("readyz", probes.readiness, name="readyz"),
+    path("metrics", metrics_view, name="metrics"),
 ]
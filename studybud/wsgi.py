@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'studybud.settings')
 
-application = get_wsgi_application()
+from studybud.static import WSGIStaticFiles
+
+# static files are served ahead of the middleware chain (see studybud/static.py)
+application = WSGIStaticFiles(get_wsgi_application())